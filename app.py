@@ -1,8 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from models.players import Player
 from models.game import Game
-import os
+from models.autosave import AutoSaver
+from models.deadlines import POLICIES, TimerWheel
+from models.similarity import SimilarityIndex
+from models.storage import default_storage
+
+# Above this number of players the voting screen switches to a virtualized Treeview
+VIRTUALIZED_TABLE_SIZE = 12
 
 
 class PlanningPokerApp:
@@ -11,15 +16,24 @@ class PlanningPokerApp:
         self.root.title("Planning Poker")
         self.root.geometry("800x600")
 
-        # Ensure the save directory exists
-        os.makedirs("data", exist_ok=True)
-
         # Style
         self.style = ttk.Style()
         self.style.configure("TButton", font=("Arial", 16), padding=15)
         self.style.configure("TLabel", font=("Arial", 20))
 
         self.game = None
+        self.store = default_storage()  # Backlog, game state and final report
+        self.autosaver = AutoSaver()  # Saves are written off the Tk mainloop
+        self.deadlines = TimerWheel()  # Vote deadlines, advanced by the Tk mainloop
+        similarity = self.store.data_dir("similarity")
+        # Past estimates suggested while voting, kept with the storage
+        self.similar_tasks = SimilarityIndex(similarity) if similarity is not None else None
+        self.timer_label = None
+        self.auto_submitted = False
+        self.voting_players = None
+        self.vote_inputs = []
+        self.vote_tree = None
+        self.report_tree = None
 
         # Frames
         self.main_menu_frame = tk.Frame(root, bg="#8699c2")
@@ -30,6 +44,7 @@ class PlanningPokerApp:
         # Main menu
         self.initialize_main_menu()
         self.switch_frame(self.main_menu_frame)
+        self.root.after(200, self.tick_deadlines)
     
 
     def initialize_main_menu(self):
@@ -37,7 +52,12 @@ class PlanningPokerApp:
         tk.Label(self.main_menu_frame, text="Bienvenue à Poker Planning", font=("Arial", 30, "bold"), bg="#a81125").pack(pady=20)
         ttk.Button(self.main_menu_frame, text="Nouvelle Partie", command=self.new_game).pack(pady=15)
         ttk.Button(self.main_menu_frame, text="Charger Partie", command=self.load_game).pack(pady=15)
-        ttk.Button(self.main_menu_frame, text="Quitter", command=self.root.quit).pack(pady=15)
+        ttk.Button(self.main_menu_frame, text="Quitter", command=self.quit).pack(pady=15)
+
+    def quit(self):
+        self.autosaver.close()
+        self.store.close()
+        self.root.quit()
 
     def switch_frame(self, frame):
         for widget in self.root.winfo_children():
@@ -65,6 +85,12 @@ class PlanningPokerApp:
         rules_var = tk.StringVar()
         ttk.Entry(self.setup_frame, textvariable=rules_var).pack(pady=20)
 
+        tk.Label(self.setup_frame, text=f"Temps de vote en secondes (0 = illimité), puis règle à l'expiration ({', '.join(POLICIES)}):", font=("Arial", 12), bg="#456499").pack(pady=10)
+        timeout_var = tk.IntVar()
+        ttk.Entry(self.setup_frame, textvariable=timeout_var).pack(pady=5)
+        policy_var = tk.StringVar(value="joker")
+        ttk.Entry(self.setup_frame, textvariable=policy_var).pack(pady=5)
+
         def setup_players():
             num_players = num_players_var.get()
             rules = rules_var.get()
@@ -75,7 +101,15 @@ class PlanningPokerApp:
                 self.show_popup("Error", "Règle Invalide! Entrer une règle valide.")
                 return
 
-            self.game = Game(num_players=num_players, rules=rules)
+            if timeout_var.get() < 0 or policy_var.get() not in POLICIES:
+                self.show_popup("Error", "Temps de vote ou règle d'expiration invalide.")
+                return
+
+            self.game = Game(num_players=num_players, rules=rules, store=self.store)
+            self.game.autosaver = self.autosaver
+            self.game.similar_tasks = self.similar_tasks
+            if timeout_var.get():
+                self.game.set_vote_deadline(timeout_var.get(), policy_var.get(), self.deadlines)
             self.collect_player_pseudonyms(num_players)
 
         ttk.Button(self.setup_frame, text="Suivant", command=setup_players).pack(pady=20)
@@ -102,14 +136,16 @@ class PlanningPokerApp:
             if not pseudo:
                 self.show_popup("Error", "Pseudonym ne peut pas être vide.")
                 return
-            self.game.players.append(Player(pseudo))
+            self.game.add_player(pseudo)
+        self.game.bind_players()
 
         self.start_voting()
 
     def load_game(self):
         try:
-            self.game = Game(num_players=0)
-            self.game.load_game_state("data/game_state.json")
+            self.game = Game.from_store(self.store)
+            self.game.autosaver = self.autosaver
+            self.game.similar_tasks = self.similar_tasks
             self.start_voting()
         except FileNotFoundError:
             self.show_popup("Error", "Aucune sauvegarde trouvée.")
@@ -118,56 +154,130 @@ class PlanningPokerApp:
 
     def start_voting(self):
         self.switch_frame(self.voting_frame)
-        for widget in self.voting_frame.winfo_children():
-            widget.destroy()
 
-        if not self.game.current_feature:
-            self.game.current_feature = self.game.backlog[0]
+        if not self.game.current_feature and self.game.next_feature() is None:
+            self.display_final_report()
+            return
+
+        # The player rows are built once per table and only updated between rounds
+        if self.voting_players is not self.game.players or len(self.vote_inputs) != len(self.game.players):
+            self.build_voting_screen()
 
         current_feature = self.game.current_feature
-        tk.Label(self.voting_frame, text=f"Tache actuelle : {current_feature['description']}", 
-                 font=("Arial", 18, "bold"), bg="#456499").pack(pady=20)
-
-        self.vote_inputs = {}
-        for player in self.game.players:
-            frame = tk.Frame(self.voting_frame, bg="#456499")
-            frame.pack(pady=10)
-            tk.Label(frame, text=f"Le vote de {player.pseudo}: ", bg="#f0f0f0").pack(side="left")
-            tk.Label(frame, text=f"Carte Disponible: {', '.join(player.cards)}",  bg="#f0f0f0").pack(pady=5)
-            var = tk.StringVar()
-            self.vote_inputs[player.pseudo] = var
-            ttk.Entry(frame, textvariable=var).pack(side="left")
+        self.feature_label.config(text=f"Tache actuelle : {current_feature['description']}")
+        suggestions = self.game.suggestions(current_feature)
+        self.suggestion_label.config(text="\n".join(
+            f"Tache similaire : {suggestion['description']} ({suggestion['difficulty']:g})" for suggestion in suggestions))
+        for var in self.vote_inputs:
+            var.set("")
+        self.auto_submitted = False
+        self.game.arm_deadlines()
+        if self.vote_tree is not None:
+            for seat in range(len(self.game.players)):
+                self.vote_tree.set(seat, "vote", "")
+            self.vote_tree.selection_set(0)
+            self.vote_tree.focus(0)
+            self.vote_tree.see(0)
+
+    def build_voting_screen(self):
+        for widget in self.voting_frame.winfo_children():
+            widget.destroy()
+        self.voting_players = self.game.players
+        self.vote_tree = None
+
+        self.feature_label = tk.Label(self.voting_frame, font=("Arial", 18, "bold"), bg="#456499")
+        self.feature_label.pack(pady=20)
+        self.timer_label = tk.Label(self.voting_frame, font=("Arial", 14), bg="#456499")
+        self.timer_label.pack()
+        self.suggestion_label = tk.Label(self.voting_frame, font=("Arial", 12), bg="#456499")
+        self.suggestion_label.pack()
+        cards = ', '.join(self.game.deck.cards)
+
+        self.vote_inputs = [tk.StringVar() for _ in self.game.players]
+        if len(self.game.players) <= VIRTUALIZED_TABLE_SIZE:
+            for player, var in zip(self.game.players, self.vote_inputs):
+                frame = tk.Frame(self.voting_frame, bg="#456499")
+                frame.pack(pady=10)
+                tk.Label(frame, text=f"Le vote de {player.pseudo}: ", bg="#f0f0f0").pack(side="left")
+                tk.Label(frame, text=f"Carte Disponible: {cards}",  bg="#f0f0f0").pack(pady=5)
+                ttk.Entry(frame, textvariable=var).pack(side="left")
+        else:
+            # Large tables: a Treeview only draws the visible rows; the selected
+            # player's card is typed in a single entry
+            tk.Label(self.voting_frame, text=f"Carte Disponible: {cards}", bg="#f0f0f0").pack(pady=5)
+            self.vote_tree = self.scrolled_tree(self.voting_frame, ("player", "vote"), ("Joueur", "Vote"), height=12)
+            for seat, player in enumerate(self.game.players):
+                self.vote_tree.insert("", "end", iid=seat, values=(player.pseudo, ""))
+            entry_frame = tk.Frame(self.voting_frame, bg="#456499")
+            entry_frame.pack(pady=10)
+            card_var = tk.StringVar()
+            entry = ttk.Entry(entry_frame, textvariable=card_var)
+            entry.pack(side="left")
+
+            def record_card(event=None):
+                for iid in self.vote_tree.selection():
+                    self.vote_inputs[int(iid)].set(card_var.get())
+                    self.vote_tree.set(iid, "vote", card_var.get())
+                card_var.set("")
+                following = self.vote_tree.next(self.vote_tree.focus())
+                if following:
+                    self.vote_tree.selection_set(following)
+                    self.vote_tree.focus(following)
+                    self.vote_tree.see(following)
+
+            entry.bind("<Return>", record_card)
+            ttk.Button(entry_frame, text="Enregistrer", command=record_card).pack(side="left")
 
         ttk.Button(self.voting_frame, text="Valider Vote", command=self.submit_votes).pack(pady=30)
 
+    def scrolled_tree(self, parent, columns, headings, height):
+        frame = tk.Frame(parent)
+        frame.pack(fill="both", expand=True, padx=20)
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=height)
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+        scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side="left", fill="both", expand=True)
+        scrollbar.pack(side="right", fill="y")
+        return tree
+
+    def tick_deadlines(self):
+        """Advance the vote deadlines, show the time left and close the round once it is over."""
+        self.deadlines.advance()
+        if self.game is not None and self.timer_label is not None and self.game.vote_timeout:
+            remaining = self.game.remaining_time()
+            self.timer_label.config(text="" if remaining is None else f"Temps restant : {remaining:.0f}s")
+            if (remaining is None and self.game.timed_out and not self.auto_submitted
+                    and self.voting_frame.winfo_ismapped()):
+                # Time is up: the cards typed so far are submitted, the others follow the timeout policy
+                self.auto_submitted = True
+                self.submit_votes()
+        self.root.after(200, self.tick_deadlines)
+
     def submit_votes(self):
         try:
-            for player in self.game.players:
-                vote = self.vote_inputs[player.pseudo].get()
+            for player, var in zip(self.game.players, self.vote_inputs):
+                vote = var.get()
+                if not vote and player in self.game.timed_out:
+                    continue
                 try:
-                    player.vote(vote)
+                    self.game.cast_vote(player, vote)
                 except ValueError as e:
                     self.show_popup("Error", str(e))
                     return
 
-            if self.game.process_votes():
+            validated = self.game.process_votes()
+            self.game.save_game_state()
+            if validated:
                 self.show_popup("Succès", f"Tache Actuelle:  '{self.game.current_feature['description']}' validée!")
                 
                 # Move to the next feature without removing from backlog
-                current_index = self.game.backlog.index(self.game.current_feature)
-                self.game.backlog[current_index]["validated"] = True
-
-                # Check if there are more tasks
-                if any(not task.get("validated", False) for task in self.game.backlog):
-                    # Find the next unvalidated feature
-                    for feature in self.game.backlog:
-                        if not feature.get("validated", False):
-                            self.game.current_feature = feature
-                            break
+                if self.game.next_feature() is not None:
                     self.start_voting()
                 else:
                     # All tasks are validated, save the final report
-                    self.game.save_final_report("data/final_report.json")
+                    self.game.save_final_report()
                     self.display_final_report()
             else:
                 self.show_popup("Info", f"Tache Actuelle: '{self.game.current_feature['description']}' non validé. Veuillez refaire le vote...")
@@ -179,14 +289,35 @@ class PlanningPokerApp:
     def display_final_report(self):
         self.switch_frame(self.results_frame)
 
-        tk.Label(self.results_frame, text=" Rapport Final", font=("Arial", 20, "bold"), bg="#a81125").pack(pady=30)
-
+        if self.report_tree is None:
+            tk.Label(self.results_frame, text=" Rapport Final", font=("Arial", 20, "bold"), bg="#a81125").pack(pady=30)
+            self.report_summary = tk.Label(self.results_frame, font=("Arial", 16), bg="#f0f0f0")
+            self.report_summary.pack(pady=10)
+            self.report_tree = self.scrolled_tree(self.results_frame, ("description", "difficulty", "status"),
+                                                  ("Tache", "Difficulté", "Status"), height=15)
+            self.report_tree.column("description", width=450)
+            ttk.Button(self.results_frame, text="Retour Menu Principal", command=lambda: self.switch_frame(self.main_menu_frame)).pack(pady=20)
+
+        # Reuse the same view: drop the rows of a previous report
+        self.report_tree.delete(*self.report_tree.get_children())
         for feature in self.game.backlog:
             status = "Validated" if feature.get("validated", False) else "Not Validated"
-            tk.Label(self.results_frame, text=f"Tache Actuelle: {feature['description']}, Status: {status}", font=("Arial", 16) , bg="#f0f0f0").pack(pady=10)
-
-        ttk.Button(self.results_frame, text="Retour Menu Principal", command=lambda: self.switch_frame(self.main_menu_frame)).pack(pady=20)
-
+            difficulty = feature.get("difficulty")
+            self.report_tree.insert("", "end", values=(feature["description"], "" if difficulty is None else difficulty, status))
+        # The aggregates come from the summary computed while the report was written
+        if self.game.report_summary is None:
+            validated, total = self.game.progress()
+            self.report_summary.config(text=f"{validated}/{total} taches validées")
+            return
+        summary = self.game.report_summary.to_dict()
+        mean = summary["mean_difficulty"]
+        cards = ", ".join(f"{card}: {count}" for card, count in summary["by_card"].items())
+        self.report_summary.config(text=(
+            f"{summary['validated']}/{summary['features']} taches validées, "
+            f"difficulté totale {summary['total_difficulty']}"
+            + ("" if mean is None else f", moyenne {mean:.1f}")
+            + ("" if summary["mean_rounds"] is None else f", {summary['mean_rounds']:.1f} tours en moyenne")
+            + (f"\nCartes : {cards}" if cards else "")))
 
 if __name__ == "__main__":
     root = tk.Tk()
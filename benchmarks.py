@@ -0,0 +1,269 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from models.aggregation import JOKER, RULES, histogram, verdict
+from models.deck import FIBONACCI
+from models.game import Game
+from models.instrumentation import Metrics, sink_for_path
+from models.simulation import STRATEGIES, simulate_game
+from models.storage import JsonFileStorage, MemoryStorage
+
+## @file benchmarks.py
+#  @brief Benchmark suite for the game core, built on the headless simulation engine.
+#
+#  For every combination of players x features x rules it reports features
+#  and votes per second, save/load latency of the JSON and binary formats
+#  and peak memory (tracemalloc), e.g.:
+#      python benchmarks.py --players 5,50 --features 100,1000 --rules strict,median
+#  With --startup it measures cold start instead: import time of the core
+#  and of the CLI/GUI entry points, and per-session Game creation. With
+#  --metrics out.json (or out.prom) the instrumented games also dump their
+#  counters and timers. With --cluster 1,2,4 it measures the vote throughput
+#  of the multi-process cluster (cluster.py) for each number of workers.
+#  With --sketch 10000,100000 it compares the approximate aggregation of
+#  models.sketches (votes split over shards, partial sketches merged) with
+#  the exact rules for audiences of that size. With --ingest it measures
+#  the bulk ingestion of recorded vote events (models.ingest).
+
+
+def benchmark_game(num_players, num_features, rules, strategy="converging", seed=0, metrics=None):
+    """@brief Measure one simulated game and the save/load of its final state.
+    @param metrics Optional models.instrumentation.Metrics the game reports to.
+    @return A dict of measurements.
+    """
+    game = None
+    if metrics is not None:
+        with contextlib.redirect_stdout(None):
+            game = Game(num_players=0, lazy=True)
+        game.metrics = metrics
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = simulate_game(num_players, num_features, rules, strategy, seed=seed, game=game)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    measures = {
+        "players": num_players,
+        "features": num_features,
+        "rules": rules,
+        "features_per_s": result.features / elapsed,
+        "votes_per_s": result.votes / elapsed,
+        "peak_mib": peak / 2 ** 20,
+    }
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(None):
+        for extension in ("json", "snap"):
+            path = os.path.join(directory, f"game_state.{extension}")
+            start = time.perf_counter()
+            result.game.save_game_state(path)
+            measures[f"save_{extension}_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            Game.from_state(path)
+            measures[f"load_{extension}_ms"] = (time.perf_counter() - start) * 1000
+    return measures
+
+
+def benchmark_cluster(workers, sessions=64, num_players=8, num_features=20):
+    """@brief Measure the vote throughput of a cluster of worker processes.
+    @param workers The number of worker processes.
+    @param sessions The number of sessions played concurrently.
+    @return A dict of measurements.
+    """
+    from cluster import ClusterCoordinator
+    pseudos = [f"player{seat + 1}" for seat in range(num_players)]
+    backlog = [{"description": f"Feature {index + 1}", "difficulty": None} for index in range(num_features)]
+    with tempfile.TemporaryDirectory() as directory:
+        coordinator = ClusterCoordinator(workers, directory)
+        try:
+            for session in range(sessions):
+                coordinator.submit({"op": "create", "session": session, "players": pseudos,
+                                    "backlog": backlog}).result()
+            start = time.perf_counter()
+            # Every session validates a feature per round: all the votes of a round are in flight at once
+            for _ in range(num_features):
+                futures = [coordinator.submit({"op": "vote", "session": session, "player": pseudo, "card": "5"})
+                           for session in range(sessions) for pseudo in pseudos]
+                for future in futures:
+                    future.result()
+            elapsed = time.perf_counter() - start
+        finally:
+            coordinator.close()
+    votes = sessions * num_players * num_features
+    return {"workers": workers, "sessions": sessions, "votes_per_s": votes / elapsed}
+
+
+def benchmark_sketches(audience, rules, shards=8, trials=20, k=200, capacity=64, seed=0):
+    """@brief Compare the sketch verdict of large polls with the exact verdict.
+    @details Each trial draws a poll of the given audience around a random true value
+    (deck cards, 5% of jokers, half of the trials with free estimates from 1 to 1000),
+    splits it over the shards, merges their sketches and applies the rules. The error
+    is measured the way the sketches bound it: in rank (share of the votes between the
+    exact and the approximate difficulty) for the median, in share of the votes of the
+    winning card for the majorities; strict and average are exact.
+    @param audience The number of votes of each poll.
+    @param rules The voting rule.
+    @return A dict of measurements: agreement of the verdicts and worst error in percent of the votes.
+    """
+    from models.sketches import VoteSketch, merge_sketches
+    cards = [value for value in (FIBONACCI.value(card) for card in FIBONACCI) if value is not None]
+    generator = random.Random(seed)
+    agree = 0
+    worst = 0.0
+    sketch_bytes = 0
+    elapsed = 0.0
+    for trial in range(trials):
+        free = trial % 2 == 1
+        center = generator.randrange(len(cards))
+        row = []
+        for _ in range(audience):
+            if generator.random() < 0.05:
+                row.append(JOKER)
+            elif free:
+                row.append(max(1, min(1000, int(generator.gauss(cards[center] * 10, 150)))))
+            else:
+                row.append(cards[max(0, min(len(cards) - 1, center + int(generator.gauss(0, 1.5))))])
+        counts = histogram(row)
+        numeric = sum(counts.values())
+        exact = verdict(counts, len(row), rules)
+        start = time.perf_counter()
+        partials = [VoteSketch(k, capacity, seed=shard).add_row(row[shard::shards]) for shard in range(shards)]
+        approximate = merge_sketches(partials).verdict(rules)
+        elapsed += time.perf_counter() - start
+        sketch_bytes += sum(len(json.dumps(partial.to_dict())) for partial in partials) / shards
+        agree += approximate[1] == exact[1]
+        if exact[0] is None or approximate[0] is None:
+            continue
+        if rules == "median":
+            low, high = sorted((exact[0], approximate[0]))
+            between = sum(count for value, count in counts.items() if low < value < high)
+            worst = max(worst, between / numeric)
+        elif rules in ("absolute_majority", "relative_majority"):
+            worst = max(worst, (counts[exact[0]] - counts.get(approximate[0], 0)) / numeric)
+    return {"audience": audience, "rules": rules, "shards": shards,
+            "agreement_pct": agree * 100 / trials,
+            "max_error_pct": worst * 100,
+            "votes_per_s": audience * trials / elapsed,
+            "sketch_kib": sketch_bytes / trials / 1024}
+
+
+def benchmark_ingest(num_players, num_features=2000, rules="median"):
+    """@brief Measure the bulk ingestion of recorded vote events (models.ingest).
+    @details One session; every player votes once on every feature, so each feature
+    is decided after num_players events.
+    @return A dict of measurements.
+    """
+    from models.ingest import VoteIngestor
+    store = MemoryStorage()
+    store.save_backlog([{"description": f"Feature {index + 1}", "difficulty": None} for index in range(num_features)])
+    generator = random.Random(0)
+    lines = [json.dumps({"session": "default", "feature": feature, "player": f"player{seat}",
+                         "card": generator.choice(("3", "5", "8")), "ts": 0.0}).encode() + b"\n"
+             for feature in range(1, num_features + 1) for seat in range(num_players)]
+    ingestor = VoteIngestor(store, rules, players=[f"player{seat}" for seat in range(num_players)])
+    start = time.perf_counter()
+    report = ingestor.ingest(lines)
+    elapsed = time.perf_counter() - start
+    return {"players": num_players, "features": num_features, "rules": rules, "events": len(lines),
+            "rejected": report.rejected, "events_per_s": len(lines) / elapsed}
+
+
+def benchmark_startup(repeat=200):
+    """@brief Measure cold start of the entry points and the cost of creating a Game.
+    @param repeat Number of games created for each construction mode.
+    @return A dict of measurements in milliseconds.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    measures = {}
+    for module in ("models.game", "main", "app"):
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        measures[f"import_{module}_ms"] = float(output.stdout.strip().splitlines()[-1]) * 1000
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(None):
+        state_path = os.path.join(directory, "game_state.json")
+        Game(num_players=8, lazy=True).save_game_state(state_path)
+        # Eager games save to the temporary directory, never to the data/ directory of the checkout
+        files = JsonFileStorage(directory)
+        memory = MemoryStorage()
+        constructors = {
+            "game_eager_ms": lambda: Game(num_players=8, store=files),
+            "game_eager_memory_ms": lambda: Game(num_players=8, store=memory),
+            "game_lazy_ms": lambda: Game(num_players=8, lazy=True),
+            "game_from_state_ms": lambda: Game.from_state(state_path),
+        }
+        for name, create in constructors.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                create()
+            measures[name] = (time.perf_counter() - start) * 1000 / repeat
+    return measures
+
+
+def run_benchmarks(players, features, rules, strategy="converging", metrics=None):
+    """@brief Run benchmark_game over the whole parameter grid.
+    @param metrics Optional models.instrumentation.Metrics shared by every game.
+    @return The list of measurement dicts.
+    """
+    return [benchmark_game(num_players, num_features, rule, strategy, metrics=metrics)
+            for num_players in players for num_features in features for rule in rules]
+
+
+def print_table(rows, columns=None):
+    """@brief Print the measurements as an aligned table.
+    @param columns The keys to print, the benchmark_game measurements by default.
+    """
+    columns = columns or ["players", "features", "rules", "features_per_s", "votes_per_s",
+                          "save_json_ms", "load_json_ms", "save_snap_ms", "load_snap_ms", "peak_mib"]
+    cells = [[f"{row[column]:.1f}" if isinstance(row[column], float) else str(row[column]) for column in columns]
+             for row in rows]
+    widths = [max(len(column), *(len(line[index]) for line in cells)) for index, column in enumerate(columns)]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planning Poker core benchmarks")
+    parser.add_argument("--players", type=_int_list, default=[5, 50])
+    parser.add_argument("--features", type=_int_list, default=[100, 1000])
+    parser.add_argument("--rules", default=",".join(RULES))
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="converging")
+    parser.add_argument("--startup", action="store_true", help="measure cold start and Game creation")
+    parser.add_argument("--metrics", help="dump the game metrics to this file (.json or .prom)")
+    parser.add_argument("--cluster", type=_int_list, help="measure the cluster throughput for these worker counts")
+    parser.add_argument("--ingest", action="store_true", help="measure the bulk ingestion of vote events")
+    parser.add_argument("--sketch", type=_int_list, help="compare approximate and exact aggregation for these audiences")
+    args = parser.parse_args()
+    if args.ingest:
+        print_table([benchmark_ingest(num_players, num_features, rule) for num_players in args.players
+                     for num_features in args.features for rule in args.rules.split(",")],
+                    ["players", "features", "rules", "events", "rejected", "events_per_s"])
+        sys.exit(0)
+    if args.sketch:
+        print_table([benchmark_sketches(audience, rule) for audience in args.sketch for rule in args.rules.split(",")],
+                    ["audience", "rules", "shards", "agreement_pct", "max_error_pct", "votes_per_s", "sketch_kib"])
+        sys.exit(0)
+    if args.startup:
+        for name, value in benchmark_startup().items():
+            print(f"{name:<24} {value:8.3f}")
+        sys.exit(0)
+    if args.cluster:
+        for workers in args.cluster:
+            measures = benchmark_cluster(workers)
+            print(f"{measures['workers']:>3} workers  {measures['votes_per_s']:10.0f} votes/s")
+        sys.exit(0)
+    metrics = Metrics(sink_for_path(args.metrics)) if args.metrics else None
+    print_table(run_benchmarks(args.players, args.features, args.rules.split(","), args.strategy, metrics))
+    if metrics is not None:
+        metrics.export()
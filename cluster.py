@@ -0,0 +1,435 @@
+import argparse
+import asyncio
+from concurrent.futures import Future
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+from models.game import Game
+from models.instrumentation import use_logging
+from models.storage import JsonFileStorage
+from server import PlanningPokerServer, Session
+
+## @file cluster.py
+#  @brief Sharded hosting of Planning Poker sessions on several worker processes.
+#
+#  A coordinator owns the TCP front end (same protocol as server.py) and
+#  routes every session to one worker process over a multiprocessing pipe.
+#  Workers share nothing: each one owns its Game objects and its storage
+#  directory (<directory>/worker-<n>), where its games are saved by session
+#  when it stops. A session always goes to the worker that hosts it; workers
+#  can be added or drained, and sessions move between workers through
+#  Game.save_game_state / Game.load_game_state, with their voting window,
+#  the votes of their open rounds and their vote deadlines.
+#
+#  Each worker advances the timer wheel of its vote deadlines between two
+#  requests; the events of an expired deadline are sent back on the pipe
+#  without a request ID and pushed to the clients by the front end.
+#      python cluster.py --workers 4 --port 8765
+
+
+def _state_path(directory, session_id):
+    """@brief File used to hand a session over to another worker."""
+    return os.path.join(directory, hashlib.sha1(str(session_id).encode("utf-8")).hexdigest() + ".json")
+
+
+def _handle(host, directory, op, payload):
+    """@brief Execute one coordinator request inside a worker."""
+    if op == "message":
+        # Subscribers live in the coordinator; the worker only returns the events
+        return [event for _, event in host.dispatch(payload, None)]
+    session_id = payload["session"]
+    if op == "export":
+        session = host.sessions.pop(session_id, None)
+        if session is None:
+            raise ValueError(f"Unknown session: {session_id}")
+        game = session.game
+        path = _state_path(directory, session_id)
+        game.save_game_state(path)  # With the open window and its votes when voting is pipelined
+        return {"path": path, "rules": game.rules, "window": session.window,
+                "timeout": game.vote_timeout, "timeout_policy": game.timeout_policy}
+    if op == "import":
+        if session_id in host.sessions:
+            raise ValueError(f"Session already exists: {session_id}")
+        game = Game.from_state(payload["path"], payload["rules"])
+        os.remove(payload["path"])
+        game.use_store(host.store, session_id)
+        if payload.get("timeout"):
+            game.set_vote_deadline(payload["timeout"], payload["timeout_policy"], host.deadlines)
+        host.sessions[session_id] = Session(session_id, game, host.notify, payload.get("window", 1))
+        if game.next_feature() is not None:
+            game.arm_deadlines()  # Players who have not voted yet get their full time again
+        return None
+    raise ValueError(f"Unknown operation: {op}")
+
+
+class WorkerHost(PlanningPokerServer):
+    """
+    @class WorkerHost
+    @brief Sessions of one worker process; the events no request caused go back to the coordinator.
+    """
+
+    def __init__(self, conn, store):
+        """@brief Constructor for the WorkerHost class.
+        @param conn The worker's end of the pipe.
+        @param store The models.storage.Storage of the worker.
+        """
+        super().__init__(store)
+        self.conn = conn
+
+    def notify(self, recipients, events):
+        """@brief Send the events of an expired deadline to the coordinator (the clients live there)."""
+        self.conn.send((None, True, events))
+
+
+def worker_main(conn, directory):
+    """@brief Entry point of a worker process: serve the coordinator's requests until "stop".
+    @details The games of the worker are saved in its own directory, never in the shared data/;
+    "stop" saves every session hosted by the worker before exiting.
+    @param conn The worker's end of the pipe; requests are (request_id, op, payload) tuples.
+    @param directory The storage directory owned by this worker.
+    """
+    use_logging()  # Game chatter goes to the logger (warnings only by default)
+    os.makedirs(directory, exist_ok=True)
+    host = WorkerHost(conn, JsonFileStorage(directory))
+    while True:
+        host.deadlines.advance()
+        try:
+            if not conn.poll(host.deadlines.tick):
+                continue
+            request_id, op, payload = conn.recv()
+        except EOFError:
+            break
+        if op == "stop":
+            try:
+                host.save()
+                conn.send((request_id, True, len(host.sessions)))
+            except OSError as e:
+                conn.send((request_id, False, str(e)))
+            break
+        try:
+            conn.send((request_id, True, _handle(host, directory, op, payload)))
+        except (ValueError, TypeError, KeyError, OSError) as e:
+            conn.send((request_id, False, str(e)))
+
+
+class WorkerHandle:
+    """
+    @class WorkerHandle
+    @brief The coordinator's side of one worker process.
+
+    Requests are pipelined: call() sends immediately and returns a Future that
+    a reader thread resolves when the worker answers.
+    """
+
+    def __init__(self, worker_id, directory, context=None, on_events=None):
+        """@brief Constructor for the WorkerHandle class; starts the worker process.
+        @param worker_id The identifier of the worker.
+        @param directory The storage directory of the worker.
+        @param context The multiprocessing context used to start the process.
+        @param on_events Optional callback(events) for the events of expired deadlines, called on the reader thread.
+        """
+        context = context or multiprocessing.get_context("spawn")  # The coordinator runs threads: no fork
+        self.worker_id = worker_id
+        self.directory = directory
+        self.sessions = set()  # IDs of the sessions routed to this worker
+        self.draining = False
+        self.on_events = on_events
+        self.pending = {}  # request ID -> Future
+        self.request_ids = itertools.count()
+        self.send_lock = threading.Lock()
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child, directory), daemon=True)
+        self.process.start()
+        child.close()
+        self.reader = threading.Thread(target=self._read, name=f"worker-{worker_id}", daemon=True)
+        self.reader.start()
+
+    def call(self, op, payload=None):
+        """@brief Send a request to the worker.
+        @return A Future resolved with the result, or failing with ValueError.
+        """
+        future = Future()
+        with self.send_lock:
+            request_id = next(self.request_ids)
+            self.pending[request_id] = future
+            try:
+                self.conn.send((request_id, op, payload))
+            except OSError:
+                del self.pending[request_id]
+                future.set_exception(RuntimeError(f"Worker {self.worker_id} is stopped."))
+        return future
+
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if request_id is None:
+                if self.on_events is not None:
+                    self.on_events(result)
+                continue
+            future = self.pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(ValueError(result))
+        for future in list(self.pending.values()):
+            future.set_exception(RuntimeError(f"Worker {self.worker_id} is stopped."))
+        self.pending.clear()
+
+    def stop(self, timeout=5):
+        """@brief Ask the worker to save its sessions and exit, and wait for the process."""
+        try:
+            self.call("stop").result(timeout)
+        except Exception:
+            self.process.terminate()
+        self.process.join(timeout)
+        self.conn.close()
+
+
+def _chain(source, target):
+    """@brief Copy the outcome of the source Future to the target Future."""
+    def done(future):
+        if future.exception() is not None:
+            target.set_exception(future.exception())
+        else:
+            target.set_result(future.result())
+    source.add_done_callback(done)
+
+
+class ClusterCoordinator:
+    """
+    @class ClusterCoordinator
+    @brief Routes sessions to worker processes, with session affinity and live migration.
+    """
+
+    def __init__(self, workers=None, directory="data/cluster"):
+        """@brief Constructor for the ClusterCoordinator class; starts the workers.
+        @param workers The number of worker processes, os.cpu_count() by default.
+        @param directory The parent of the workers' storage directories.
+        """
+        self.directory = directory
+        self.workers = {}
+        self.routes = {}  # session ID -> WorkerHandle
+        self.held = {}  # session ID -> [(message, Future)] received while the session migrates
+        self.lock = threading.RLock()
+        self.worker_ids = itertools.count()
+        self.on_events = None  # Optional callback(events) for the events of expired deadlines, on a reader thread
+        for _ in range(workers or os.cpu_count() or 1):
+            self.add_worker()
+
+    def add_worker(self):
+        """@brief Start a new worker; it receives new sessions right away (see rebalance()).
+        @return The ID of the worker.
+        """
+        worker_id = next(self.worker_ids)
+        with self.lock:
+            self.workers[worker_id] = WorkerHandle(worker_id, os.path.join(self.directory, f"worker-{worker_id}"),
+                                                   on_events=self._push)
+        return worker_id
+
+    def _push(self, events):
+        if self.on_events is not None:
+            self.on_events(events)
+
+    def _pick(self, exclude=None):
+        """@brief The active worker hosting the fewest sessions."""
+        candidates = [worker for worker in self.workers.values() if not worker.draining and worker is not exclude]
+        if not candidates:
+            raise RuntimeError("No worker available.")
+        return min(candidates, key=lambda worker: len(worker.sessions))
+
+    def submit(self, message):
+        """@brief Route a client message (server.py protocol) to the worker hosting its session.
+        @param message The decoded JSON message.
+        @return A Future resolved with the list of events.
+        """
+        session_id = message.get("session")
+        with self.lock:
+            if message.get("op") == "create":
+                if session_id in self.routes:
+                    return self._failed(f"Session already exists: {session_id}")
+                worker = self._pick()
+                self.routes[session_id] = worker
+                worker.sessions.add(session_id)
+                future = worker.call("message", message)
+
+                def created(future):
+                    if future.exception() is not None:
+                        self._forget(session_id)
+                future.add_done_callback(created)
+                return future
+            if session_id not in self.routes:
+                return self._failed(f"Unknown session: {session_id}")
+            if session_id in self.held:
+                future = Future()
+                self.held[session_id].append((message, future))
+                return future
+            return self.routes[session_id].call("message", message)
+
+    @staticmethod
+    def _failed(message):
+        future = Future()
+        future.set_exception(ValueError(message))
+        return future
+
+    def _forget(self, session_id):
+        with self.lock:
+            worker = self.routes.pop(session_id, None)
+            if worker is not None:
+                worker.sessions.discard(session_id)
+
+    def migrate(self, session_id, target=None):
+        """@brief Move a session to another worker without losing the messages sent meanwhile.
+        @details The source worker saves the game (save_game_state) and drops it, the
+        target loads it (load_game_state); messages received in between are held and
+        replayed on the target in order.
+        @param session_id The session to move.
+        @param target The destination WorkerHandle, the least loaded active worker by default.
+        @return A Future resolved with the ID of the worker now hosting the session.
+        """
+        done = Future()
+        with self.lock:
+            source = self.routes[session_id]
+            target = target or self._pick(exclude=source)
+            self.held[session_id] = []
+
+        def exported(future):
+            if future.exception() is not None:
+                self._release(session_id, source)
+                done.set_exception(future.exception())
+                return
+            state = {"session": session_id, **future.result()}
+            target.call("import", state).add_done_callback(lambda future: imported(future, state))
+
+        def imported(future, state):
+            if future.exception() is not None:
+                # Put the session back where it was, before the held messages
+                source.call("import", state)
+                self._release(session_id, source)
+                done.set_exception(future.exception())
+                return
+            self._release(session_id, target)
+            done.set_result(target.worker_id)
+
+        source.call("export", {"session": session_id}).add_done_callback(exported)
+        return done
+
+    def _release(self, session_id, worker):
+        """@brief Route a session to a worker and replay the messages held during its migration."""
+        with self.lock:
+            self.routes[session_id].sessions.discard(session_id)
+            self.routes[session_id] = worker
+            worker.sessions.add(session_id)
+            for message, future in self.held.pop(session_id, []):
+                _chain(worker.call("message", message), future)
+
+    def drain(self, worker_id, timeout=None):
+        """@brief Move every session off a worker, then stop it.
+        @param worker_id The worker to remove.
+        @param timeout Maximum number of seconds to wait for each migration.
+        """
+        with self.lock:
+            worker = self.workers[worker_id]
+            worker.draining = True
+            migrations = [self.migrate(session_id) for session_id in list(worker.sessions)]
+        for migration in migrations:
+            migration.result(timeout)
+        with self.lock:
+            del self.workers[worker_id]
+        worker.stop()
+
+    def rebalance(self, timeout=None):
+        """@brief Migrate sessions until the active workers host about as many sessions each.
+        @return The number of sessions moved.
+        """
+        moved = 0
+        while True:
+            with self.lock:
+                active = [worker for worker in self.workers.values() if not worker.draining]
+                busiest = max(active, key=lambda worker: len(worker.sessions))
+                idlest = min(active, key=lambda worker: len(worker.sessions))
+                if len(busiest.sessions) - len(idlest.sessions) <= 1:
+                    return moved
+                migration = self.migrate(next(iter(busiest.sessions)), idlest)
+            migration.result(timeout)
+            moved += 1
+
+    def close(self):
+        """@brief Stop every worker."""
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers.clear()
+        for worker in workers:
+            worker.stop()
+
+
+class ClusterServer(PlanningPokerServer):
+    """
+    @class ClusterServer
+    @brief TCP front end of the cluster: same protocol as PlanningPokerServer, games hosted by the workers.
+    """
+
+    def __init__(self, coordinator):
+        """@brief Constructor for the ClusterServer class.
+        @param coordinator The ClusterCoordinator hosting the sessions.
+        """
+        super().__init__()
+        self.coordinator = coordinator
+        self.subscribers = {}  # session ID -> writers of the clients following it
+        self.loop = None
+        coordinator.on_events = self.push_events
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """@brief Start listening for clients (see PlanningPokerServer.start)."""
+        self.loop = asyncio.get_running_loop()
+        return await super().start(host, port)
+
+    def push_events(self, events):
+        """@brief Send the events of an expired deadline to the clients following the session (any thread)."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._deliver, events)
+
+    def _deliver(self, events):
+        self.send([(self.subscribers.get(event["session"], set()), event) for event in events])
+
+    async def handle_message(self, message, writer):
+        """@brief Forward a client message to the worker of its session and address the events."""
+        op = message.get("op")
+        if op not in ("create", "join", "state", "vote"):
+            raise ValueError(f"Unknown operation: {op}")
+        events = await asyncio.wrap_future(self.coordinator.submit(message))
+        session_id = message.get("session")
+        if op in ("create", "join"):
+            self.subscribers.setdefault(session_id, set()).add(writer)
+        recipients = self.subscribers.get(session_id, set()) | {writer} if op == "vote" else {writer}
+        return [(recipients, event) for event in events]
+
+    def unsubscribe(self, writer):
+        """@brief Stop sending events to a client that disconnected."""
+        for subscribers in self.subscribers.values():
+            subscribers.discard(writer)
+
+
+async def main(host, port, workers, directory):
+    coordinator = ClusterCoordinator(workers, directory)
+    server = ClusterServer(coordinator)
+    try:
+        port = await server.start(host, port)
+        print(f"Planning Poker cluster listening on {host}:{port} with {len(coordinator.workers)} workers")
+        await server.serve_forever()
+    finally:
+        coordinator.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planning Poker server sharded over worker processes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--directory", default="data/cluster", help="parent of the workers' storage directories")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.workers, args.directory))
@@ -1,8 +1,16 @@
 from models.players import Player
 from models.game import Game
+from models.history import VoteHistory
+from models.autosave import AutoSaver
+from models.similarity import SimilarityIndex
+from models.aggregation import RULES
+from models.backlog import import_backlog, import_into_store
+from models.ingest import ingest_events
+from models.sqlite_store import SQLiteStore
+from models.storage import DEFAULT_SESSION, JsonFileStorage
+import argparse
 import signal
 import os
-import json 
 # Main menu
 def add_task(tasks):
     # Prompt the user for task description
@@ -13,10 +21,20 @@ def add_task(tasks):
     print("Task added successfully!")
     return tasks
 
-def save_to_json(tasks, filename="./data/backlog.json"):
-    with open(filename, "w") as file:
-        json.dump(tasks, file, indent=4)
-    print(f"Tasks saved to {filename}.")
+def save_to_json(tasks, store):
+    """@brief Merge tasks into the backlog of the storage, written once (see models.backlog.import_into_store)."""
+    counts = import_into_store([tasks["tasks"]], store)
+    print(f"{counts['imported']} tasks saved ({counts['duplicates']} duplicates skipped).")
+
+def use_data_dirs(game, store):
+    """@brief Keep the vote history and the similarity index of a game in the directories of its storage.
+    @details A storage without directories keeps the history in memory and has no similarity index.
+    @param game The Game.
+    @param store The models.storage.Storage of the game.
+    """
+    game.history = VoteHistory(store.data_dir("history"))
+    similarity = store.data_dir("similarity")
+    game.similar_tasks = SimilarityIndex(similarity) if similarity is not None else None
 
 def signal_handler(game):
 
@@ -24,17 +42,23 @@ def signal_handler(game):
     @param game The current game instance.
     """
     print("\nInterruption detected! Saving the game state...")
-    game.save_game_state("data/game_state.json")
+    game.save_game_state()
+    if game.autosaver is not None:
+        game.autosaver.flush()
     print("Game state saved. Exiting the game.")
     exit(0)
 
-def main_menu():
+def main_menu(store=None, session_id=DEFAULT_SESSION, team=None):
     """
     @brief Main menu for the Planning Poker application.
 
     @details The main menu allows the user to start a new game, load a saved game, or quit the application.
+    @param store The models.storage.Storage of the backlog and the games, the data/ directory by default.
+    @param session_id The session of the store to create or resume.
+    @param team Optional team of the session.
 
     """
+    store = store or JsonFileStorage()
     while True:
         print("Bienvenue dans l'application Planning Poker")
         print("1. Nouvelle partie")
@@ -61,15 +85,43 @@ def main_menu():
                 rules = input("Choisissez une règle (strict, average, median, absolute_majority, relative_majority) : ")
                 
                 # add rules if the players chooses smt wrong 
+
+            timeout = input("Temps de vote par joueur en secondes (Entrée = illimité) : ")
+            while timeout and not timeout.isdigit():
+                print("Temps invalide.")
+                timeout = input("Temps de vote par joueur en secondes (Entrée = illimité) : ")
+            policy = "joker"
+            if timeout and int(timeout):
+                policy = input("À l'expiration du temps (joker, abstain, skip) : ")
+                while policy not in ["joker", "abstain", "skip"]:
+                    print("Choix invalide.")
+                    policy = input("À l'expiration du temps (joker, abstain, skip) : ")
+            window = 1
+            if not (timeout and int(timeout)):  # Vote deadlines only apply to one feature at a time
+                window = input("Nombre de fonctionnalités votées en parallèle (Entrée = 1) : ")
+                while window and not (window.isdigit() and int(window) >= 1):
+                    print("Nombre invalide.")
+                    window = input("Nombre de fonctionnalités votées en parallèle (Entrée = 1) : ")
+                window = int(window or 1)
             
-            game = Game(num_players=num_players, rules=rules)
+            game = Game(num_players=num_players, rules=rules, lazy=True, store=store)
+            if timeout and int(timeout):
+                game.set_vote_deadline(int(timeout), policy)
+            game.use_store(store, session_id, team)
+            if store.state_path(session_id) is not None:
+                game.enable_journal()
+            use_data_dirs(game, store)
+            game.autosaver = AutoSaver()
             # Register signal handler to save state on interruption
             signal.signal(signal.SIGINT, lambda s, f: signal_handler(game))
-            game.start_game()
+            game.start_game(window=window)
         elif choice == "2":
             try:
-                game = Game(num_players=0)  # Initialisation avec 0 joueurs
-                game.load_game_state("data/game_state.json")
+                game = Game.from_store(store, session_id)
+                if store.state_path(session_id) is not None:
+                    game.enable_journal()
+                use_data_dirs(game, store)
+                game.autosaver = AutoSaver()
                 game.start_game()
 
             except FileNotFoundError:
@@ -83,12 +135,41 @@ def main_menu():
 
 
 if __name__ == "__main__":
-    nb_tasks = int(input("Enter the number of tasks   "))  
-    tasks = {"tasks":[]}    
-    for _ in range(nb_tasks):  
-        print(f"Task {_+1}")
-        add_task(tasks)
-        save_to_json(tasks)
-    main_menu()
-
-
+    parser = argparse.ArgumentParser(description="Planning Poker")
+    parser.add_argument("--import", dest="sources", nargs="+", metavar="SOURCE",
+                        help="import tasks from .csv, .jsonl, .json or text files ('-' for stdin) and exit")
+    parser.add_argument("--ingest", dest="events", nargs="+", metavar="SOURCE",
+                        help="apply the vote events of JSON Lines files ('-' for stdin) to the sessions and exit")
+    parser.add_argument("--rules", choices=RULES, help="voting rules of the ingested votes (default: those of each session)")
+    parser.add_argument("--players", help="comma-separated pseudos seated in new ingested sessions and in those saved without players")
+    parser.add_argument("--rejected", help="JSON Lines file the rejected events are written to")
+    parser.add_argument("--backlog", help="backlog file the tasks are merged into (default: the backlog of the storage)")
+    parser.add_argument("--data", default="data", help="directory of the JSON files (backlog, game state, reports)")
+    parser.add_argument("--db", help="SQLite database holding the sessions instead of the JSON files")
+    parser.add_argument("--session", default=DEFAULT_SESSION, help="session to create or resume")
+    parser.add_argument("--team", help="team of the session, used to group the database queries")
+    args = parser.parse_args()
+    store = SQLiteStore(args.db) if args.db else JsonFileStorage(args.data)
+    try:
+        if args.sources:
+            if args.backlog:
+                counts = import_backlog(args.sources, args.backlog)
+            else:
+                counts = import_into_store(args.sources, store)
+            print(f"{counts['imported']} tasks imported "
+                  f"({counts['duplicates']} duplicates skipped, {counts['kept']} already there).")
+        elif args.events:
+            report = ingest_events(args.events, store, args.rules,
+                                   players=args.players.split(",") if args.players else None,
+                                   rejected_path=args.rejected)
+            print(report.summary())
+        else:
+            nb_tasks = int(input("Enter the number of tasks   "))  
+            tasks = {"tasks":[]}    
+            for _ in range(nb_tasks):  
+                print(f"Task {_+1}")
+                add_task(tasks)
+            save_to_json(tasks, store)
+            main_menu(store, args.session, args.team)
+    finally:
+        store.close()
@@ -0,0 +1,111 @@
+from collections import Counter
+
+
+## @file aggregation.py
+#  @brief Vote aggregation for the Planning Poker rules over integer-coded votes.
+#
+#  Votes are integer-coded: a numeric card is stored as its value, the
+#  'joker' card and a missing vote are stored as negative sentinels and
+#  are masked out of every rule. Each row of a vote matrix is reduced to a
+#  card histogram once, and every rule is then read from that histogram
+#  (at most one entry per card of the deck) instead of re-parsing and
+#  re-sorting the raw votes. The rows are processed one at a time: counting
+#  each row with Counter was measured faster than counting the whole matrix
+#  into one dense table, so there is no column-wise pass.
+
+JOKER = -1
+MISSING = -2
+
+RULES = ("strict", "average", "median", "absolute_majority", "relative_majority")
+
+
+def encode_vote(vote, deck=None):
+    """@brief Encode a single card as an integer.
+    @param vote The card chosen by a player ("5", "joker", None...).
+    @param deck Optional Deck giving the value of each card; numeric labels are their own value otherwise.
+    @return The card value, JOKER for a card without value or MISSING if the player has not voted.
+    """
+    if vote is None or vote == "":
+        return MISSING
+    if deck is not None:
+        value = deck.value(vote)
+        return JOKER if value is None else value
+    if vote.isdigit():
+        return int(vote)
+    return JOKER
+
+
+def encode_votes(votes, deck=None):
+    """@brief Encode one round of votes as a row of the vote matrix.
+    @param votes The cards chosen by the players, in seating order.
+    @param deck Optional Deck giving the value of each card.
+    @return A list of integer codes.
+    """
+    return [encode_vote(vote, deck) for vote in votes]
+
+
+def histogram(row):
+    """@brief Count the numeric cards of a row, masking jokers and missing votes.
+    @param row A row of integer-coded votes.
+    @return A dict mapping each card value to the number of players who played it.
+    """
+    counts = Counter(row)
+    counts.pop(JOKER, None)
+    counts.pop(MISSING, None)
+    return counts
+
+
+def verdict(counts, total, rules):
+    """@brief Apply a rule to the histogram of one round.
+    @param counts Dict mapping card values to their number of votes (masked cards excluded).
+    @param total The number of players at the table, masked votes included.
+    @param rules The voting rule ("strict", "average", "median", ...).
+    @return A (difficulty, validated) tuple; difficulty is None if the feature is not validated.
+    """
+    numeric = sum(counts.values())
+    if not numeric:
+        return None, False
+
+    if rules == "strict":
+        # Unanimity: every player played the same numeric card
+        if len(counts) == 1 and numeric == total:
+            return next(iter(counts)), True
+        return None, False
+
+    if rules == "average":
+        return sum(value * count for value, count in counts.items()) / numeric, True
+
+    if rules == "median":
+        # Walk the cumulative counts instead of sorting the votes
+        lower_rank = (numeric - 1) // 2
+        upper_rank = numeric // 2
+        lower = upper = None
+        seen = 0
+        for value in sorted(counts):
+            seen += counts[value]
+            if lower is None and seen > lower_rank:
+                lower = value
+            if seen > upper_rank:
+                upper = value
+                break
+        if numeric % 2 == 0:
+            return (lower + upper) / 2, True
+        return upper, True
+
+    if rules in ("absolute_majority", "relative_majority"):
+        # Ties go to the lowest card so the result does not depend on seating order
+        best_value, best_count = min(counts.items(), key=lambda item: (-item[1], item[0]))
+        if rules == "relative_majority" or best_count > total / 2:
+            return best_value, True
+        return None, False
+
+    return None, False
+
+
+def aggregate_votes(matrix, rules):
+    """@brief Compute the difficulty and validation status of every row of a vote matrix, one row after the other.
+    @param matrix An iterable of rows (one per feature), each row holding the integer-coded votes of every player.
+    @param rules The voting rule applied to every row.
+    @return A list of (difficulty, validated) tuples, one per row.
+    """
+    return [verdict(histogram(row), len(row), rules) for row in matrix]
@@ -0,0 +1,129 @@
+import atexit
+import queue
+import threading
+import time
+from models.storage import atomic_write
+
+
+## @file autosave.py
+#  @brief Background writer that coalesces save requests.
+#
+#  Callers enqueue (path, payload) requests on a bounded queue and return
+#  immediately. A writer thread gathers the requests that arrive during
+#  one interval, keeps only the latest payload of each file and writes
+#  each file once, atomically (temporary file + os.replace).
+
+
+class _Marker:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class _Stop(_Marker):
+    pass
+
+
+class AutoSaver:
+    """
+    @class AutoSaver
+    @brief Background, coalescing, atomic file writer.
+
+    A payload is text, bytes, or a function returning one of them; functions
+    run on the writer thread so the caller does not pay for serialization, and
+    must only read data the caller no longer changes (e.g. a copy of the game
+    state, see Game._write). A write that raises is counted as failed.
+    """
+
+    def __init__(self, interval=0.5, max_queued=256):
+        """@brief Constructor for the AutoSaver class; starts the writer thread.
+        @param interval Seconds during which requests are gathered before writing.
+        @param max_queued Size of the request queue; request() blocks when it is full.
+        """
+        self.interval = interval
+        self.queue = queue.Queue(max_queued)
+        self.queued = 0  # Requests received
+        self.coalesced = 0  # Requests replaced by a newer one for the same file
+        self.written = 0  # Files written
+        self.failed = 0  # Writes that raised an error
+        self.last_error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)  # Unregistered by close(), so closed savers are not kept alive
+
+    def request(self, filepath, payload):
+        """@brief Ask for a file to be written; returns without waiting for the disk.
+        @param filepath The path of the file.
+        @param payload Text, bytes, or a function returning the text or bytes to write.
+        @throws RuntimeError if the saver is closed.
+        """
+        if self.closed:
+            raise RuntimeError("AutoSaver is closed.")
+        self.queued += 1
+        self.queue.put((filepath, payload))
+
+    def flush(self, timeout=None):
+        """@brief Write every pending request now and wait until it is on disk.
+        @param timeout Maximum number of seconds to wait.
+        @return True if everything was written before the timeout.
+        """
+        if self.closed or not self.thread.is_alive():
+            return True
+        marker = _Marker()
+        self.queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=None):
+        """@brief Flush the pending requests, stop the writer thread and drop the exit hook of the saver."""
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        if self.thread.is_alive():
+            marker = _Stop()
+            self.queue.put(marker)
+            marker.done.wait(timeout)
+
+    def metrics(self):
+        """@brief Counters of the saver.
+        @return A dict with the queued, coalesced, written and failed counts.
+        """
+        return {"queued": self.queued, "coalesced": self.coalesced, "written": self.written, "failed": self.failed}
+
+    def _run(self):
+        while True:
+            batch = {}
+            markers = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.interval
+            while True:
+                if isinstance(item, _Marker):
+                    markers.append(item)
+                else:
+                    filepath, payload = item
+                    if filepath in batch:
+                        self.coalesced += 1
+                    batch[filepath] = payload
+                try:
+                    if markers:
+                        # A flush writes what is already queued, without waiting
+                        item = self.queue.get_nowait()
+                    else:
+                        item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            for filepath, payload in batch.items():
+                self._write(filepath, payload)
+            for marker in markers:
+                marker.done.set()
+            if any(isinstance(marker, _Stop) for marker in markers):
+                return
+
+    def _write(self, filepath, payload):
+        try:
+            data = payload() if callable(payload) else payload
+            atomic_write(filepath, data, mode="wb" if isinstance(data, bytes) else "w")
+            self.written += 1
+        except Exception as e:
+            self.last_error = e
+            self.failed += 1
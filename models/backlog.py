@@ -0,0 +1,401 @@
+from collections import OrderedDict
+import json
+import os
+import sys
+
+
+## @file backlog.py
+#  @brief Streaming backlog sources and backlog index.
+#
+#  Both backlog layouts are read lazily, one task at a time:
+#  - JSON Lines (.jsonl): one task object per line;
+#  - the usual {"tasks": [...]} JSON file, parsed incrementally so that
+#    only the task being decoded is held in memory.
+#
+#  import_backlog() merges tasks from CSV, JSON Lines, JSON or text files
+#  (or stdin) into a backlog file in one streaming pass.
+
+_WHITESPACE = " \t\r\n"
+
+
+class _JsonStream:
+    """
+    @class _JsonStream
+    @brief Chunked reader on top of json.JSONDecoder.raw_decode.
+    """
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """@brief Read one more chunk, dropping what was already consumed.
+        @return False if the end of the file was reached.
+        """
+        if self.eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """@brief Skip whitespace and return the next character ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        """@brief Consume the next non-blank character, which must be char.
+        @throws ValueError if another character is found.
+        """
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Invalid backlog file: expected '{char}', found '{found}'.")
+        self.pos += 1
+
+    def value(self):
+        """@brief Decode the next JSON value, reading more chunks until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise ValueError("Invalid backlog file: truncated JSON value.")
+                continue
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and not isinstance(value, (dict, list, str)) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def _iter_json_tasks(file, chunk_size):
+    stream = _JsonStream(file, chunk_size)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.value()
+        stream.expect(":")
+        if key == "tasks":
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.pos += 1
+            else:
+                while True:
+                    yield stream.value()
+                    if stream.peek() == ",":
+                        stream.pos += 1
+                        continue
+                    stream.expect("]")
+                    break
+        else:
+            stream.value()  # Skip other top-level entries
+        if stream.peek() == ",":
+            stream.pos += 1
+            continue
+        stream.expect("}")
+        return
+
+
+def _iter_jsonl_tasks(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_tasks(filepath, chunk_size=1 << 16):
+    """@brief Iterate lazily over the tasks of a backlog file.
+    @param filepath A .jsonl file (one task per line) or a {"tasks": [...]} JSON file.
+    @param chunk_size Number of characters read at a time from a JSON file.
+    @return A generator of task dicts.
+    @throws FileNotFoundError if the file does not exist.
+    @throws ValueError if the file is not a valid backlog.
+    """
+    with open(filepath, "r", encoding="utf-8") as file:
+        if filepath.endswith(".jsonl"):
+            yield from _iter_jsonl_tasks(file)
+        else:
+            yield from _iter_json_tasks(file, chunk_size)
+
+
+class BacklogIndex:
+    """
+    @class BacklogIndex
+    @brief Index over the backlog list: stable feature IDs, position by ID and a queue of pending features.
+
+    Every task gets an "id" field (kept if already present). The pending
+    queue is an OrderedDict of feature IDs, so the next feature to estimate,
+    progress counts and the "all validated" check are constant time.
+    """
+
+    def __init__(self, tasks):
+        """@brief Constructor for the BacklogIndex class.
+        @param tasks The backlog list; it is indexed in place, not copied.
+        """
+        self.tasks = tasks
+        self.positions = {}
+        self.pending = OrderedDict()
+        self.next_id = 1 + max((task["id"] for task in tasks if isinstance(task.get("id"), int)), default=0)
+        self.indexed = 0
+        self.sync()
+
+    def sync(self):
+        """@brief Index tasks appended to the list since the last call."""
+        while self.indexed < len(self.tasks):
+            task = self.tasks[self.indexed]
+            if task.get("id") is None or task["id"] in self.positions:
+                task["id"] = self.next_id
+                self.next_id += 1
+            self.positions[task["id"]] = self.indexed
+            if not task.get("validated", False):
+                self.pending[task["id"]] = None
+            self.indexed += 1
+
+    def position(self, feature_id):
+        """@brief Position of a feature in the backlog list.
+        @throws KeyError if the ID is unknown.
+        """
+        self.sync()
+        return self.positions[feature_id]
+
+    def get(self, feature_id):
+        """@brief The task with the given ID."""
+        return self.tasks[self.position(feature_id)]
+
+    def contains(self, feature):
+        """@brief True if this very task dict belongs to the indexed backlog."""
+        self.sync()
+        position = self.positions.get(feature.get("id"))
+        return position is not None and self.tasks[position] is feature
+
+    def set_validated(self, feature, validated):
+        """@brief Update the validation flag of a task and the pending queue.
+        @param feature A task of the backlog.
+        @param validated The new status.
+        """
+        feature["validated"] = validated
+        if not self.contains(feature):
+            return
+        if validated:
+            self.pending.pop(feature["id"], None)
+        elif feature["id"] not in self.pending:
+            self.pending[feature["id"]] = None
+            # Keep the queue in backlog order when a feature is reopened
+            for feature_id in list(self.pending):
+                if self.positions[feature_id] > self.positions[feature["id"]]:
+                    self.pending.move_to_end(feature_id)
+
+    def next_pending(self):
+        """@brief The first task that is not validated yet, or None."""
+        self.sync()
+        if not self.pending:
+            return None
+        return self.get(next(iter(self.pending)))
+
+    def iter_pending(self, reverse=False):
+        """@brief Iterate over the tasks that are not validated yet, in queue order.
+        @param reverse True to start from the end of the queue.
+        """
+        self.sync()
+        for feature_id in (reversed(self.pending) if reverse else self.pending):
+            yield self.tasks[self.positions[feature_id]]
+
+    def pending_count(self):
+        """@brief Number of tasks that are not validated yet."""
+        self.sync()
+        return len(self.pending)
+
+    def requeue(self, feature):
+        """@brief Move a pending task behind all the others (e.g. a contested feature in pipelined voting)."""
+        self.sync()
+        if feature.get("id") in self.pending:
+            self.pending.move_to_end(feature["id"])
+
+    def validated_count(self):
+        """@brief Number of validated tasks."""
+        self.sync()
+        return len(self.tasks) - len(self.pending)
+
+    def all_validated(self):
+        """@brief True if every task of the backlog is validated."""
+        self.sync()
+        return not self.pending
+
+
+_TRUE = ("true", "1", "yes")
+_FALSE = ("false", "0", "no", "")
+
+
+def _task(task):
+    """@brief Normalize an imported task: a description string becomes a task dict, an empty difficulty None.
+    @details Text fields of CSV rows get their types back: "validated" becomes a boolean and
+    "id" an integer (dropped if empty); the "rounds" column of a CSV report is not a task field.
+    @throws ValueError if a field cannot be converted.
+    """
+    if isinstance(task, str):
+        return {"description": task, "difficulty": None}
+    difficulty = task.get("difficulty")
+    if isinstance(difficulty, str):
+        difficulty = float(difficulty) if difficulty.strip() else None
+        task["difficulty"] = int(difficulty) if difficulty is not None and difficulty.is_integer() else difficulty
+    task.setdefault("difficulty", None)
+    validated = task.get("validated")
+    if isinstance(validated, str):
+        if validated.strip().lower() not in _TRUE + _FALSE:
+            raise ValueError(f"Invalid validated value: {validated}")
+        task["validated"] = validated.strip().lower() in _TRUE
+    feature_id = task.get("id")
+    if isinstance(feature_id, str):
+        if feature_id.strip():
+            task["id"] = int(feature_id)
+        else:
+            del task["id"]
+    if isinstance(task.get("rounds"), str):
+        del task["rounds"]
+    return task
+
+
+def _iter_csv_tasks(file):
+    import csv
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [column.strip().lower() for column in header]
+    if "description" not in columns:
+        # No header: one description per row, in the first column
+        columns = ["description"]
+        if header:
+            yield {"description": header[0]}
+    for row in reader:
+        if row:
+            yield dict(zip(columns, row))
+
+
+def _iter_lines(file):
+    """@brief One task per line: a JSON object, or a plain description."""
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line) if line.startswith("{") else line
+
+
+def iter_import(source):
+    """@brief Iterate lazily over the tasks of an import source.
+    @param source A path (.csv, .jsonl, .json, or text with one task per line),
+    "-" for stdin (JSON Lines or one description per line), or an iterable of tasks.
+    @return A generator of task dicts.
+    """
+    if not isinstance(source, str):
+        for task in source:
+            yield _task(task)
+        return
+    if source == "-":
+        for task in _iter_lines(sys.stdin):
+            yield _task(task)
+        return
+    if source.endswith(".json"):
+        for task in iter_tasks(source):
+            yield _task(task)
+        return
+    with open(source, "r", encoding="utf-8", newline="") as file:
+        tasks = _iter_csv_tasks(file) if source.endswith(".csv") else _iter_lines(file)
+        for task in tasks:
+            yield _task(task)
+
+
+def _key(description):
+    """@brief Deduplication key of a description: case and spacing are ignored."""
+    return " ".join(description.split()).casefold()
+
+
+def merge_tasks(existing, sources, counts):
+    """@brief Existing tasks followed by the new tasks of the sources whose description is not present yet.
+    @param existing An iterable of the tasks already in the backlog.
+    @param sources A list of import sources (see iter_import).
+    @param counts A dict whose "kept", "imported" and "duplicates" counters are updated.
+    @return A generator of task dicts.
+    """
+    seen = set()
+    for task in existing:
+        seen.add(_key(task.get("description") or ""))
+        counts["kept"] += 1
+        yield task
+    for source in sources:
+        for task in iter_import(source):
+            key = _key(task.get("description") or "")
+            if not key:
+                continue
+            if key in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(key)
+            counts["imported"] += 1
+            yield task
+
+
+def import_backlog(sources, filepath="data/backlog.json"):
+    """@brief Merge tasks into a backlog file, skipping descriptions already present.
+    @details The existing backlog and the sources are streamed to a temporary file
+    that replaces the backlog at the end, so the file is written once and only the
+    set of descriptions is held in memory.
+    @param sources A list of import sources (see iter_import).
+    @param filepath The backlog file, created if it does not exist.
+    @return A dict with the number of tasks "kept", "imported" and "duplicates".
+    @throws ValueError if a source or the backlog is not valid; the backlog is left untouched.
+    """
+    import tempfile
+    counts = {"kept": 0, "imported": 0, "duplicates": 0}
+    existing = iter_tasks(filepath) if os.path.exists(filepath) else ()
+    directory = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(filepath))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            file.write('{\n    "tasks": [')
+            separator = "\n        "
+            for task in merge_tasks(existing, sources, counts):
+                file.write(separator + json.dumps(task, ensure_ascii=False))
+                separator = ",\n        "
+            file.write("\n    ]\n}\n" if counts["kept"] or counts["imported"] else "]\n}\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return counts
+
+
+def import_into_store(sources, store):
+    """@brief Merge tasks into the backlog of a models.storage.Storage, saved once.
+    @details A store that keeps its backlog in a file gets the streaming import_backlog.
+    @param sources A list of import sources (see iter_import).
+    @param store The Storage.
+    @return A dict with the number of tasks "kept", "imported" and "duplicates".
+    """
+    if store.backlog_path() is not None:
+        return import_backlog(sources, store.backlog_path())
+    try:
+        existing = store.load_backlog()
+    except FileNotFoundError:
+        existing = []
+    counts = {"kept": 0, "imported": 0, "duplicates": 0}
+    store.save_backlog(list(merge_tasks(existing, sources, counts)))
+    return counts
@@ -0,0 +1,109 @@
+import math
+import time
+
+
+## @file deadlines.py
+#  @brief Hashed timer wheel driving the vote deadlines of every table.
+#
+#  The wheel is a ring of slots, one per tick. A deadline is stored in the
+#  slot of the tick at which it expires, so arming and cancelling are a dict
+#  insertion and deletion, whatever the number of pending deadlines; each
+#  tick only looks at its own slot. Deadlines further away than one turn of
+#  the wheel wait in their slot until their turn comes.
+#
+#  The wheel owns no thread: the front end that drives it (the CLI after each
+#  input, the Tk mainloop through after(), the server's event loop) calls
+#  advance() regularly and the expired callbacks run there.
+
+## What happens to a player whose deadline expires
+POLICIES = (
+    "joker",  # The player plays the 'joker' card
+    "abstain",  # The player has no card this round but still counts at the table
+    "skip",  # The player is left out of this round
+)
+
+
+class _Deadline:
+    __slots__ = ("key", "expires", "tick", "callback")
+
+    def __init__(self, key, expires, tick, callback):
+        self.key = key
+        self.expires = expires
+        self.tick = tick
+        self.callback = callback
+
+
+class TimerWheel:
+    """
+    @class TimerWheel
+    @brief Thousands of pending deadlines with O(1) arm and cancel.
+    """
+
+    def __init__(self, tick=0.1, slots=512, clock=time.monotonic):
+        """@brief Constructor for the TimerWheel class.
+        @param tick Resolution of the wheel in seconds.
+        @param slots Number of slots (ticks per turn of the wheel).
+        @param clock Function returning the current time in seconds.
+        """
+        self.tick = tick
+        self.clock = clock
+        self.slots = [{} for _ in range(slots)]
+        self.deadlines = {}  # key -> _Deadline
+        self.ticked = math.floor(clock() / tick)  # Last tick processed
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def arm(self, key, delay, callback):
+        """@brief Call callback() once delay seconds have passed, replacing any deadline of the same key.
+        @param key Any hashable identifying the deadline (e.g. a Player).
+        @param delay The delay in seconds.
+        @param callback Function called without arguments by advance() when the deadline expires.
+        """
+        self.cancel(key)
+        expires = self.clock() + delay
+        tick = max(math.ceil(expires / self.tick), self.ticked + 1)
+        deadline = _Deadline(key, expires, tick, callback)
+        self.deadlines[key] = deadline
+        self.slots[tick % len(self.slots)][key] = deadline
+
+    def cancel(self, key):
+        """@brief Drop the deadline of a key.
+        @return True if a deadline was pending.
+        """
+        deadline = self.deadlines.pop(key, None)
+        if deadline is None:
+            return False
+        del self.slots[deadline.tick % len(self.slots)][key]
+        return True
+
+    def remaining(self, key):
+        """@brief Seconds left before the deadline of a key expires, None if it has none."""
+        deadline = self.deadlines.get(key)
+        if deadline is None:
+            return None
+        return max(0.0, deadline.expires - self.clock())
+
+    def advance(self):
+        """@brief Fire every deadline that has expired since the last call.
+        @return The number of deadlines fired.
+        """
+        now = math.floor(self.clock() / self.tick)
+        if now <= self.ticked:
+            return 0
+        size = len(self.slots)
+        # After a long pause every slot is visited once instead of once per elapsed tick
+        ticks = range(self.ticked + 1, now + 1) if now - self.ticked < size else range(size)
+        self.ticked = now
+        expired = []
+        for tick in ticks:
+            slot = self.slots[tick % size]
+            for key, deadline in list(slot.items()):
+                if deadline.tick <= now:
+                    del slot[key]
+                    del self.deadlines[key]
+                    expired.append(deadline)
+        expired.sort(key=lambda deadline: deadline.expires)
+        for deadline in expired:
+            deadline.callback()
+        return len(expired)
@@ -0,0 +1,99 @@
+from array import array
+from types import MappingProxyType
+
+
+## @file deck.py
+#  @brief Card decks shared by all the players of a table, and compact vote storage.
+
+NO_VOTE = -1  # Code stored for a player who has not voted
+
+
+class Deck:
+    """
+    @class Deck
+    @brief Immutable deck of cards with O(1) card lookup.
+
+    Each card has a small integer code (its position in the deck) and a
+    numeric value used by the voting rules; non-numeric cards such as
+    'joker' have no value and are masked by the rules.
+    """
+
+    __slots__ = ("name", "cards", "codes", "values", "_value_of")
+
+    def __init__(self, name, cards, values=None):
+        """@brief Constructor for the Deck class.
+        @param name The name of the deck.
+        @param cards The card labels, in display order.
+        @param values Optional numeric value of each card (None for cards such as 'joker');
+        by default numeric labels are their own value.
+        """
+        cards = tuple(cards)
+        if values is None:
+            values = tuple(int(card) if card.isdigit() else None for card in cards)
+        if len(values) != len(cards) or len(set(cards)) != len(cards):
+            raise ValueError(f"Invalid deck: {name}")
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "cards", cards)
+        object.__setattr__(self, "codes", MappingProxyType({card: code for code, card in enumerate(cards)}))
+        object.__setattr__(self, "values", tuple(values))
+        object.__setattr__(self, "_value_of", MappingProxyType(dict(zip(cards, values))))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Deck objects are immutable")
+
+    def __contains__(self, card):
+        return card in self.codes
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __repr__(self):
+        return f"Deck({self.name!r}, {self.cards!r})"
+
+    def code(self, card):
+        """@brief Integer code of a card.
+        @throws ValueError if the card is not in the deck.
+        """
+        try:
+            return self.codes[card]
+        except KeyError:
+            raise ValueError(f"Invalid card: {card}") from None
+
+    def value(self, card):
+        """@brief Numeric value of a card, or None for a card without value (e.g. 'joker') or an unknown card."""
+        return self._value_of.get(card)
+
+
+FIBONACCI = Deck("fibonacci", ("1", "2", "3", "5", "8", "13", "20", "40", "100", "joker"))
+TSHIRT = Deck("tshirt", ("XS", "S", "M", "L", "XL", "XXL", "joker"), (1, 2, 3, 5, 8, 13, None))
+POWERS_OF_TWO = Deck("powers_of_two", ("1", "2", "4", "8", "16", "32", "64", "joker"))
+
+DECKS = {deck.name: deck for deck in (FIBONACCI, TSHIRT, POWERS_OF_TWO)}
+
+
+class VoteBoard:
+    """
+    @class VoteBoard
+    @brief Votes of a whole table stored as card codes in one shared array (one slot per seat).
+    """
+
+    __slots__ = ("codes",)
+
+    def __init__(self, seats):
+        """@brief Constructor for the VoteBoard class.
+        @param seats The number of seats at the table.
+        """
+        self.codes = array("h", [NO_VOTE]) * seats
+
+    def __len__(self):
+        return len(self.codes)
+
+    def add_seat(self):
+        """@brief Add a seat at the end of the board.
+        @return The index of the new seat.
+        """
+        self.codes.append(NO_VOTE)
+        return len(self.codes) - 1
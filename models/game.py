@@ -1,5 +1,13 @@
 import json
+import time
 from models.players import Player 
+from models.aggregation import aggregate_votes, encode_votes
+from models.tally import VoteTally
+from models.backlog import BacklogIndex
+from models.deck import FIBONACCI, NO_VOTE, VoteBoard
+from models.history import VoteHistory
+from models.storage import DEFAULT_SESSION, atomic_write, default_storage
+from models.instrumentation import DEBUG, NULL_METRICS, WARNING, say
 import os
 
 
@@ -10,126 +18,600 @@ class Game:
 
 
     """
-    
-    #def timeout(pseudo, timeout_duration=10):
-     #   """Notify the player if they run out of time to vote."""
-      #  print(f"{pseudo}, you have {timeout_duration} seconds to vote.")
-       # threading.Timer(timeout_duration, lambda: print(f"Time is up for {pseudo}!")).start()
 
-    def __init__(self, num_players, rules="strict"):
+
+    def __init__(self, num_players, rules="strict", deck=FIBONACCI, compact=False, lazy=False, store=None):
         """@brief Constructor for the Game class.
         @param num_players The number of players in the game.
         @param rules The voting rules to use for the game   
+        @param deck The Deck shared by all the players (see models.deck).
+        @param compact If True the votes of the table are stored in one shared VoteBoard array.
+        @param lazy If True nothing touches the disk: the data directory and the save file are
+        created by the first save and data/backlog.json is loaded on first access to the backlog.
+        @param store The models.storage.Storage of the backlog, states and reports
+        (models.storage.default_storage(), the data/ directory, by default).
 
 
             """
+        self.metrics = NULL_METRICS  # models.instrumentation.Metrics to collect timings and counters
         self.players = []
-        self.backlog = []
+        self._backlog = None
+        self._backlog_index = None
+        self.store = store if store is not None else default_storage()
+        self.session_id = DEFAULT_SESSION  # Session of the store the game is saved to, see use_store
+        self.backlog_path = None  # Optional backlog file, the backlog of the store otherwise; loaded on first access in lazy mode
         self.rules = rules  # "strict", "average", "median", etc.
+        self.deck = deck
+        self.board = VoteBoard(0) if compact else None
         self.current_feature = None
-        # Ensure the save directory exists
-        os.makedirs("data", exist_ok=True)
-
-        # Auto-create save file
-        if not os.path.exists("data/game_state.json"):
-            self.save_game_state()
-        self.load_backlog("data/backlog.json")
+        self.tally = VoteTally(deck)
+        self._bound_players = None
+        self.journal = None  # Write-ahead journal, see enable_journal
+        self.journal_seq = 0  # Last journal record applied by load_game_state
+        self.history = VoteHistory()  # Every round of every feature; give it a directory to persist it
+        self.round = 0  # Rounds played on the current feature
+        self._round_feature = None
+        self.autosaver = None  # Optional models.autosave.AutoSaver that writes the saves in the background
+        self.deadlines = None  # models.deadlines.TimerWheel of the vote deadlines, see set_vote_deadline
+        self.vote_timeout = None  # Seconds each player has to vote
+        self.timeout_policy = "joker"
+        self.timed_out = {}  # Player -> policy applied when their deadline expired this round
+        self.on_deadline = None  # Optional callback(player, policy) for the front end
+        self.report_summary = None  # models.report.ReportSummary of the last final report written
+        self.similar_tasks = None  # Optional models.similarity.SimilarityIndex of past estimates
+        self.sketch_params = None  # models.sketches.VoteSketch parameters in approximate mode, see use_sketches
+        self.pipeline = None  # models.pipeline.VotingPipeline of the features open at once, saved with the state
+        self.saved_pipeline = None  # Window read by load_game_state, to give to the next VotingPipeline
+        if not lazy:
+            # Auto-create save file
+            if not self.store.has_state(self.session_id):
+                self.backlog = []
+                self.save_game_state()
+            self.load_backlog(self.backlog_path)
         self.initialize_players(num_players)
 
+    @classmethod
+    def from_state(cls, filepath, rules="strict", deck=FIBONACCI, compact=False):
+        """@brief Create a game directly from a saved state, without the throwaway default initialization.
+        @param filepath The path to the file containing the game state (JSON or binary snapshot).
+        @param rules The voting rules to use for the game.
+        @param deck The Deck shared by all the players.
+        @param compact If True the votes of the table are stored in one shared VoteBoard array.
+        @return The loaded Game.
+        @throws FileNotFoundError if the file is not found.
+        @throws ValueError if the file is corrupted or invalid.
+        """
+        game = cls(0, rules, deck, compact, lazy=True)
+        game.load_game_state(filepath)
+        return game
+
+    @classmethod
+    def from_store(cls, store, session_id=DEFAULT_SESSION, rules=None, deck=FIBONACCI, compact=False):
+        """@brief Create a game from a session saved in a store.
+        @param store The models.storage.Storage.
+        @param session_id The identifier of the session.
+        @param rules The voting rules to use for the game, those of the session by default.
+        @param deck The Deck shared by all the players.
+        @param compact If True the votes of the table are stored in one shared VoteBoard array.
+        @return The loaded Game, saving to the same session.
+        @throws FileNotFoundError if the session does not exist.
+        """
+        rules = rules or store.session(session_id)["rules"] or "strict"
+        game = cls(0, rules, deck, compact, lazy=True, store=store)
+        game.session_id = session_id
+        game.load_game_state()
+        return game
+
+    def use_store(self, store, session_id=DEFAULT_SESSION, team=None):
+        """@brief Save the game to a session of a store.
+        @details save_game_state(), load_game_state() and save_final_report() called without
+        a path then target the session; stores that keep votes (e.g. models.sqlite_store)
+        also record every round.
+        @param store The models.storage.Storage.
+        @param session_id The identifier of the session.
+        @param team Optional name of the team, used to group the queries of the store.
+        """
+        self.store = store
+        self.session_id = session_id
+        store.create_session(session_id, self.rules, team)
+
+    def use_sketches(self, k=200, capacity=64):
+        """@brief Switch to approximate aggregation: rounds are decided from mergeable sketches.
+        @details The median is read from a quantile sketch (rank error about 1/k of the votes)
+        and the majorities from a heavy hitters summary of `capacity` counters, exact while the
+        deck has no more cards; strict and average stay exact. See models.sketches.
+        @param k Capacity of the quantile sketch, None to go back to exact aggregation.
+        @param capacity Number of counters of the heavy hitters summary.
+        """
+        self.sketch_params = None if k is None else {"k": k, "capacity": capacity}
+
+    def sketch(self, votes=()):
+        """@brief A VoteSketch with the parameters of the game, holding some votes of a round.
+        @details Shards of a large poll each sketch their own votes and the coordinator
+        combines them with decide_sketches.
+        @param votes The cards played (None for a player who did not vote).
+        @return A models.sketches.VoteSketch.
+        """
+        from models.sketches import VoteSketch
+        sketch = VoteSketch(**(self.sketch_params or {}))
+        return sketch.add_row(encode_votes(votes, self.deck))
+
     def initialize_players(self, num_players):
 
         """@brief Initialize players the psuedo names will be set externally.
         @param num_players The number of players to initialize.
             
             """
-        self.players = [Player("") for _ in range(num_players)]
-        print(f"{num_players} players have been added.")
+        self.players = []
+        for _ in range(num_players):
+            self.add_player("")
+        self.bind_players()
+        say(f"{num_players} players have been added.", level=DEBUG)
+
+    def add_player(self, pseudo):
+        """@brief Seat a new player at the table, sharing the deck (and vote board in compact mode).
+        @param pseudo The player's pseudonym.
+        @return The new Player.
+        """
+        seat = self.board.add_seat() if self.board is not None else None
+        player = Player(pseudo, self.deck, self.board, seat)
+        self.players.append(player)
+        return player
+
+    def bind_players(self):
+        """@brief Attach every player to a fresh vote tally of the table.
+        @details Must be called whenever self.players is replaced; votes already on the table are counted.
+        """
+        self.tally = VoteTally(self.deck)
+        for position, player in enumerate(self.players):
+            player.tally = self.tally
+            player.position = position
+            self.tally.add(player.current_vote)
+        self.tally.seats = len(self.players)
+        self._bound_players = self.players
+        self._record("players", pseudos=[player.pseudo for player in self.players],
+                     votes=[player.current_vote for player in self.players])
+
+    def _live_tally(self):
+        """@brief Return the tally, rebinding the players if the list was replaced or resized."""
+        if self._bound_players is not self.players or self.tally.seats != len(self.players):
+            self.bind_players()
+        return self.tally
+
+    def live_consensus(self):
+        """@brief Evaluate the rule on the votes cast so far, without rescanning the players.
+        @return A (difficulty, validated) tuple for the current state of the table.
+        """
+        return self._live_tally().verdict(self.rules)
+
+    @property
+    def backlog(self):
+        """@brief The list of tasks; assigning a new list re-indexes it."""
+        if self._backlog is None:
+            self.load_backlog(self.backlog_path)
+        return self._backlog
+
+    @backlog.setter
+    def backlog(self, tasks):
+        self._backlog = tasks
+        self._backlog_index = BacklogIndex(tasks)
+        self.metrics.set("backlog_size", len(tasks))
+        self._record("backlog", tasks=tasks)
+
+    @property
+    def backlog_index(self):
+        """@brief The BacklogIndex of the backlog (IDs, positions, pending queue)."""
+        if self._backlog is None:
+            self.load_backlog(self.backlog_path)
+        return self._backlog_index
+
+    def next_feature(self):
+        """@brief Select the first feature that is not validated yet as the current feature.
+        @return The feature, or None when the whole backlog is validated.
+        """
+        self.current_feature = self.backlog_index.next_pending()
+        return self.current_feature
+
+    def set_validated(self, feature, validated):
+        """@brief Set the validation status of a feature and keep the pending queue up to date.
+        @param feature The feature.
+        @param validated True if the feature was validated.
+        """
+        self.backlog_index.set_validated(feature, validated)
+
+    def progress(self):
+        """@brief Number of validated features and size of the backlog.
+        @return A (validated, total) tuple.
+        """
+        return self.backlog_index.validated_count(), len(self.backlog)
 
-    def load_backlog(self, filepath):
+    def all_validated(self):
+        """@brief True if every feature of the backlog is validated."""
+        return self.backlog_index.all_validated()
+
+    def load_backlog(self, filepath=None):
 
         """@brief Loads backlog items from a JSON file.
-        @param filepath The path to the JSON file containing the backlog."""
+        @param filepath The path to the JSON file containing the backlog, the backlog of the store by default."""
         try:
-            with open(filepath, "r") as file:
-                self.backlog = json.load(file).get("tasks", [])
-            print("Backlog loaded successfully.")
+            if filepath is None:
+                self.backlog = self.store.load_backlog()
+            else:
+                with open(filepath, "r") as file:
+                    self.backlog = json.load(file).get("tasks", [])
+            say("Backlog loaded successfully.", level=DEBUG)
         except FileNotFoundError:
-            print("Backlog file not found. Starting with an empty backlog.")
+            say("Backlog file not found. Starting with an empty backlog.", level=WARNING)
             self.backlog = []
 
-    def save_game_state(self, filepath="data/game_state.json"):
-
-        """@brief Save the current game state (backlog and player votes) to a file.
-        @param filepath The path to the file to save the game state."""
-
-
-        game_state = {
+    def enable_journal(self, filepath=None, snapshot_every=200):
+        """@brief Switch saving to write-ahead journal mode.
+        @details Changes are appended to the journal next to filepath as they happen;
+        save_game_state(filepath) then only flushes it, and writes a compacted
+        snapshot once snapshot_every records have accumulated.
+        @param filepath The path of the snapshot file, the state file of the store by default.
+        @param snapshot_every Number of records between two snapshots.
+        @throws ValueError if the store does not keep its states in files.
+        """
+        from models.journal import GameJournal
+        filepath = filepath or self.store.state_path(self.session_id)
+        if filepath is None:
+            raise ValueError("The journal needs a state file.")
+        self.journal = GameJournal(filepath, snapshot_every)
+        self.journal.seq = self.journal_seq
+        self.journal.snapshot(self.game_state())
+
+    def _record(self, op, **fields):
+        """@brief Append a change to the journal, if journaling is enabled."""
+        if self.journal is not None:
+            self.journal.append(op, **fields)
+
+    def _feature_index(self, feature):
+        return self.backlog_index.position(feature["id"])
+
+    def add_feature(self, task):
+        """@brief Append a task to the backlog.
+        @param task The task dict, e.g. {"description": "...", "difficulty": None}.
+        """
+        self.backlog.append(task)
+        self.metrics.set("backlog_size", len(self.backlog))
+        self._record("add_task", task=task)
+
+    def import_tasks(self, sources):
+        """@brief Merge the tasks of import sources into the backlog; descriptions already present are skipped.
+        @details The new backlog is journaled as one record.
+        @param sources A list of import sources (see models.backlog.iter_import).
+        @return A dict counting the tasks "kept", "imported" and skipped as "duplicates".
+        """
+        from models.backlog import merge_tasks
+        counts = {"kept": 0, "imported": 0, "duplicates": 0}
+        self.backlog = list(merge_tasks(self.backlog, sources, counts))
+        return counts
+
+    def game_state(self):
+        """@brief The game state (backlog and player votes) in the game_state.json layout.
+        @details With pipelined voting the open features and their votes are saved under "pipeline"
+        (see models.pipeline.VotingPipeline.state); binary snapshots do not keep them.
+        """
+        state = {
             "backlog": self.backlog,
             "players": [{"pseudo": player.pseudo, "vote": player.current_vote} for player in self.players]
         }
-        with open(filepath, "w") as file:
-            json.dump(game_state, file, indent=4)
-        print("Game state saved.")
+        if self.pipeline is not None and not self.pipeline.finished():
+            state["pipeline"] = self.pipeline.state()
+        return state
+
+    def save_game_state(self, filepath=None):
 
+        """@brief Save the current game state (backlog and player votes) to a file.
+        @details A path ending in ".snap" is written in the binary snapshot format (models.snapshot).
+        In journal mode saving to the journal's snapshot file only makes the journal durable.
+        @param filepath The path to the file to save the game state, the session of the store by default."""
+
+        filepath = filepath or self.store.state_path(self.session_id)
+        if filepath is None:
+            self.backlog_index.sync()  # Every task needs its ID in the store
+            with self.metrics.timer("save_seconds", file="store"):
+                self.store.save_state(self.session_id, self.game_state(), self.rules)
+            self.history.flush()
+            say("Game state saved.", level=DEBUG)
+            return
+        if self.journal is not None and filepath == self.journal.snapshot_path:
+            with self.metrics.timer("save_seconds", file="journal"):
+                self.journal.checkpoint(self.game_state())
+            self.history.flush()
+            say("Game state saved.", level=DEBUG)
+            return
+
+        self.history.flush()
+        self._write(filepath, self.game_state)
+        from models.journal import journal_path_for
+        stale_journal = journal_path_for(filepath)
+        if os.path.exists(stale_journal):
+            os.remove(stale_journal)  # Its records predate this state and must not be replayed over it
+        say("Game state saved.", level=DEBUG)
+
+    def _write(self, filepath, build):
+        """@brief Write a state or report file atomically, or hand it to the autosaver.
+        @details For the autosaver, the state is copied on the caller's thread (a new list of
+        shallow copies of its dicts) and only that copy is serialized on the writer thread, so the
+        caller never waits for the disk and the game can keep changing meanwhile.
+        @param filepath The path of the file; ".snap" selects the binary snapshot format.
+        @param build Function returning the dict to save; its lists of dicts are the ones copied.
+        """
+        name = os.path.basename(filepath)
+        state = build()
+        if self.autosaver is not None:
+            state = {key: [dict(item) for item in items] if isinstance(items, list) else items
+                     for key, items in state.items()}
+
+        def render():
+            if filepath.endswith(".snap"):
+                from models.snapshot import encode_snapshot
+                data = encode_snapshot(state)
+            else:
+                data = json.dumps(state, ensure_ascii=False, indent=4)
+            if self.metrics.enabled:
+                self.metrics.inc("bytes_written", len(data) if isinstance(data, bytes) else len(data.encode("utf-8")),
+                                 file=name)
+            return data
+
+        if self.autosaver is not None:
+            self.autosaver.request(filepath, render)
+            return
+        with self.metrics.timer("save_seconds", file=name):
+            data = render()
+            atomic_write(filepath, data, mode="wb" if isinstance(data, bytes) else "w")
 
     def check_for_cafe_card(self):
             """ @brief Check if all players have chosen the 'joker' card.
             @return True if all players have chosen the 'joker' card, False otherwise.
             """
-            if all(player.current_vote == "joker" for player in self.players):
-                print("All players chose the 'joker' card! Saving game state.")
+            if self._live_tally().all_joker():
+                say("All players chose the 'joker' card! Saving game state.")
                 self.save_game_state()
                 return True
             return False
 
-    def start_game(self):
+    def start_game(self, tasks=None, report_path=None, window=None):
         """@brief Main loop for running the game, where each player votes on each feature.
         @brief Process the backlog of features and collect votes from players.
         @brief Validate each feature based on the chosen rules.
         @brief Save the final report with validated features and their estimated difficulty.
+        @param tasks Optional iterable of tasks (e.g. models.backlog.iter_tasks) consumed lazily
+        instead of self.backlog; only the current feature is kept in memory and each validated
+        feature is written to the report as soon as it is estimated.
+        @param report_path The path of the final report written in streaming mode (.json, .jsonl or .csv),
+        the report file of the session of the store by default.
+        @param window Number of features open for voting at once (see models.pipeline); 1 estimates
+        the features one after the other. By default a loaded game resumes the window it was saved
+        with (Game.saved_pipeline), and 1 is used otherwise.
+        @throws ValueError in streaming mode without report_path if the store does not keep its reports in files.
 
 
         """
-        
+        if tasks is not None:
+            report_path = report_path or self.store.report_path(self.session_id)
+            if report_path is None:
+                raise ValueError("The streamed report needs a file: give report_path or a store with report files.")
+            self._start_streaming_game(tasks, report_path)
+            return
+
         # Ensure there is a backlog to process
         if not self.backlog:
-            print("No tasks in backlog to vote on.")
+            say("No tasks in backlog to vote on.", level=WARNING)
+            return
+
+        if window is None:
+            window = (self.saved_pipeline or {}).get("window", 1)
+        if window > 1:
+            self._start_pipelined_game(window)
             return
         
-        # Loop through each feature in the backlog
-        for feature in self.backlog:
-            self.current_feature = feature
-            print(f"\nCurrent feature: {feature['description']}")
-            
-            # Collect votes from each player for the current feature
-            while True:
-                self.collect_votes()
-                
-            
-                # Check the votes and validate the feature
-                if self.process_votes():
-                    feature["validated"] = True
-                    print(f"Feature '{feature['description']}' validated!")
+        # Loop through the features that are not validated yet
+        while (feature := self.next_feature()) is not None:
+            if not self._estimate_feature(feature):
+                break  # Cafe break: the state is saved
+        if self.all_validated():
+            say("\nAll features validated. Saving final report...")
+            self.save_final_report()
+
+    def _start_pipelined_game(self, window):
+        """@brief Run the game with a window of features open at once; contested features are requeued.
+        @details The window saved with a loaded game is reopened; a round where every player chose
+        the 'joker' card saves the game and stops it, as in sequential mode.
+        """
+        from models.pipeline import VotingPipeline
+        pipeline = VotingPipeline(self, window, self.saved_pipeline)
+        while not pipeline.finished():
+            say("\nOpen features: %s", ", ".join(f"'{feature['description']}'" for feature in pipeline.features()))
+            for feature in pipeline.features():
+                self.current_feature = feature
+                verdict = None
+                for player in pipeline.waiting(feature["id"]):
+                    while True:
+                        card = input(f"{player.pseudo}, choose a card for '{feature['description']}' "
+                                     f"({', '.join(player.cards)}): ")
+                        try:
+                            verdict = pipeline.vote(player, feature["id"], card)
+                            break
+                        except ValueError as e:
+                            print(e)  # Ask for input again if card is invalid
+                if verdict is not None and verdict["cafe"]:
+                    say("All players chose the 'joker' card! Saving game state.")
+                    self.save_game_state()
+                    return
+                if verdict is not None and not verdict["validated"]:
+                    say("Feature '%s' not validated, requeued.", feature["description"])
+            self.save_game_state()
+        if self.all_validated():
+            say("\nAll features validated. Saving final report...")
+            self.save_final_report()
+
+    def _start_streaming_game(self, tasks, report_path):
+        """@brief Run the game over a lazy task source, flushing validated features to the report.
+        @details On a cafe break the saved state holds the current feature and the rest of the
+        stream, so the game resumes from a plain load; the features estimated before the break
+        go to a partial report (models.report.partial_path_for) and the previous report is kept.
+        """
+        from models.report import partial_path_for, report_writer
+
+        def numbered(tasks):
+            # Running ID from the stream (IDs already present are kept), so that the rounds,
+            # the vote history and the report tell the features apart
+            next_id = 1
+            for feature in tasks:
+                if not isinstance(feature.get("id"), int):
+                    feature["id"] = next_id
+                next_id = max(next_id, feature["id"]) + 1
+                yield feature
+
+        tasks = numbered(tasks)
+        with report_writer(report_path, self.deck) as report:
+            for feature in tasks:
+                # The backlog only holds the window of features being estimated
+                self.backlog = [feature]
+                if not self._estimate_feature(feature):
+                    # Cafe break: save what is left of the stream to resume from
+                    self.backlog = [feature, *tasks]
+                    self.save_game_state()
+                    report.filepath = partial_path_for(report_path)
                     break
-                else: # Revote required
-                    feature["validated"] = False
-                    print(f"Feature '{feature['description']}' not validated.")
+                report.write(feature, self.round)
+            if not report.count:
+                say("No tasks in backlog to vote on.", level=WARNING)
+        self.report_summary = report.summary
+        self.history.flush()
+        say("Final report saved.", level=DEBUG)
+
+    def _estimate_feature(self, feature):
+        """@brief Collect votes on a feature until the rules validate it.
+        @param feature The feature to estimate.
+        @return True once the feature is validated, False if every player chose the 'joker' (cafe) card.
+        """
+        self.current_feature = feature
+        say("\nCurrent feature: %s", feature["description"])
+        for suggestion in self.suggestions(feature):
+            say("  Similar past task: '%s' (difficulty %g)", suggestion["description"], suggestion["difficulty"])
 
-                    print("Please revote:")
-                    self.reset_votes()
+        # Collect votes from each player for the current feature
+        while True:
+            self.collect_votes()
 
-            # If all players chose the cafe card, save the state
+            # If all players chose the cafe card, save the state before process_votes resets the votes
             if self.check_for_cafe_card():
-                break
-        if all(task.get("validated", False) for task in self.backlog):
-            print("\nAll features validated. Saving final report...")
-            self.save_final_report()
-    
+                return False
+
+            # Check the votes and validate the feature
+            if self.process_votes():
+                self.set_validated(feature, True)
+                say("Feature '%s' validated!", feature["description"])
+                return True
+            else: # Revote required
+                self.set_validated(feature, False)
+                if self.journal is not None:
+                    self._record("validate", feature=self._feature_index(feature), validated=False, difficulty=None)
+                say("Feature '%s' not validated.", feature["description"])
+
+                say("Please revote:")
+                self.reset_votes()
+
+    def suggestions(self, feature, k=3):
+        """@brief Past tasks most similar to a feature, with their difficulty.
+        @param feature The feature.
+        @param k The number of suggestions.
+        @return A list of {"description", "difficulty", "similarity"} dicts, empty without a similarity index.
+        """
+        if self.similar_tasks is None:
+            return []
+        return self.similar_tasks.suggest(feature["description"], k)
+
     def reset_votes(self):
         """@brief Reset the votes for all players to allow revoting.
         """
         for player in self.players:
             player.reset_vote()
+        if self.deadlines is not None:
+            for player in self.players:
+                self.deadlines.cancel(player)
+        self.timed_out = {}
+        self._record("reset")
+
+    def set_vote_deadline(self, timeout, policy="joker", wheel=None):
+        """@brief Give every player a limited time to vote.
+        @param timeout Seconds each player has to vote, None to disable the deadlines.
+        @param policy What happens when a deadline expires, one of models.deadlines.POLICIES.
+        @param wheel The TimerWheel to use, shared by several games; a new one by default.
+        @throws ValueError if the policy is unknown.
+        """
+        from models.deadlines import POLICIES, TimerWheel
+        if policy not in POLICIES:
+            raise ValueError(f"Invalid timeout policy: {policy}")
+        self.vote_timeout = timeout
+        self.timeout_policy = policy
+        if wheel is not None:
+            self.deadlines = wheel
+        elif self.deadlines is None:
+            self.deadlines = TimerWheel()
+
+    def arm_deadline(self, player):
+        """@brief Start the vote deadline of a player who has not voted yet (no-op without deadlines)."""
+        if self.vote_timeout and self.deadlines is not None and player.vote_code == NO_VOTE:
+            self.deadlines.arm(player, self.vote_timeout, lambda: self._deadline_expired(player))
+
+    def arm_deadlines(self):
+        """@brief Start the vote deadlines of every player, for tables where everybody votes at once."""
+        for player in self.players:
+            self.arm_deadline(player)
+
+    def _deadline_expired(self, player):
+        """@brief Apply the timeout policy to a player who did not vote in time."""
+        policy = self.timeout_policy
+        if policy == "joker":
+            self.cast_vote(player, "joker")
+        self.timed_out[player] = policy
+        say("Time is up for %s! (%s)", player.pseudo, policy)
+        if self.on_deadline is not None:
+            self.on_deadline(player, policy)
+
+    def remaining_time(self, player=None):
+        """@brief Seconds left to vote.
+        @param player A player, or None for the whole round (the last deadline still pending).
+        @return The remaining time, or None if there is no pending deadline.
+        """
+        if self.deadlines is None:
+            return None
+        if player is not None:
+            return self.deadlines.remaining(player)
+        remaining = [self.deadlines.remaining(player) for player in self.waiting_players()]
+        remaining = [seconds for seconds in remaining if seconds is not None]
+        return max(remaining) if remaining else None
+
+    def waiting_players(self):
+        """@brief Players who have neither voted nor timed out in this round."""
+        return [player for player in self.players if player.vote_code == NO_VOTE and player not in self.timed_out]
+
+    def round_complete(self):
+        """@brief True once every player has voted or timed out."""
+        if self._live_tally().voters + len(self.timed_out) < len(self.players):
+            return False  # Somebody has not voted yet, no need to scan the table
+        return not self.waiting_players()
+
+    def cast_vote(self, player, card):
+        """@brief Record a player's vote for the current feature.
+        @details The vote cancels the player's deadline; a late vote replaces the timeout policy.
+        @param player The voting player.
+        @param card The card chosen by the player.
+        @throws ValueError if the card is not in the player's list of cards.
+        """
+        player.vote(card)
+        if self.deadlines is not None:
+            self.deadlines.cancel(player)
+            self.timed_out.pop(player, None)
+        self.metrics.inc("votes", player=player.pseudo)
+        if self.journal is not None:
+            self._live_tally()  # Rebinds, and so renumbers, the players if the list was replaced
+            self._record("vote", player=player.position, card=card)
 
 
     def collect_votes(self):
@@ -137,119 +619,212 @@ class Game:
         
         """
         for player in self.players:
+            start = time.perf_counter()
+            self.arm_deadline(player)
             while True:
-                #Game.timeout(player.pseudo)
                 print(f"{player.pseudo}, available cards: {', '.join(player.cards)}")
-                card = input(f"{player.pseudo}, choose a card: ")
+                remaining = self.remaining_time(player)
+                if remaining is None:
+                    card = input(f"{player.pseudo}, choose a card: ")
+                else:
+                    card = input(f"{player.pseudo}, choose a card ({remaining:.0f}s left): ")
+                    self.deadlines.advance()
+                    if player in self.timed_out:
+                        break  # Too late: the timeout policy was applied
                 try:
-                    player.vote(card)
+                    self.cast_vote(player, card)
+                    self.metrics.observe("vote_latency_seconds", time.perf_counter() - start, player=player.pseudo)
                     break  # Exit the loop if the vote is valid
                 except ValueError as e:
                     print(e)  # Ask for input again if card is invalid
 
     def process_votes(self):
         """Process the votes based on the chosen rules."""
-        print("\nVotes collected:")
-        votes = [player.current_vote for player in self.players]
-        print(f"Votes: {votes}")
-
-        difficulty = None
-        validated = False  # Default validation status
-
-        if self.rules == "strict":
-            # Unanimity: All votes must be the same
-            if len(set(votes)) == 1:
-                difficulty = int(votes[0])
-                validated = True
-        
-        elif self.rules == "average" :
-
-            # Average: Compute the mean of all numerical votes
-            valid_votes = [int(vote) for vote in votes if vote.isdigit()]
-            if valid_votes:
-                difficulty = sum(valid_votes) / len(valid_votes)
-                validated = True
-        elif self.rules == "median" :
-            # Median: Compute the median of all numerical votes
-            valid_votes = sorted(int(vote) for vote in votes if vote.isdigit())
-            if valid_votes:
-                mid = len(valid_votes) // 2
-                difficulty = (valid_votes[mid] + valid_votes[-mid - 1]) / 2 if len(valid_votes) % 2 == 0 else valid_votes[mid]
-                validated = True
-        elif self.rules == "absolute_majority" :
-            # Absolute Majority: One vote must have > 50% of total votes
-            from collections import Counter
-            vote_count = Counter(votes)
-            max_vote, max_count = vote_count.most_common(1)[0]
-            if max_count > len(votes) / 2:
-                difficulty = int(max_vote)
-                validated = True
-        elif self.rules == "relative_majority":
-            # Relative Majority: The most frequent vote wins
-            from collections import Counter
-            vote_count = Counter(votes)
-            max_vote, _ = vote_count.most_common(1)[0]
-            difficulty = int(max_vote)
-            validated = True
+        say("\nVotes collected:", level=DEBUG)
+        votes = [player.current_vote for player in self.players if self.timed_out.get(player) != "skip"]
+        say("Votes: %s", votes, level=DEBUG)
 
-        # Update feature if validated
-        if validated and difficulty is not None:
-            self.current_feature["validated"] = True
-            self.current_feature["difficulty"] = difficulty
-            print(f"Feature '{self.current_feature['description']}' validated with difficulty: {difficulty}")
-        else:
-            print("Feature not validated. Revote required.")
+        self._record_round()
+        _, validated = self.decide(self.current_feature, votes, self.round)
 
         # Reset votes for next round
-        for player in self.players:
-            player.reset_vote()
+        self.reset_votes()
 
         return validated
 
-    def load_game_state(self, filepath):
+    def decide(self, feature, votes, rounds):
+        """@brief Apply the rules to one round of votes on a feature and validate it if they agree.
+        @param feature The feature voted on.
+        @param votes The cards played, in seating order (None for a player who did not vote).
+        @param rounds The number of rounds played on the feature, this one included.
+        @return The (difficulty, validated) verdict of the rules.
+        """
+        with self.metrics.timer("process_votes_seconds", rule=self.rules):
+            if self.sketch_params is not None:
+                difficulty, validated = self.sketch(votes).verdict(self.rules)
+            else:
+                # Single-row call of aggregate_votes so every path shares the rules
+                difficulty, validated = aggregate_votes([encode_votes(votes, self.deck)], self.rules)[0]
+        return self._conclude(feature, difficulty, validated, rounds)
+
+    def decide_sketches(self, feature, sketches, rounds):
+        """@brief Decide one round of a feature from the partial sketches of its votes.
+        @param feature The feature voted on.
+        @param sketches The models.sketches.VoteSketch of every shard of the round (see sketch).
+        @param rounds The number of rounds played on the feature, this one included.
+        @return The (difficulty, validated) verdict of the rules.
+        """
+        from models.sketches import merge_sketches
+        with self.metrics.timer("process_votes_seconds", rule=self.rules):
+            difficulty, validated = merge_sketches(sketches).verdict(self.rules)
+        return self._conclude(feature, difficulty, validated, rounds)
+
+    def _conclude(self, feature, difficulty, validated, rounds):
+        """@brief Validate a feature if the verdict of its round agrees."""
+        # Update feature if validated
+        if validated and difficulty is not None:
+            self.set_validated(feature, True)
+            feature["difficulty"] = difficulty
+            self.metrics.observe("rounds_per_feature", rounds, rule=self.rules)
+            if self.journal is not None:
+                self._record("validate", feature=self._feature_index(feature), validated=True, difficulty=difficulty)
+            say("Feature '%s' validated with difficulty: %s", feature["description"], difficulty)
+        else:
+            say("Feature not validated. Revote required.")
+        return difficulty, validated
+
+    def _record_round(self):
+        """@brief Append the votes of the round to the vote history."""
+        feature_id = self.current_feature.get("id") if self.current_feature else None
+        if not isinstance(feature_id, int):
+            feature_id = -1
+        if feature_id != self._round_feature:
+            self._round_feature = feature_id
+            self.round = 0
+        self.round += 1
+        self.record_round(feature_id, self.round, [player.current_vote for player in self.players],
+                          [player.vote_code for player in self.players])
+
+    def record_round(self, feature_id, round_number, votes, codes=None, timestamp=None):
+        """@brief Append one round of votes to the vote history, and to the store if it keeps votes.
+        @param feature_id The stable ID of the feature.
+        @param round_number The round number for this feature.
+        @param votes The cards played, in seating order (None for a player who did not vote).
+        @param codes Optional card codes of the votes, computed from the deck otherwise.
+        @param timestamp Optional time of the round for the store, the current time by default.
+        """
+        if codes is None:
+            codes = [NO_VOTE if vote is None else self.deck.code(vote) for vote in votes]
+        self.history.record_round(feature_id, round_number, codes)
+        if self.store.records_votes:
+            self.store.add_votes(self.session_id, feature_id, round_number,
+                                 [(player.pseudo, vote, self.deck.value(vote)) for player, vote in zip(self.players, votes)],
+                                 timestamp)
+
+    def load_game_state(self, filepath=None):
         """@brief Load the game state from a file.
-        @param filepath The path to the file containing the game state.
-        @throws FileNotFoundError if the file is not found.
+        @details JSON files and binary snapshots are both accepted (detected from the file header).
+        If a journal exists next to the file, its records are replayed on top of it.
+        @param filepath The path to the file containing the game state, the session of the store by default.
+        @throws FileNotFoundError if the file (or the session) is not found.
         @throws ValueError if the file is corrupted or invalid.
         """ 
+        from models.journal import journal_path_for, replay
+        from models.snapshot import is_snapshot, read_snapshot
+        filepath = filepath or self.store.state_path(self.session_id)
+        from_store = filepath is None
+        start = time.perf_counter()
         try: # Load the game state from a file
-            with open(filepath, "r") as file:
-                data = json.load(file)
+            if from_store:
+                data = self.store.load_state(self.session_id)
+            else:
+                if is_snapshot(filepath):
+                    data = read_snapshot(filepath)
+                else:
+                    with open(filepath, "r", encoding="utf-8") as file:
+                        data = json.load(file)
+                self.journal_seq = replay(data, journal_path_for(filepath))
              # Load backlog
             self.backlog = data.get("backlog", [])
             if not self.backlog:
-                print("Backlog is empty in the save file.")
+                say("Backlog is empty in the save file.", level=WARNING)
 
             self.players = []
+            if self.board is not None:
+                self.board = VoteBoard(0)
             for player_data in data.get("players", []):
-                player = Player(player_data["pseudo"])
+                player = self.add_player(player_data["pseudo"])
                 player.current_vote = player_data.get("vote", "")
-                self.players.append(player)
-
-            print("Game state loaded successfully.")
+            self.bind_players()
+            self.saved_pipeline = data.get("pipeline")
+            if self.metrics.enabled:
+                name = "store" if from_store else os.path.basename(filepath)
+                self.metrics.observe("load_seconds", time.perf_counter() - start, file=name)
+                if not from_store:
+                    self.metrics.inc("bytes_read", os.path.getsize(filepath), file=name)
+
+            say("Game state loaded successfully.", level=DEBUG)
         except FileNotFoundError:
             raise FileNotFoundError("Le fichier de sauvegarde est introuvable.")
         except json.JSONDecodeError:
             raise ValueError("Le fichier de sauvegarde est corrompu ou invalide.")
         if not self.backlog:
-            print("No tasks in backlog to vote on.")
+            say("No tasks in backlog to vote on.", level=WARNING)
             return
 
         if not self.players:
-            print("No players loaded. Please start a new game.")
+            say("No players loaded. Please start a new game.", level=WARNING)
             return
 
 
-    def save_final_report(self, filepath="data/final_report.json"):
+    def save_final_report(self, filepath=None):
         """@brief Save the final report of validated features with their estimated difficulty.
-        @param filepath The path to the file to save the final report.
-        
+        @details The report is streamed one task at a time in the format of its extension (".json",
+        ".jsonl", ".csv", see models.report) and its summary is computed in the same pass; a path
+        ending in ".snap" is written in the binary snapshot format (models.snapshot). With an
+        autosaver the report and its summary are rendered from copies of the tasks on its thread.
+        @param filepath The path to the file to save the final report, the session of the store by default.
         """
-        report = {"tasks": self.backlog}  # Save validated tasks only
-        print("Saving final report:", report)  # Debug print
-        
-        with open(filepath, "w", encoding="utf-8") as file:
-            json.dump(report, file, ensure_ascii=False, indent=4)
-        print("Final report saved.")
-            
-    
\ No newline at end of file
+        from models.report import ReportSummary, report_writer, summary_path_for
+        self.history.flush()
+        # Only the rounds recorded since the history was opened: IDs restart with every backlog
+        rounds = self.history.rounds_to_consensus(self.history.start) if len(self.history) else {}
+        filepath = filepath or self.store.report_path(self.session_id)
+        if filepath is None or filepath.endswith(".snap"):
+            if filepath is None:
+                self.backlog_index.sync()
+                with self.metrics.timer("save_seconds", file="store"):
+                    self.store.save_state(self.session_id, self.game_state(), self.rules)
+                    self.store.save_report(self.session_id, self.backlog, rounds)
+            else:
+                self._write(filepath, lambda: {"tasks": self.backlog})
+            summary = ReportSummary(self.deck)
+            for task in self.backlog:
+                summary.add(task, rounds.get(task.get("id")))
+        elif self.autosaver is not None:
+            tasks = [dict(task) for task in self.backlog]
+            summary = ReportSummary(self.deck)
+            for task in tasks:
+                summary.add(task, rounds.get(task.get("id")))
+
+            def render():
+                import io
+                text = io.StringIO()
+                with report_writer(filepath, self.deck, text) as report:
+                    for task in tasks:
+                        report.write(task, rounds.get(task.get("id")))
+                return text.getvalue()
+
+            self.autosaver.request(filepath, render)
+            self.autosaver.request(summary_path_for(filepath),
+                                   json.dumps(summary.to_dict(), ensure_ascii=False, indent=4))
+        else:
+            with self.metrics.timer("save_seconds", file=os.path.basename(filepath)):
+                with report_writer(filepath, self.deck) as report:
+                    for task in self.backlog:
+                        report.write(task, rounds.get(task.get("id")))
+            summary = report.summary
+        self.report_summary = summary
+        if self.similar_tasks is not None:
+            self.similar_tasks.add_tasks(self.backlog)
+        say("Final report saved.", level=DEBUG)
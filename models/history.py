@@ -0,0 +1,156 @@
+from array import array
+import os
+import time
+from models.deck import NO_VOTE
+
+
+## @file history.py
+#  @brief Columnar store of every vote of every round.
+#
+#  Each column (feature ID, round, player index, card code, timestamp) is an
+#  array of fixed-size numbers. On disk every column is a raw binary file in
+#  the history directory; saved columns are memory-mapped and read in place,
+#  while new rows are kept in memory until flush() appends them. Feature IDs
+#  restart with every backlog, so the rows saved before the history was
+#  opened (earlier games) can be left out of the queries (see start).
+
+COLUMNS = (
+    ("feature", "q"),
+    ("round", "H"),
+    ("player", "I"),
+    ("code", "b"),
+    ("timestamp", "d"),
+)
+
+
+class VoteHistory:
+    """
+    @class VoteHistory
+    @brief Array-backed history of votes with memory-mapped persistence and query helpers.
+    """
+
+    def __init__(self, directory=None):
+        """@brief Constructor for the VoteHistory class.
+        @param directory Optional directory of the column files (e.g. data/history); the history
+        stays in memory only if None.
+        """
+        self.directory = directory
+        self.pending = {name: array(typecode) for name, typecode in COLUMNS}
+        self.mapped = {name: memoryview(b"").cast(typecode) for name, typecode in COLUMNS}
+        self._maps = []
+        if directory is not None:
+            self._map()
+        self.start = len(self)  # First row recorded since the history was opened
+
+    def _column_path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _map(self):
+        """@brief Memory-map the column files saved on disk."""
+        import mmap
+        sizes = set()
+        for name, typecode in COLUMNS:
+            path = self._column_path(name)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            with open(path, "rb") as file:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append(mapping)
+            self.mapped[name] = memoryview(mapping).cast(typecode)
+            sizes.add(len(self.mapped[name]))
+        if len(sizes) > 1:
+            self.close()
+            raise ValueError("Le fichier d'historique est corrompu ou invalide.")
+
+    def close(self):
+        """@brief Release the memory maps."""
+        for name, typecode in COLUMNS:
+            self.mapped[name].release()
+            self.mapped[name] = memoryview(b"").cast(typecode)
+        for mapping in self._maps:
+            mapping.close()
+        self._maps = []
+
+    def __len__(self):
+        return len(self.mapped["feature"]) + len(self.pending["feature"])
+
+    def record_round(self, feature_id, round_number, codes, timestamp=None):
+        """@brief Record the votes of one round.
+        @param feature_id The stable ID of the feature.
+        @param round_number The round number for this feature (1 for the first vote).
+        @param codes The card code of every player, in seating order (NO_VOTE if the player did not vote).
+        @param timestamp The time of the round, time.time() by default.
+        """
+        codes = array("b", codes)
+        count = len(codes)
+        pending = self.pending
+        pending["feature"].extend(array("q", [feature_id]) * count)
+        pending["round"].extend(array("H", [round_number]) * count)
+        pending["player"].extend(array("I", range(count)))
+        pending["code"].extend(codes)
+        pending["timestamp"].extend(array("d", [time.time() if timestamp is None else timestamp]) * count)
+
+    def flush(self):
+        """@brief Append the rows recorded since the last flush to the column files."""
+        if self.directory is None or not len(self.pending["feature"]):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.close()
+        for name, typecode in COLUMNS:
+            with open(self._column_path(name), "ab") as file:
+                self.pending[name].tofile(file)
+            self.pending[name] = array(typecode)
+        self._map()
+
+    def rows(self, *names, start=0):
+        """@brief Iterate over the rows, restricted to some columns.
+        @param names The column names, e.g. ("feature", "round").
+        @param start Index of the first row, e.g. self.start for the rows of the current game only.
+        @return A generator of tuples, saved rows first.
+        """
+        saved = len(self.mapped["feature"])
+        yield from zip(*(self.mapped[name][min(start, saved):] for name in names))
+        yield from zip(*(self.pending[name][max(0, start - saved):] for name in names))
+
+    def rounds_to_consensus(self, start=0):
+        """@brief Number of rounds each feature needed.
+        @param start Index of the first row counted, self.start to leave out the earlier games.
+        @return A dict mapping each feature ID to its last recorded round.
+        """
+        rounds = {}
+        for feature_id, round_number in self.rows("feature", "round", start=start):
+            if round_number > rounds.get(feature_id, 0):
+                rounds[feature_id] = round_number
+        return rounds
+
+    def vote_spread(self, deck):
+        """@brief Spread (highest minus lowest numeric vote) of every round.
+        @param deck The Deck giving the value of each card code.
+        @return A dict mapping (feature ID, round) to the spread.
+        """
+        values = deck.values
+        bounds = {}
+        for feature_id, round_number, code in self.rows("feature", "round", "code"):
+            if code == NO_VOTE or values[code] is None:
+                continue
+            value = values[code]
+            key = (feature_id, round_number)
+            low, high = bounds.get(key, (value, value))
+            bounds[key] = (min(low, value), max(high, value))
+        return {key: high - low for key, (low, high) in bounds.items()}
+
+    def player_deviation(self, estimates, deck):
+        """@brief Mean absolute deviation of each player's votes from the final estimates.
+        @param estimates A dict mapping feature IDs to their final difficulty.
+        @param deck The Deck giving the value of each card code.
+        @return A dict mapping each player index to its mean deviation.
+        """
+        values = deck.values
+        totals = {}
+        for feature_id, player, code in self.rows("feature", "player", "code"):
+            estimate = estimates.get(feature_id)
+            if estimate is None or code == NO_VOTE or values[code] is None:
+                continue
+            total, count = totals.get(player, (0, 0))
+            totals[player] = (total + abs(values[code] - estimate), count + 1)
+        return {player: total / count for player, (total, count) in totals.items()}
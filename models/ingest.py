@@ -0,0 +1,235 @@
+from collections import Counter
+import json
+import sys
+from models.deck import FIBONACCI
+from models.instrumentation import quiet
+from models.storage import DEFAULT_SESSION
+
+
+## @file ingest.py
+#  @brief Bulk ingestion of recorded vote events (chat bots, forms...).
+#
+#  A JSON Lines stream of events such as
+#      {"session": "s1", "feature": 3, "player": "alice", "card": "5", "ts": 1718000000.0}
+#  is applied to the games of the store without any prompt: every pending
+#  feature of a session is open at once (models.pipeline), so the events of
+#  a session may come in any order, and a round is decided by the rules of
+#  the session as soon as every player has voted on the feature ("ts" is
+#  then the time recorded for the round). A player voting twice in a round
+#  changes their card. The game messages are silenced while ingesting.
+#  The games are saved at the end of the stream; the votes of a round that
+#  is still incomplete then are not kept.
+#
+#  Events that cannot be applied (invalid JSON, missing field, unknown
+#  session or player, card not in the deck, feature not open) are counted by
+#  reason and can be written to a JSON Lines file of rejected events.
+
+REQUIRED_FIELDS = ("feature", "player", "card")
+
+
+class IngestReport:
+    """
+    @class IngestReport
+    @brief Counters of an ingestion and the events it rejected.
+    """
+
+    def __init__(self, rejected_file=None, samples=20):
+        """@brief Constructor for the IngestReport class.
+        @param rejected_file Optional text file each rejected event is written to, as a JSON line.
+        @param samples The number of rejected events kept in memory as examples.
+        """
+        self.accepted = 0
+        self.rounds = 0
+        self.validated = 0
+        self.reasons = Counter()  # Reason -> number of rejected events
+        self.samples = []  # First rejected events: {"line", "reason", "event"}
+        self.max_samples = samples
+        self.rejected_file = rejected_file
+
+    @property
+    def rejected(self):
+        """@brief Number of rejected events."""
+        return sum(self.reasons.values())
+
+    def reject(self, line, reason, event):
+        """@brief Record a rejected event.
+        @param line The line number of the event in its source.
+        @param reason Why the event was rejected.
+        @param event The parsed event, or the raw line if it is not valid JSON.
+        """
+        self.reasons[reason] += 1
+        entry = {"line": line, "reason": reason, "event": event}
+        if len(self.samples) < self.max_samples:
+            self.samples.append(entry)
+        if self.rejected_file is not None:
+            self.rejected_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        """@brief One line describing the ingestion."""
+        text = (f"{self.accepted} votes applied, {self.rounds} rounds decided, {self.validated} features validated, "
+                f"{self.rejected} events rejected")
+        if self.reasons:
+            text += " (" + ", ".join(f"{reason}: {count}" for reason, count in self.reasons.most_common()) + ")"
+        return text + "."
+
+
+class VoteIngestor:
+    """
+    @class VoteIngestor
+    @brief Applies vote events to the games of the sessions of a store.
+    """
+
+    def __init__(self, store, rules=None, deck=FIBONACCI, players=None, report=None):
+        """@brief Constructor for the VoteIngestor class.
+        @param store The models.storage.Storage the sessions are loaded from and saved to.
+        @param rules The voting rules, those of each session by default (see Game.from_store).
+        @param deck The Deck the cards are checked against.
+        @param players Optional pseudos seated in new sessions and in sessions saved without players.
+        @param report The IngestReport to fill, a new one by default.
+        """
+        self.store = store
+        self.rules = rules
+        self.deck = deck
+        self.players = players or []
+        self.report = report or IngestReport()
+        self.sessions = {}  # Session ID -> (game, pipeline, {pseudo: Player}), None for an unknown session
+
+    def add_game(self, session_id, game):
+        """@brief Ingest the events of a session into a game that is already loaded.
+        @param session_id The session ID of the events.
+        @param game The Game; it must have its players.
+        @return The entry of the session.
+        """
+        from models.pipeline import VotingPipeline
+        if not game.players:
+            for pseudo in self.players:
+                game.add_player(pseudo)
+            game.bind_players()
+        # Every pending feature is open: the events of a session come in any order
+        pipeline = VotingPipeline(game, max(1, len(game.backlog)))
+        self.sessions[session_id] = entry = (game, pipeline, {player.pseudo: player for player in game.players})
+        return entry
+
+    def _session(self, session_id):
+        """@brief The entry of a session, loaded from the store on its first event.
+        @details A session without saved state starts from the backlog of the store when
+        players to seat were given; it is unknown otherwise.
+        @return The entry, None if the session is unknown.
+        """
+        from models.game import Game
+        try:
+            game = Game.from_store(self.store, session_id, self.rules, self.deck)
+        except FileNotFoundError:
+            if not self.players:
+                self.sessions[session_id] = None
+                return None
+            game = Game(0, self.rules or "strict", self.deck, lazy=True, store=self.store)
+            game.use_store(self.store, session_id)
+        return self.add_game(session_id, game)
+
+    def apply(self, event, line=0):
+        """@brief Apply one event, or record why it is rejected.
+        @param event The event dict.
+        @param line The line number of the event, for the report.
+        @return True if the vote was applied.
+        """
+        report = self.report
+        if not isinstance(event, dict):
+            report.reject(line, "not an object", event)
+            return False
+        for field in REQUIRED_FIELDS:
+            if event.get(field) is None:
+                report.reject(line, f"missing {field}", event)
+                return False
+        session_id = event.get("session", DEFAULT_SESSION)
+        if not isinstance(session_id, (str, int)):
+            report.reject(line, "unknown session", event)
+            return False
+        entry = self.sessions[session_id] if session_id in self.sessions else self._session(session_id)
+        if entry is None:
+            report.reject(line, "unknown session", event)
+            return False
+        game, pipeline, players = entry
+        player = players.get(event["player"]) if isinstance(event["player"], str) else None
+        if player is None:
+            report.reject(line, "unknown player", event)
+            return False
+        card = event["card"]
+        if not isinstance(card, str):
+            card = str(card)
+        if card not in self.deck.codes:
+            report.reject(line, "invalid card", event)
+            return False
+        feature_id = event["feature"]
+        if isinstance(feature_id, str) and feature_id.isdigit():
+            feature_id = int(feature_id)
+        if not isinstance(feature_id, int) or feature_id not in pipeline.open:
+            report.reject(line, "feature not open", event)
+            return False
+        result = pipeline.vote(player, feature_id, card, event.get("ts"))
+        report.accepted += 1
+        if result is not None:
+            report.rounds += 1
+            report.validated += result["validated"]
+        return True
+
+    def ingest(self, lines):
+        """@brief Apply a stream of JSON Lines events with the game messages silenced.
+        @param lines An iterable of lines (str or bytes); blank lines are skipped.
+        @return The IngestReport.
+        """
+        decode = json.JSONDecoder().decode  # Skips the encoding detection of json.loads
+        apply = self.apply
+        with quiet():
+            for number, line in enumerate(lines, 1):
+                if isinstance(line, bytes):
+                    line = line.decode("utf-8", "replace")
+                if not line or line.isspace():
+                    continue
+                try:
+                    event = decode(line)
+                except ValueError:
+                    self.report.reject(number, "invalid JSON", line.rstrip("\r\n"))
+                    continue
+                apply(event, number)
+        return self.report
+
+    def save(self):
+        """@brief Save the game of every session to the store, and the final report of the finished ones."""
+        with quiet():
+            for entry in self.sessions.values():
+                if entry is None:
+                    continue
+                game = entry[0]
+                game.save_game_state()
+                if game.all_validated():
+                    game.save_final_report()
+        self.store.flush()
+
+
+def ingest_events(sources, store, rules=None, deck=FIBONACCI, players=None, rejected_path=None):
+    """@brief Apply the vote events of JSON Lines sources to the sessions of a store and save them.
+    @param sources A list of paths, "-" for stdin, or iterables of lines.
+    @param store The models.storage.Storage holding the sessions.
+    @param rules The voting rules, those of each session by default.
+    @param deck The Deck the cards are checked against.
+    @param players Optional pseudos seated in new sessions and in sessions saved without players.
+    @param rejected_path Optional JSON Lines file the rejected events are written to.
+    @return The IngestReport.
+    """
+    rejected_file = open(rejected_path, "w", encoding="utf-8") if rejected_path else None
+    try:
+        ingestor = VoteIngestor(store, rules, deck, players, IngestReport(rejected_file))
+        for source in sources:
+            if not isinstance(source, str):
+                ingestor.ingest(source)
+            elif source == "-":
+                ingestor.ingest(sys.stdin.buffer if hasattr(sys.stdin, "buffer") else sys.stdin)
+            else:
+                with open(source, "rb") as file:
+                    ingestor.ingest(file)
+        ingestor.save()
+    finally:
+        if rejected_file is not None:
+            rejected_file.close()
+    return ingestor.report
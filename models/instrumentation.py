@@ -0,0 +1,282 @@
+import json
+import time
+from models.storage import atomic_write
+
+
+## @file instrumentation.py
+#  @brief Counters, gauges and timers for the game core, and the console/logging switch.
+#
+#  A Game reports to game.metrics, which is NULL_METRICS by default: every
+#  call is then an empty method, so the hot paths pay almost nothing. Attach
+#  a Metrics to collect values, and give it a JsonSink or PrometheusSink to
+#  dump them to disk with export().
+#
+#  The messages of Game and Player go through say(): printed by default,
+#  sent to the "planning_poker" logger after use_logging(), where they can be
+#  filtered by level (e.g. silenced under load). The logging module itself
+#  is only imported once the messages are logged, to keep the import of the
+#  game core fast.
+
+DEBUG, INFO, WARNING = 10, 20, 30  # The levels of the logging module
+_logger = None
+_use_logging = False
+
+
+def get_logger():
+    """@brief The "planning_poker" logger the game messages go to after use_logging()."""
+    global _logger
+    if _logger is None:
+        import logging
+        _logger = logging.getLogger("planning_poker")
+    return _logger
+
+
+def use_logging(enabled=True):
+    """@brief Route the game messages to the "planning_poker" logger instead of print().
+    @param enabled False to go back to print().
+    """
+    global _use_logging
+    _use_logging = enabled
+
+
+class _Quiet:
+    __slots__ = ("level", "previous")
+
+    def __init__(self, level):
+        self.level = level
+
+    def __enter__(self):
+        global _use_logging
+        logger = get_logger()
+        self.previous = _use_logging, logger.level
+        _use_logging = True
+        logger.setLevel(self.level)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        global _use_logging
+        _use_logging = self.previous[0]
+        get_logger().setLevel(self.previous[1])
+
+
+def quiet(level=WARNING):
+    """@brief Silence the game messages below a level for the duration of a with block.
+    @details Messages then go to the "planning_poker" logger (see use_logging) and are
+    dropped before being formatted, so bulk processing pays almost nothing for them.
+    @param level The lowest level still emitted.
+    """
+    return _Quiet(level)
+
+
+def say(message, *args, level=INFO):
+    """@brief Print a game message, or log it at the given level after use_logging().
+    @param message The message; like with logging, %-style args are only formatted if the message is emitted.
+    @param level The logging level of the message.
+    """
+    if _use_logging:
+        (_logger or get_logger()).log(level, message, *args)
+    else:
+        print(message % args if args else message)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class Metrics:
+    """
+    @class Metrics
+    @brief Thread-safe registry of labelled counters, gauges and timers.
+    """
+
+    enabled = True
+
+    def __init__(self, sink=None):
+        """@brief Constructor for the Metrics class.
+        @param sink Optional JsonSink or PrometheusSink used by export().
+        """
+        self.sink = sink
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> last value
+        self.timers = {}  # (name, labels) -> [count, sum, max]
+        import threading
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """@brief Add value to a counter."""
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """@brief Set a gauge."""
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """@brief Record one observation (usually a duration in seconds) of a timer."""
+        key = _key(name, labels)
+        with self.lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, value, value]
+            else:
+                timer[0] += 1
+                timer[1] += value
+                timer[2] = max(timer[2], value)
+
+    def timer(self, name, **labels):
+        """@brief Context manager that observes the duration of its block."""
+        return _Timer(self, name, labels)
+
+    def to_dict(self):
+        """@brief The collected values in a JSON-friendly layout."""
+        with self.lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in self.counters.items()],
+                "gauges": [{"name": name, "labels": dict(labels), "value": value}
+                           for (name, labels), value in self.gauges.items()],
+                "timers": [{"name": name, "labels": dict(labels), "count": count, "sum": total, "max": peak}
+                           for (name, labels), (count, total, peak) in self.timers.items()],
+            }
+
+    def export(self):
+        """@brief Write the collected values with the sink, if any."""
+        if self.sink is not None:
+            self.sink.write(self)
+
+
+class NullMetrics:
+    """
+    @class NullMetrics
+    @brief Disabled metrics: every method does nothing.
+    """
+
+    enabled = False
+    sink = None
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def set(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def timer(self, name, **labels):
+        return _NULL_TIMER
+
+    def to_dict(self):
+        return {"counters": [], "gauges": [], "timers": []}
+
+    def export(self):
+        pass
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+NULL_METRICS = NullMetrics()
+
+
+class JsonSink:
+    """
+    @class JsonSink
+    @brief Dumps the metrics to a JSON file.
+    """
+
+    def __init__(self, filepath):
+        """@brief Constructor for the JsonSink class.
+        @param filepath The path of the JSON file, replaced atomically at each export.
+        """
+        self.filepath = filepath
+
+    def write(self, metrics):
+        """@brief Write the current values of metrics."""
+        atomic_write(self.filepath, json.dumps(metrics.to_dict(), ensure_ascii=False, indent=4))
+
+
+class PrometheusSink:
+    """
+    @class PrometheusSink
+    @brief Dumps the metrics in the Prometheus text exposition format (e.g. for the node_exporter textfile collector).
+    """
+
+    def __init__(self, filepath, prefix="planning_poker"):
+        """@brief Constructor for the PrometheusSink class.
+        @param filepath The path of the .prom file, replaced atomically at each export.
+        @param prefix Prefix of every metric name.
+        """
+        self.filepath = filepath
+        self.prefix = prefix
+
+    def write(self, metrics):
+        """@brief Write the current values of metrics."""
+        atomic_write(self.filepath, self.render(metrics.to_dict()))
+
+    def render(self, values):
+        """@brief Format the values returned by Metrics.to_dict() as Prometheus text."""
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for entry in sorted(values["counters"], key=lambda entry: entry["name"]):
+            name = f"{self.prefix}_{entry['name']}_total"
+            declare(name, "counter")
+            lines.append(f"{name}{_labels(entry['labels'])} {entry['value']}")
+        for entry in sorted(values["gauges"], key=lambda entry: entry["name"]):
+            name = f"{self.prefix}_{entry['name']}"
+            declare(name, "gauge")
+            lines.append(f"{name}{_labels(entry['labels'])} {entry['value']}")
+        for entry in sorted(values["timers"], key=lambda entry: entry["name"]):
+            name = f"{self.prefix}_{entry['name']}"
+            declare(name, "summary")
+            labels = _labels(entry["labels"])
+            lines.append(f"{name}_count{labels} {entry['count']}")
+            lines.append(f"{name}_sum{labels} {entry['sum']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def sink_for_path(filepath):
+    """@brief PrometheusSink for a ".prom" path, JsonSink otherwise."""
+    return PrometheusSink(filepath) if filepath.endswith(".prom") else JsonSink(filepath)
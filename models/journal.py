@@ -0,0 +1,157 @@
+import json
+import os
+from models.storage import atomic_write
+
+
+## @file journal.py
+#  @brief Write-ahead journal for the game state.
+#
+#  Every vote, revote, validation, backlog change and window of pipelined
+#  voting is appended to the journal as one compact JSON line. From time to time the whole state is
+#  written as a snapshot (the usual game_state.json layout plus the
+#  sequence number of the last record it contains) and the journal is
+#  truncated. Loading a game reads the snapshot and replays the records
+#  that came after it.
+
+
+def journal_path_for(snapshot_path):
+    """@brief Path of the journal that goes with a snapshot file.
+    @param snapshot_path The path of the game state snapshot, e.g. data/game_state.json.
+    @return The journal path, e.g. data/game_state.journal.
+    """
+    return os.path.splitext(snapshot_path)[0] + ".journal"
+
+
+def apply_record(state, record):
+    """@brief Apply one journal record to a game state dict.
+    @param state Dict in the game_state.json layout ({"backlog": [...], "players": [...]}).
+    @param record The journal record.
+    """
+    op = record["op"]
+    if op == "vote" and "feature" in record:
+        # Pipelined vote: the card goes to the seat of the player on an open feature
+        for entry in state.get("pipeline", {}).get("open", []):
+            if entry["id"] == record["feature"]:
+                entry["votes"][record["player"]] = record["card"]
+    elif op == "vote":
+        state["players"][record["player"]]["vote"] = record["card"]
+    elif op == "reset":
+        for player in state["players"]:
+            player["vote"] = None
+    elif op == "validate":
+        feature = state["backlog"][record["feature"]]
+        feature["validated"] = record["validated"]
+        if record["validated"]:
+            feature["difficulty"] = record["difficulty"]
+    elif op == "add_task":
+        state["backlog"].append(record["task"])
+    elif op == "backlog":
+        state["backlog"] = record["tasks"]
+    elif op == "pipeline":
+        state["pipeline"] = {key: value for key, value in record.items() if key not in ("seq", "op")}
+    elif op == "players":
+        state["players"] = [{"pseudo": pseudo, "vote": vote} for pseudo, vote in zip(record["pseudos"], record["votes"])]
+    else:
+        raise ValueError(f"Unknown journal record: {op}")
+
+
+def read_records(journal_path, after_seq=0):
+    """@brief Read the journal records written after a given sequence number.
+    @details A torn last line (crash in the middle of an append) is ignored.
+    @param journal_path The path of the journal.
+    @param after_seq Records with a sequence number lower or equal to this one are skipped.
+    @return The list of records, in order.
+    """
+    records = []
+    try:
+        with open(journal_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record["seq"] > after_seq:
+                    records.append(record)
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def replay(state, journal_path):
+    """@brief Bring a snapshot up to date with the tail of its journal.
+    @details Only a snapshot written by GameJournal.snapshot (it has a "seq") is replayed: a state
+    saved without the journal is newer than any journal left next to it.
+    @param state The snapshot dict, modified in place.
+    @param journal_path The path of the journal.
+    @return The sequence number of the last record applied.
+    """
+    if "seq" not in state:
+        return 0
+    seq = state.pop("seq")
+    for record in read_records(journal_path, seq):
+        apply_record(state, record)
+        seq = record["seq"]
+    return seq
+
+
+class GameJournal:
+    """
+    @class GameJournal
+    @brief Append-only journal of game state changes with periodic compacted snapshots.
+    """
+
+    def __init__(self, snapshot_path="data/game_state.json", snapshot_every=200, fsync=False):
+        """@brief Constructor for the GameJournal class.
+        @param snapshot_path The path of the snapshot the journal belongs to.
+        @param snapshot_every Number of records after which a checkpoint writes a new snapshot.
+        @param fsync If True every append is synced to disk, not only flushed to the OS.
+        """
+        self.snapshot_path = snapshot_path
+        self.path = journal_path_for(snapshot_path)
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.seq = 0
+        self.pending = 0  # Records appended since the last snapshot
+        self.file = None
+
+    def append(self, op, **fields):
+        """@brief Append one record to the journal.
+        @param op The kind of change ("vote", "reset", "validate", "add_task", "backlog", "players").
+        @param fields The data of the change.
+        """
+        if self.file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.seq += 1
+        self.pending += 1
+        self.file.write(json.dumps({"seq": self.seq, "op": op, **fields}, separators=(",", ":"), ensure_ascii=False) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def snapshot(self, state):
+        """@brief Write a compacted snapshot of the whole state and truncate the journal.
+        @param state Dict in the game_state.json layout.
+        """
+        atomic_write(self.snapshot_path, json.dumps({**state, "seq": self.seq}, separators=(",", ":"), ensure_ascii=False))
+        # Records up to self.seq are in the snapshot; if we crash before the
+        # truncation they are skipped on replay thanks to their sequence number
+        self.close()
+        open(self.path, "w").close()
+        self.pending = 0
+
+    def checkpoint(self, state):
+        """@brief Make the state durable: take a snapshot if enough records piled up, else just flush.
+        @param state Dict in the game_state.json layout.
+        """
+        if self.pending >= self.snapshot_every or not os.path.exists(self.snapshot_path):
+            self.snapshot(state)
+        elif self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        """@brief Close the journal file."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
@@ -0,0 +1,196 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import contextlib
+import os
+from models.aggregation import RULES
+from models.game import Game
+from models.simulation import STRATEGIES, simulate_game
+
+
+## @file montecarlo.py
+#  @brief Parallel Monte Carlo comparison of the voting rules.
+#
+#  Millions of simulated estimation sessions are split into shards run on a
+#  ProcessPoolExecutor. Session i always uses the seed "<seed>-<i>", so the
+#  results do not depend on the number of workers or the shard size. Each
+#  shard returns mergeable histograms (revote rounds and estimation error
+#  per rule) instead of its sessions, and partial results are streamed as
+#  shards complete.
+
+
+class Histogram:
+    """
+    @class Histogram
+    @brief Fixed-width histogram that can be merged with another one.
+    """
+
+    def __init__(self, bin_width=1.0):
+        """@brief Constructor for the Histogram class.
+        @param bin_width The width of a bin; values are rounded down to a multiple of it.
+        """
+        self.bin_width = bin_width
+        self.bins = {}
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        """@brief Count one value."""
+        key = int(value // self.bin_width)
+        self.bins[key] = self.bins.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        """@brief Add the counts of another histogram with the same bin width."""
+        if other.bin_width != self.bin_width:
+            raise ValueError("Cannot merge histograms with different bin widths.")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def mean(self):
+        """@brief Exact mean of the values, None if empty."""
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q):
+        """@brief Lower edge of the bin holding the q-quantile, None if empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return key * self.bin_width
+        return max(self.bins) * self.bin_width
+
+
+class RuleStats:
+    """
+    @class RuleStats
+    @brief Mergeable results of many sessions played under one rule.
+    """
+
+    def __init__(self):
+        """@brief Constructor for the RuleStats class."""
+        self.sessions = 0
+        self.features = 0
+        self.abandoned = 0  # Features still contested after max_rounds
+        self.rounds = Histogram(1)
+        self.errors = Histogram(0.5)
+
+    def merge(self, other):
+        """@brief Add the results of another RuleStats."""
+        self.sessions += other.sessions
+        self.features += other.features
+        self.abandoned += other.abandoned
+        self.rounds.merge(other.rounds)
+        self.errors.merge(other.errors)
+        return self
+
+
+def run_shard(rules, first_session, count, num_players, num_features, strategy, seed, max_rounds):
+    """@brief Play count sessions under every rule (run in a worker process).
+    @return A dict mapping each rule to its RuleStats.
+    """
+    stats = {rule: RuleStats() for rule in rules}
+    with contextlib.redirect_stdout(None):
+        game = Game(num_players=0, lazy=True)
+    for rule in rules:
+        for session in range(first_session, first_session + count):
+            result = simulate_game(num_players, num_features, rule, strategy, seed=f"{seed}-{session}",
+                                   max_rounds=max_rounds, game=game)
+            rule_stats = stats[rule]
+            rule_stats.sessions += 1
+            rule_stats.features += result.features
+            rule_stats.abandoned += result.features - result.validated
+            for rounds in result.rounds:
+                rule_stats.rounds.add(rounds)
+            for error in result.errors:
+                rule_stats.errors.add(error)
+    return stats
+
+
+def run_monte_carlo(sessions, rules=RULES, num_players=8, num_features=5, strategy="converging",
+                    seed=0, max_rounds=10, shard_size=1000, workers=None, on_partial=None):
+    """@brief Run the simulated sessions on all cores and merge the results.
+    @param sessions The number of sessions played under each rule.
+    @param rules The rules to compare.
+    @param num_players The number of players per session.
+    @param num_features The number of features per session.
+    @param strategy The name of the voter strategy (see models.simulation.STRATEGIES).
+    @param seed The base seed.
+    @param max_rounds Rounds after which a contested feature is abandoned.
+    @param shard_size The number of sessions per task sent to a worker.
+    @param workers The number of worker processes, os.cpu_count() by default.
+    @param on_partial Optional callback(stats, sessions_done) called after each shard.
+    @return A dict mapping each rule to its merged RuleStats.
+    """
+    workers = workers or os.cpu_count() or 1
+    totals = {rule: RuleStats() for rule in rules}
+    shards = ((first, min(shard_size, sessions - first)) for first in range(0, sessions, shard_size))
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = set()
+        # Keep a bounded number of shards in flight instead of submitting them all
+        for first, count in shards:
+            running.add(executor.submit(run_shard, tuple(rules), first, count, num_players, num_features,
+                                        strategy, seed, max_rounds))
+            if len(running) < 2 * workers:
+                continue
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            done += _merge(totals, finished, on_partial, done)
+        while running:
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            done += _merge(totals, finished, on_partial, done)
+    return totals
+
+
+def _merge(totals, finished, on_partial, done):
+    merged = 0
+    for future in finished:
+        shard = future.result()
+        for rule, stats in shard.items():
+            totals[rule].merge(stats)
+        merged += next(iter(shard.values())).sessions
+        if on_partial is not None:
+            on_partial(totals, done + merged)
+    return merged
+
+
+def comparison_table(stats):
+    """@brief Format the merged results as one line per rule.
+    @param stats A dict mapping rules to RuleStats.
+    @return The table as a string.
+    """
+    lines = [f"{'rule':<18} {'sessions':>9} {'abandoned':>9} {'rounds':>7} {'r.p90':>5} {'error':>7} {'e.p90':>6}"]
+    for rule, rule_stats in stats.items():
+        abandoned = rule_stats.abandoned / rule_stats.features if rule_stats.features else 0
+        mean_error = rule_stats.errors.mean()
+        lines.append(
+            f"{rule:<18} {rule_stats.sessions:>9} {abandoned:>8.1%} {rule_stats.rounds.mean() or 0:>7.2f} "
+            f"{rule_stats.rounds.quantile(0.9) or 0:>5.0f} "
+            f"{'-' if mean_error is None else f'{mean_error:.2f}':>7} "
+            f"{rule_stats.errors.quantile(0.9) or 0:>6.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo comparison of the voting rules")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--features", type=int, default=5)
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="converging")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shard-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    def report(stats, done):
+        print(f"{done}/{args.sessions} sessions", flush=True)
+
+    results = run_monte_carlo(args.sessions, RULES, args.players, args.features, args.strategy,
+                              args.seed, shard_size=args.shard_size, workers=args.workers, on_partial=report)
+    print(comparison_table(results))
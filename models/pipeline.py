@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from models.aggregation import JOKER, encode_vote
+from models.instrumentation import DEBUG, say
+
+
+## @file pipeline.py
+#  @brief Pipelined voting: a window of several features open at once.
+#
+#  Instead of the whole table revoting on one feature until it agrees, a
+#  window of K features is open: players vote on any open feature in any
+#  order, and each feature has its own votes and round count. When every
+#  player has voted on a feature, the rules decide it exactly as in
+#  Game.process_votes (Game.decide). A validated feature leaves the window;
+#  a contested one is requeued behind the other pending features
+#  (BacklogIndex.requeue) and the next pending feature takes its place, so
+#  one contested feature no longer holds up the table.
+#
+#  The window (open features, their votes and rounds) is saved with the game
+#  state and given back to a new pipeline by the state argument. With a
+#  journal, every vote is recorded with its feature and the new window is
+#  recorded after each decided round, so a game replayed from its journal
+#  gets back the votes of the rounds still open.
+
+
+class OpenFeature:
+    """
+    @class OpenFeature
+    @brief Round state of one feature of the window.
+    """
+
+    __slots__ = ("feature", "votes", "voters", "round", "timestamp")
+
+    def __init__(self, feature, seats, rounds=0):
+        """@brief Constructor for the OpenFeature class.
+        @param feature The feature (task dict).
+        @param seats The number of players at the table.
+        @param rounds The number of rounds already played on the feature.
+        """
+        self.feature = feature
+        self.votes = [None] * seats  # Card of each seat this round, None until the player votes
+        self.voters = 0
+        self.round = rounds
+        self.timestamp = None  # Time of the last vote, when the votes come with one
+
+
+class VotingPipeline:
+    """
+    @class VotingPipeline
+    @brief Keeps a window of features open for voting and decides each one independently.
+    """
+
+    def __init__(self, game, window=3, state=None):
+        """@brief Constructor for the VotingPipeline class; opens the first features of the backlog.
+        @param game The Game holding the backlog, the players and the rules; its pipeline becomes this one.
+        @param window The maximum number of features open at once.
+        @param state Optional window saved by state() (e.g. Game.saved_pipeline): its open features,
+        their votes and their rounds are restored before the window is filled.
+        @throws ValueError if the window is not positive.
+        """
+        if window < 1:
+            raise ValueError("The window must hold at least one feature.")
+        self.game = game
+        self.window = window
+        self.seats = {player: seat for seat, player in enumerate(game.players)}
+        self.open = OrderedDict()  # feature ID -> OpenFeature, in opening order
+        self.rounds = {}  # feature ID -> rounds played, kept while a contested feature waits in the queue
+        if state is not None:
+            self._restore(state)
+        game.pipeline = self
+        self.fill()
+        self._record_window()
+
+    def state(self):
+        """@brief The window as JSON data: its size ("window"), the "open" features (ID, votes by seat,
+        round, timestamp) and the "rounds" already played by the contested features, as [ID, rounds] pairs.
+        """
+        return {
+            "window": self.window,
+            "open": [{"id": feature_id, "votes": list(open_feature.votes), "round": open_feature.round,
+                      "timestamp": open_feature.timestamp} for feature_id, open_feature in self.open.items()],
+            "rounds": [[feature_id, rounds] for feature_id, rounds in self.rounds.items()],
+        }
+
+    def _restore(self, state):
+        """@brief Reopen the features of a saved window; votes are dropped if the table changed size."""
+        index = self.game.backlog_index
+        self.rounds = {feature_id: rounds for feature_id, rounds in state.get("rounds", [])}
+        for entry in state.get("open", []):
+            feature = index.get(entry["id"])
+            if feature.get("validated"):
+                continue
+            open_feature = OpenFeature(feature, len(self.seats), entry.get("round", 0))
+            if len(entry.get("votes", [])) == len(self.seats):
+                open_feature.votes = list(entry["votes"])
+                open_feature.voters = sum(vote is not None for vote in open_feature.votes)
+            open_feature.timestamp = entry.get("timestamp")
+            self.open[entry["id"]] = open_feature
+
+    def _record_window(self):
+        """@brief Journal the whole window, if the game keeps a journal."""
+        if self.game.journal is not None:
+            self.game._record("pipeline", **self.state())
+
+    def fill(self):
+        """@brief Open pending features until the window is full or the backlog has none left."""
+        index = self.game.backlog_index
+        pending = index.pending_count()
+        if pending <= self.window:
+            # The whole queue fits in the window: the missing features (e.g. a contested one
+            # just requeued) are found from the end of the queue, then opened in queue order
+            missing = []
+            for feature in index.iter_pending(reverse=True):
+                if len(self.open) + len(missing) >= pending:
+                    break
+                if feature["id"] not in self.open:
+                    missing.append(feature)
+            for feature in reversed(missing):
+                self._open(feature)
+            return
+        for feature in index.iter_pending():
+            if len(self.open) >= self.window:
+                break
+            if feature["id"] not in self.open:
+                self._open(feature)
+
+    def _open(self, feature):
+        """@brief Open a feature of the queue, keeping the rounds it has already played."""
+        self.open[feature["id"]] = OpenFeature(feature, len(self.seats), self.rounds.get(feature["id"], 0))
+
+    def features(self):
+        """@brief The open features, oldest first."""
+        return [open_feature.feature for open_feature in self.open.values()]
+
+    def finished(self):
+        """@brief True once no feature is left to vote on."""
+        return not self.open
+
+    def waiting(self, feature_id):
+        """@brief Players who have not voted on an open feature yet this round."""
+        votes = self.open[feature_id].votes
+        return [player for player, seat in self.seats.items() if votes[seat] is None]
+
+    def vote(self, player, feature_id, card, timestamp=None):
+        """@brief Record a vote on an open feature; the feature is decided once every player has voted.
+        @param player The Player voting.
+        @param feature_id The ID of an open feature.
+        @param card The card played.
+        @param timestamp Optional time of the vote; the round is recorded at the time of its last vote.
+        @return The verdict dict if this vote closed the round (see close), None otherwise.
+        @throws ValueError if the feature is not open, the player unknown or the card invalid.
+        """
+        open_feature = self.open.get(feature_id)
+        if open_feature is None:
+            raise ValueError(f"Feature not open for voting: {feature_id}")
+        seat = self.seats.get(player)
+        if seat is None:
+            raise ValueError(f"Unknown player: {player.pseudo}")
+        self.game.deck.code(card)  # Raises ValueError for a card that is not in the deck
+        if open_feature.votes[seat] is None:
+            open_feature.voters += 1
+        open_feature.votes[seat] = card
+        if timestamp is not None:
+            open_feature.timestamp = timestamp
+        self.game._record("vote", player=seat, card=card, feature=feature_id)
+        say("%s has voted with card %s on '%s'", player.pseudo, card, open_feature.feature["description"],
+            level=DEBUG)
+        if open_feature.voters == len(self.seats):
+            return self.close(feature_id)
+        return None
+
+    def close(self, feature_id):
+        """@brief Decide the current round of an open feature with the rules of the game.
+        @details A validated feature leaves the window; a contested one is requeued behind
+        the other pending features. The window is then refilled.
+        @return A dict with the "feature", its "difficulty", whether it was "validated", its "round"
+        and "cafe", True if every player chose the 'joker' card (a break is requested).
+        """
+        open_feature = self.open.pop(feature_id)
+        open_feature.round += 1
+        feature = open_feature.feature
+        self.game.record_round(feature_id, open_feature.round, open_feature.votes, timestamp=open_feature.timestamp)
+        difficulty, _ = self.game.decide(feature, open_feature.votes, open_feature.round)
+        validated = bool(feature.get("validated"))
+        if validated:
+            self.rounds.pop(feature_id, None)
+        else:
+            self.rounds[feature_id] = open_feature.round
+            self.game.backlog_index.requeue(feature)
+        self.fill()
+        self._record_window()
+        cafe = all(encode_vote(vote, self.game.deck) == JOKER for vote in open_feature.votes)
+        return {"feature": feature, "difficulty": difficulty if validated else None, "validated": validated,
+                "round": open_feature.round, "cafe": cafe}
@@ -1,36 +1,81 @@
+from models.deck import FIBONACCI, NO_VOTE
+from models.instrumentation import DEBUG, say
+
 
 class Player:
     """
     @class Player
     @brief Represents a player in the Planning Poker game.
 
+    Players share an immutable Deck and store their vote as a small integer
+    code, either in their own slot or in a VoteBoard shared by the table.
     """
-    def __init__(self, pseudo):
+
+    __slots__ = ("pseudo", "deck", "tally", "board", "seat", "position", "_code")
+
+    def __init__(self, pseudo, deck=FIBONACCI, board=None, seat=None):
         """ @brief Constructor for the Player class.
 
         @param pseudo The player's pseudonym.
+        @param deck The deck of cards shared by the table.
+        @param board Optional VoteBoard holding the votes of the whole table.
+        @param seat The index of the player's slot in the board.
         """
         self.pseudo = pseudo  # Player's pseudonym
-        self.current_vote = None  # Current card chosen by player (e.g., "5", "8", "joker")
-        self.cards = ["1", "2", "3", "5", "8", "13", "20", "40", "100", "joker"]  # Example cards
+        self.deck = deck
+        self.tally = None  # Shared VoteTally of the table, set by Game.bind_players
+        self.board = board
+        self.seat = seat
+        self.position = None  # Index of the player in the list of the table, set by Game.bind_players
+        self._code = NO_VOTE
+
+    @property
+    def cards(self):
+        """@brief The cards the player can choose from (e.g. "5", "8", "joker")."""
+        return self.deck.cards
+
+    @property
+    def vote_code(self):
+        """@brief Integer code of the current card in the deck, NO_VOTE if the player has not voted."""
+        if self.board is not None:
+            return self.board.codes[self.seat]
+        return self._code
+
+    @vote_code.setter
+    def vote_code(self, code):
+        if self.board is not None:
+            self.board.codes[self.seat] = code
+        else:
+            self._code = code
+
+    @property
+    def current_vote(self):
+        """@brief Current card chosen by player (e.g. "5", "8", "joker"), None if the player has not voted."""
+        code = self.vote_code
+        return None if code == NO_VOTE else self.deck.cards[code]
+
+    @current_vote.setter
+    def current_vote(self, card):
+        self.vote_code = NO_VOTE if card is None or card == "" else self.deck.code(card)
 
     def vote(self, card):
 
         """Allows the player to vote by selecting a card.
-        
+
         @param card The card chosen by the player.
         @throws ValueError if the card is not in the player's list of cards.
 
         """
-        if card in self.cards:
-            self.current_vote = card
-            print(f"{self.pseudo} has voted with card {card}")
-        else:
-            raise ValueError(f"Invalid card: {card}")
+        code = self.deck.code(card)
+        if self.tally is not None:
+            self.tally.replace(self.current_vote, card)
+        self.vote_code = code
+        say("%s has voted with card %s", self.pseudo, card, level=DEBUG)
 
     def reset_vote(self):
         """Clears the current vote for the player (used if a revote is needed).
         @brief Resets the player's vote to None.
         """
-        self.current_vote = None 
-
+        if self.tally is not None:
+            self.tally.remove(self.current_vote)
+        self.vote_code = NO_VOTE
@@ -0,0 +1,242 @@
+from collections import Counter
+import csv
+import json
+import os
+import tempfile
+from models.storage import atomic_write
+
+
+## @file report.py
+#  @brief Final report written incrementally, one validated feature at a time.
+#
+#  A report writer streams tasks to a temporary file as they are estimated
+#  and moves it over the report atomically on close(), so a report never
+#  holds more than one task in memory. The format follows the extension:
+#  ".jsonl" (JSON Lines), ".csv", or the final_report.json layout otherwise.
+#  While writing, the writer fills a ReportSummary that is saved next to the
+#  report (see summary_path_for) and read back by the front ends.
+
+
+def summary_path_for(report_path):
+    """@brief Path of the summary saved next to a report (final_report.json -> final_report.summary.json)."""
+    root, _ = os.path.splitext(report_path)
+    return root + ".summary.json"
+
+
+def partial_path_for(report_path):
+    """@brief Path of the report of an interrupted game (final_report.json -> final_report.partial.json)."""
+    root, extension = os.path.splitext(report_path)
+    return root + ".partial" + extension
+
+
+class ReportSummary:
+    """
+    @class ReportSummary
+    @brief Aggregates of a report, computed in the same pass that writes it.
+    """
+
+    def __init__(self, deck=None):
+        """@brief Constructor for the ReportSummary class.
+        @param deck Optional Deck used to name the card of each difficulty.
+        """
+        self.deck = deck
+        self.features = 0
+        self.validated = 0
+        self.estimated = 0  # Validated features with a difficulty
+        self.total_difficulty = 0
+        self.by_card = Counter()  # Card (or difficulty) -> number of features
+        self.rounds = Counter()  # Rounds to consensus -> number of features
+
+    def add(self, task, rounds=None):
+        """@brief Count one task.
+        @param task The task dict.
+        @param rounds Optional number of rounds the table needed to agree on it.
+        """
+        self.features += 1
+        if not task.get("validated", False):
+            return
+        self.validated += 1
+        difficulty = task.get("difficulty")
+        if difficulty is not None:
+            self.estimated += 1
+            self.total_difficulty += difficulty
+            self.by_card[self._card(difficulty)] += 1
+        if rounds:
+            self.rounds[rounds] += 1
+
+    def _card(self, difficulty):
+        if self.deck is not None:
+            for card, value in zip(self.deck.cards, self.deck.values):
+                if value == difficulty:
+                    return card
+        return str(difficulty)
+
+    @property
+    def unvalidated(self):
+        """@brief Number of features that are not validated."""
+        return self.features - self.validated
+
+    @property
+    def mean_difficulty(self):
+        """@brief Mean difficulty of the estimated features, None if there is none."""
+        return self.total_difficulty / self.estimated if self.estimated else None
+
+    @property
+    def mean_rounds(self):
+        """@brief Mean number of rounds to consensus, None if unknown."""
+        count = sum(self.rounds.values())
+        return sum(rounds * features for rounds, features in self.rounds.items()) / count if count else None
+
+    def to_dict(self):
+        """@brief The summary in a JSON-friendly layout."""
+        return {
+            "features": self.features,
+            "validated": self.validated,
+            "unvalidated": self.unvalidated,
+            "total_difficulty": self.total_difficulty,
+            "mean_difficulty": self.mean_difficulty,
+            "by_card": dict(self.by_card),
+            "rounds_to_consensus": {str(rounds): count for rounds, count in sorted(self.rounds.items())},
+            "mean_rounds": self.mean_rounds,
+        }
+
+
+class ReportWriter:
+    """
+    @class ReportWriter
+    @brief Base class of the streaming report writers: temporary file, summary, atomic replace.
+    """
+
+    def __init__(self, filepath, deck=None, file=None):
+        """@brief Constructor for the ReportWriter class.
+        @param filepath The path of the report.
+        @param deck Optional Deck used to name the cards in the summary.
+        @param file Optional text file (e.g. io.StringIO) the report is rendered to instead; nothing
+        is then written to filepath, neither the report nor its summary.
+        """
+        self.filepath = filepath
+        self.summary = ReportSummary(deck)
+        self.temp_path = None
+        if file is None:
+            directory = os.path.dirname(os.path.abspath(filepath))
+            os.makedirs(directory, exist_ok=True)
+            fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(filepath))
+            file = os.fdopen(fd, "w", encoding="utf-8", newline="")
+        self.file = file
+        self.count = 0
+        self.begin()
+
+    def begin(self):
+        """@brief Write the start of the document."""
+
+    def end(self):
+        """@brief Write the end of the document."""
+
+    def write_task(self, task, rounds):
+        """@brief Write one task in the format of the report."""
+        raise NotImplementedError
+
+    def write(self, task, rounds=None):
+        """@brief Append one task to the report.
+        @param task The task dict.
+        @param rounds Optional number of rounds the table needed to agree on it.
+        """
+        self.write_task(task, rounds)
+        self.summary.add(task, rounds)
+        self.count += 1
+
+    def close(self):
+        """@brief Finish the report, atomically replace the previous one and save the summary."""
+        if self.file is None:
+            return
+        self.end()
+        if self.temp_path is None:
+            self.file = None  # Rendered to the caller's file, left open
+            return
+        self.file.close()
+        self.file = None
+        os.replace(self.temp_path, self.filepath)
+        atomic_write(summary_path_for(self.filepath), json.dumps(self.summary.to_dict(), ensure_ascii=False, indent=4))
+
+    def abort(self):
+        """@brief Drop the unfinished report: the temporary file is deleted and the previous report kept."""
+        if self.file is None:
+            return
+        if self.temp_path is not None:
+            self.file.close()
+            os.remove(self.temp_path)
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class JsonReportWriter(ReportWriter):
+    """
+    @class JsonReportWriter
+    @brief Streams tasks to a report in the final_report.json layout ({"tasks": [...]}).
+    """
+
+    def begin(self):
+        self.file.write('{\n    "tasks": [')
+
+    def write_task(self, task, rounds):
+        self.file.write(",\n        " if self.count else "\n        ")
+        self.file.write(json.dumps(task, ensure_ascii=False))
+
+    def end(self):
+        self.file.write("\n    ]\n}\n" if self.count else "]\n}\n")
+
+
+class JsonLinesReportWriter(ReportWriter):
+    """
+    @class JsonLinesReportWriter
+    @brief Streams tasks to a JSON Lines report, one task object per line.
+    """
+
+    def write_task(self, task, rounds):
+        self.file.write(json.dumps(task, ensure_ascii=False) + "\n")
+
+
+class CsvReportWriter(ReportWriter):
+    """
+    @class CsvReportWriter
+    @brief Streams tasks to a CSV report (id, description, difficulty, validated, rounds).
+    """
+
+    COLUMNS = ("id", "description", "difficulty", "validated", "rounds")
+
+    def begin(self):
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.COLUMNS)
+
+    def write_task(self, task, rounds):
+        difficulty = task.get("difficulty")
+        self.writer.writerow((task.get("id", ""), task.get("description", ""), "" if difficulty is None else difficulty,
+                              task.get("validated", False), rounds or ""))
+
+
+def report_writer(filepath, deck=None, file=None):
+    """@brief Open the report writer matching the extension of a path (.jsonl, .csv, JSON otherwise).
+    @param file Optional text file the report is rendered to instead of filepath (see ReportWriter).
+    """
+    if filepath.endswith(".jsonl"):
+        return JsonLinesReportWriter(filepath, deck, file)
+    if filepath.endswith(".csv"):
+        return CsvReportWriter(filepath, deck, file)
+    return JsonReportWriter(filepath, deck, file)
+
+
+def load_summary(report_path):
+    """@brief Read the summary saved next to a report, None if there is none."""
+    try:
+        with open(summary_path_for(report_path), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,324 @@
+from array import array
+from bisect import bisect_left
+from collections import Counter
+import csv
+from functools import lru_cache
+import json
+import mmap
+import os
+import random
+import re
+import shutil
+import sys
+import zlib
+from models.storage import atomic_write
+
+
+## @file similarity.py
+#  @brief Index of past estimates, queried for the tasks most similar to a new feature.
+#
+#  Descriptions are tokenized into words and word pairs and summarized by a
+#  MinHash signature; locality-sensitive hashing (LSH) splits each signature
+#  into bands, and tasks sharing a band are candidates whose similarity is
+#  estimated from their signatures.
+#
+#  The index is a directory of immutable segments plus an index.json
+#  manifest. Each segment stores fixed-size binary columns (sorted band keys,
+#  task numbers, signatures, difficulties, description offsets and blob) that
+#  are memory-mapped and searched in place, so opening an index reads no task.
+#  Adding a report writes a new segment; small segments are merged from time
+#  to time.
+#      python -m models.similarity build data/similarity data/final_report.json
+#      python -m models.similarity query data/similarity "Login page"
+
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+_MIX = 0x9E3779B97F4A7C15
+_WORD = re.compile(r"\w+")
+_BUCKET_LIMIT = 256  # Tasks read from one LSH bucket
+_SCORED_CANDIDATES = 64  # Candidates per segment whose signature is compared
+
+_COLUMNS = (
+    ("keys", "Q"),  # Band keys, sorted
+    ("ids", "I"),  # Task number of each band key
+    ("signatures", "I"),  # num_perm values per task
+    ("difficulties", "d"),
+    ("offsets", "Q"),  # Start of each description in the blob, plus the end
+)
+
+
+def tokenize(text):
+    """@brief Lower-case words and pairs of consecutive words of a description.
+    @return A set of tokens.
+    """
+    words = _WORD.findall(text.lower())
+    return set(words) | {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+
+def _permutations(num_perm, seed):
+    rng = random.Random(seed)
+    return [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(num_perm)]
+
+
+def signature(tokens, permutations):
+    """@brief MinHash signature of a set of tokens.
+    @return A list with the minimum of each hash permutation.
+    """
+    hashes = [zlib.crc32(token.encode("utf-8")) for token in tokens]
+    if not hashes:
+        return [_MASK] * len(permutations)
+    return [min(((a * value + b) % _PRIME) & _MASK for value in hashes) for a, b in permutations]
+
+
+def band_keys(values, bands):
+    """@brief One 64-bit key per LSH band of a signature (the band number is in the top byte)."""
+    rows = len(values) // bands
+    keys = []
+    for band in range(bands):
+        key = 0
+        for value in values[band * rows:(band + 1) * rows]:
+            key = ((key ^ value) * _MIX) & 0xFFFFFFFFFFFFFFFF
+        keys.append((band << 56) | (key >> 8))
+    return keys
+
+
+def _column_bytes(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return column.tobytes()
+
+
+class _Segment:
+    """
+    @class _Segment
+    @brief One immutable, memory-mapped part of the index.
+    """
+
+    def __init__(self, path, count):
+        self.path = path
+        self.count = count
+        self._maps = []
+        self.columns = {}
+        for name, typecode in _COLUMNS:
+            self.columns[name] = self._map(f"{name}.bin", typecode)
+        self.blob = self._map("descriptions.bin", "B")
+
+    def _map(self, filename, typecode):
+        with open(os.path.join(self.path, filename), "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return memoryview(b"").cast(typecode)
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapping)
+        view = memoryview(mapping).cast(typecode)
+        if sys.byteorder != "little" and typecode != "B":
+            view = array(typecode, view)
+            view.byteswap()
+        return view
+
+    def close(self):
+        for view in (*self.columns.values(), self.blob):
+            if isinstance(view, memoryview):
+                view.release()
+        for mapping in self._maps:
+            mapping.close()
+        self._maps = []
+
+    def candidates(self, key, limit):
+        """@brief Task numbers whose band key is key (at most limit)."""
+        keys = self.columns["keys"]
+        position = bisect_left(keys, key)
+        ids = self.columns["ids"]
+        found = []
+        while position < len(keys) and keys[position] == key and len(found) < limit:
+            found.append(ids[position])
+            position += 1
+        return found
+
+    def similarity(self, task, values):
+        """@brief Fraction of the signature of a task equal to values."""
+        num_perm = len(values)
+        stored = self.columns["signatures"][task * num_perm:(task + 1) * num_perm]
+        return sum(1 for mine, theirs in zip(stored, values) if mine == theirs) / num_perm
+
+    def signature(self, task, num_perm):
+        return self.columns["signatures"][task * num_perm:(task + 1) * num_perm].tolist()
+
+    def description(self, task):
+        offsets = self.columns["offsets"]
+        return bytes(self.blob[offsets[task]:offsets[task + 1]]).decode("utf-8")
+
+    def difficulty(self, task):
+        return self.columns["difficulties"][task]
+
+
+class SimilarityIndex:
+    """
+    @class SimilarityIndex
+    @brief MinHash/LSH index of estimated tasks with a cached top-k query.
+    """
+
+    def __init__(self, directory="data/similarity", num_perm=32, bands=16, cache_size=1024,
+                 segment_size=100000, max_small_segments=8):
+        """@brief Constructor for the SimilarityIndex class; opens the index if it exists.
+        @param directory The directory of the index.
+        @param num_perm Number of MinHash permutations (ignored for an existing index).
+        @param bands Number of LSH bands, dividing num_perm (ignored for an existing index).
+        @param cache_size Number of queries kept in the LRU cache.
+        @param segment_size Number of tasks above which a segment is not merged any more.
+        @param max_small_segments Number of small segments that triggers a merge.
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_small_segments = max_small_segments
+        self.manifest = {"num_perm": num_perm, "bands": bands, "seed": 0, "next": 0, "segments": []}
+        manifest_path = os.path.join(directory, "index.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+        if self.manifest["num_perm"] % self.manifest["bands"]:
+            raise ValueError("The number of bands must divide the number of permutations.")
+        self.permutations = _permutations(self.manifest["num_perm"], self.manifest["seed"])
+        self.segments = []
+        self._open_segments()
+        # query(text, k) is _query behind an LRU cache, cleared when tasks are added
+        self.query = lru_cache(maxsize=cache_size)(self._query)
+
+    def __len__(self):
+        return sum(segment.count for segment in self.segments)
+
+    def _open_segments(self):
+        self.close()
+        self.segments = [_Segment(os.path.join(self.directory, name), count)
+                         for name, count in self.manifest["segments"]]
+
+    def close(self):
+        """@brief Release the memory maps."""
+        for segment in getattr(self, "segments", []):
+            segment.close()
+        self.segments = []
+
+    def _query(self, text, k=3):
+        """@brief The k past tasks most similar to a description (cached, see query).
+        @return A tuple of (description, difficulty, similarity) tuples, most similar first.
+        """
+        values = signature(tokenize(text), self.permutations)
+        keys = band_keys(values, self.manifest["bands"])
+        scored = []
+        for segment in self.segments:
+            # Tasks sharing the most bands first; only those get their signature compared
+            hits = Counter()
+            for key in keys:
+                hits.update(segment.candidates(key, _BUCKET_LIMIT))
+            for task, _ in hits.most_common(_SCORED_CANDIDATES):
+                scored.append((segment.similarity(task, values), segment, task))
+        scored.sort(key=lambda item: -item[0])
+        # Only the best candidates are decoded; the same description archived twice counts once
+        best = {}
+        for score, segment, task in scored:
+            description = segment.description(task)
+            if description not in best:
+                best[description] = (description, segment.difficulty(task), score)
+                if len(best) == k:
+                    break
+        return tuple(best.values())
+
+    def suggest(self, text, k=3):
+        """@brief The k past tasks most similar to a description, as dicts.
+        @return A list of {"description", "difficulty", "similarity"} dicts, most similar first.
+        """
+        return [{"description": description, "difficulty": difficulty, "similarity": score}
+                for description, difficulty, score in self.query(text, k)]
+
+    def add_tasks(self, tasks):
+        """@brief Add the validated tasks with a difficulty to the index, as a new segment.
+        @param tasks An iterable of task dicts (e.g. the backlog of a finished game).
+        @return The number of tasks added.
+        """
+        rows = [(task["description"], float(task["difficulty"])) for task in tasks
+                if task.get("validated", True) and task.get("difficulty") is not None and task.get("description")]
+        for start in range(0, len(rows), self.segment_size):
+            chunk = rows[start:start + self.segment_size]
+            signatures = [signature(tokenize(description), self.permutations) for description, _ in chunk]
+            self._write_segment(chunk, signatures)
+        self._merge_small_segments()
+        self._open_segments()
+        self.query.cache_clear()
+        return len(rows)
+
+    def add_report(self, filepath):
+        """@brief Add the tasks of a final report (.json, .jsonl or .csv) to the index.
+        @return The number of tasks added.
+        """
+        if filepath.endswith(".csv"):
+            with open(filepath, "r", encoding="utf-8", newline="") as file:
+                tasks = [{"description": row["description"], "validated": row["validated"] == "True",
+                          "difficulty": float(row["difficulty"]) if row["difficulty"] else None}
+                         for row in csv.DictReader(file)]
+            return self.add_tasks(tasks)
+        from models.backlog import iter_tasks
+        return self.add_tasks(iter_tasks(filepath))
+
+    def _write_segment(self, rows, signatures):
+        """@brief Write a segment and register it in the manifest."""
+        bands = self.manifest["bands"]
+        # Sort (key, task) pairs packed in one integer: the key in the high bits
+        packed = sorted((key << 32) | task for task, values in enumerate(signatures)
+                        for key in band_keys(values, bands))
+        blob = bytearray()
+        offsets = [0]
+        for description, _ in rows:
+            blob += description.encode("utf-8")
+            offsets.append(len(blob))
+        columns = {
+            "keys": _column_bytes("Q", (value >> 32 for value in packed)),
+            "ids": _column_bytes("I", (value & _MASK for value in packed)),
+            "signatures": _column_bytes("I", (value for values in signatures for value in values)),
+            "difficulties": _column_bytes("d", (difficulty for _, difficulty in rows)),
+            "offsets": _column_bytes("Q", offsets),
+            "descriptions": bytes(blob),
+        }
+        name = f"segment-{self.manifest['next']:06d}"
+        self.manifest["next"] += 1
+        temp_path = os.path.join(self.directory, f".tmp-{name}")
+        os.makedirs(temp_path, exist_ok=True)
+        for column, data in columns.items():
+            with open(os.path.join(temp_path, f"{column}.bin"), "wb") as file:
+                file.write(data)
+        os.replace(temp_path, os.path.join(self.directory, name))
+        self.manifest["segments"].append([name, len(rows)])
+        atomic_write(os.path.join(self.directory, "index.json"), json.dumps(self.manifest, indent=4))
+
+    def _merge_small_segments(self):
+        """@brief Merge the small segments into one once there are too many of them."""
+        small = [entry for entry in self.manifest["segments"] if entry[1] < self.segment_size]
+        if len(small) <= self.max_small_segments:
+            return
+        self._open_segments()
+        rows, signatures = [], []
+        num_perm = self.manifest["num_perm"]
+        for segment in self.segments:
+            if segment.count >= self.segment_size:
+                continue
+            for task in range(segment.count):
+                rows.append((segment.description(task), segment.difficulty(task)))
+                signatures.append(segment.signature(task, num_perm))
+        self.close()
+        names = {name for name, _ in small}
+        self.manifest["segments"] = [entry for entry in self.manifest["segments"] if entry[0] not in names]
+        self._write_segment(rows, signatures)
+        for name in names:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[1] not in ("build", "query"):
+        print("Usage: python -m models.similarity build <index> <report>... | query <index> <description>")
+        sys.exit(1)
+    index = SimilarityIndex(sys.argv[2])
+    if sys.argv[1] == "build":
+        for report in sys.argv[3:]:
+            print(f"{report}: {index.add_report(report)} tasks added.")
+    else:
+        for suggestion in index.suggest(" ".join(sys.argv[3:]), k=5):
+            print(f"{suggestion['similarity']:.2f}  {suggestion['difficulty']:g}  {suggestion['description']}")
@@ -0,0 +1,137 @@
+import contextlib
+import random
+from models.deck import FIBONACCI
+from models.game import Game
+from models.history import VoteHistory
+
+
+## @file simulation.py
+#  @brief Headless simulation of complete Planning Poker games.
+#
+#  Synthetic voters replace input(): a strategy picks the card of each
+#  player from the true difficulty of the feature, the votes already cast
+#  in the round and the votes of the previous round. Games run through the
+#  normal Game pipeline (cast_vote, process_votes) with the console output
+#  discarded.
+
+
+def _numeric_cards(deck):
+    return [card for card, value in zip(deck.cards, deck.values) if value is not None]
+
+
+def _nearest_card(deck, estimate):
+    return min(_numeric_cards(deck), key=lambda card: abs(deck.value(card) - estimate))
+
+
+def _noisy_card(rng, deck, truth, spread=0.5):
+    """@brief Card closest to a noisy (log-normal) estimate of the true difficulty."""
+    return _nearest_card(deck, truth * rng.lognormvariate(0, spread))
+
+
+def random_strategy(rng, deck, truth, round_number, current, previous):
+    """@brief Every player picks any card of the deck."""
+    return rng.choice(deck.cards)
+
+
+def anchored_strategy(rng, deck, truth, round_number, current, previous):
+    """@brief The first player to speak sets an anchor that most of the table follows."""
+    if not current or rng.random() < 0.3:
+        return _noisy_card(rng, deck, truth)
+    return current[0]
+
+
+def converging_strategy(rng, deck, truth, round_number, current, previous):
+    """@brief Noisy first round; on revotes players increasingly rally to the previous median."""
+    numeric = sorted(deck.value(card) for card in previous if deck.value(card) is not None)
+    if not numeric or rng.random() > min(1.0, 0.4 * round_number):
+        return _noisy_card(rng, deck, truth, 0.5 / round_number)
+    return _nearest_card(deck, numeric[len(numeric) // 2])
+
+
+def all_joker_strategy(rng, deck, truth, round_number, current, previous):
+    """@brief Every player plays the 'joker' card."""
+    return "joker"
+
+
+STRATEGIES = {
+    "random": random_strategy,
+    "anchored": anchored_strategy,
+    "converging": converging_strategy,
+    "all_joker": all_joker_strategy,
+}
+
+
+class SimulationResult:
+    """
+    @class SimulationResult
+    @brief Outcome of a simulated game.
+    """
+
+    def __init__(self):
+        """@brief Constructor for the SimulationResult class."""
+        self.features = 0
+        self.validated = 0
+        self.rounds = []  # Rounds played on each feature
+        self.votes = 0
+        self.errors = []  # Absolute estimation error of each validated feature
+        self.game = None
+
+    def __repr__(self):
+        return (f"SimulationResult(features={self.features}, validated={self.validated}, "
+                f"votes={self.votes}, rounds={sum(self.rounds)})")
+
+
+def simulate_game(num_players, num_features, rules="strict", strategy="converging", deck=FIBONACCI,
+                  seed=0, max_rounds=10, game=None):
+    """@brief Run a complete game with synthetic voters and no console output.
+    @param num_players The number of players.
+    @param num_features The number of features in the backlog.
+    @param rules The voting rules to use for the game.
+    @param strategy The name of a strategy in STRATEGIES, or a strategy function.
+    @param deck The Deck used by the table.
+    @param seed Seed of the random generator; a given seed always replays the same game.
+    @param max_rounds Rounds after which a feature that is still contested is abandoned.
+    @param game Optional Game to play on (its players, backlog and history are replaced).
+    @return A SimulationResult; the Game that was played is result.game.
+    """
+    rng = random.Random(seed)
+    choose = STRATEGIES[strategy] if isinstance(strategy, str) else strategy
+    numeric = [value for value in deck.values if value is not None]
+    result = SimulationResult()
+
+    # print() is a no-op while sys.stdout is None
+    with contextlib.redirect_stdout(None):
+        if game is None:
+            game = Game(num_players=num_players, rules=rules, deck=deck, lazy=True)
+        else:
+            game.rules, game.deck = rules, deck
+            game.history = VoteHistory()
+            game.players = []
+            for _ in range(num_players):
+                game.add_player("")
+        for seat, player in enumerate(game.players):
+            player.pseudo = f"player{seat + 1}"
+        game.bind_players()
+        game.backlog = [{"description": f"Feature {index + 1}", "difficulty": None} for index in range(num_features)]
+        truths = [rng.choice(numeric) for _ in range(num_features)]
+
+        for feature, truth in zip(game.backlog, truths):
+            game.current_feature = feature
+            previous = []
+            for round_number in range(1, max_rounds + 1):
+                current = []
+                for player in game.players:
+                    card = choose(rng, deck, truth, round_number, current, previous)
+                    game.cast_vote(player, card)
+                    current.append(card)
+                result.votes += len(current)
+                if game.process_votes():
+                    result.validated += 1
+                    result.errors.append(abs(feature["difficulty"] - truth))
+                    break
+                previous = current
+            result.rounds.append(round_number)
+            result.features += 1
+
+    result.game = game
+    return result
@@ -0,0 +1,306 @@
+import math
+import random
+from models.aggregation import JOKER, MISSING
+
+
+## @file sketches.py
+#  @brief Mergeable sketches for approximate vote aggregation over huge audiences.
+#
+#  The exact rules (aggregation.verdict) need the histogram of every vote of
+#  a round in one place. For polls spread over many processes, each shard
+#  can instead fold its votes into a VoteSketch of bounded size and ship it
+#  (to_dict / from_dict); the coordinator merges the partial sketches and
+#  reads the verdict from the result:
+#    - median: a KLL-style QuantileSketch, rank error about 1/k of the votes;
+#    - majorities: a Misra-Gries HeavyHitters summary, whose counts are
+#      lower bounds off by at most votes / (capacity + 1) and exact while
+#      the number of distinct cards does not exceed the capacity;
+#    - strict and average: exact, from the count, sum, min and max.
+#  Merging is associative, so shards can be combined in any order.
+
+
+class QuantileSketch:
+    """
+    @class QuantileSketch
+    @brief KLL-style quantile sketch: a stack of compactors, level h holding items of weight 2**h.
+    """
+
+    def __init__(self, k=200, seed=None):
+        """@brief Constructor for the QuantileSketch class.
+        @param k Capacity of the top compactor; the rank error shrinks as about 1/k.
+        @param seed Optional seed of the coin flips, for reproducible sketches.
+        @throws ValueError if k is lower than 2.
+        """
+        if k < 2:
+            raise ValueError("The sketch capacity k must be at least 2.")
+        self.k = k
+        self.count = 0  # Number of values added, i.e. total weight of the items kept
+        self.compactors = [[]]
+        self.size = 0  # Number of items kept over all the levels
+        self.max_size = self._capacity(0)
+        self._random = random.Random(seed)
+
+    def _capacity(self, level):
+        """@brief Capacity of a level: k at the top, shrinking by 2/3 per level below it."""
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _grow(self):
+        """@brief Add a level on top of the stack and update the size limit."""
+        self.compactors.append([])
+        self.max_size = sum(self._capacity(level) for level in range(len(self.compactors)))
+
+    def _compress(self):
+        """@brief Compact full levels until the sketch fits in its size limit again."""
+        while self.size >= self.max_size:
+            for level, items in enumerate(self.compactors):
+                if len(items) < self._capacity(level):
+                    continue
+                if level + 1 == len(self.compactors):
+                    self._grow()
+                items.sort()
+                # Keep one item back on odd lengths so that weights are preserved exactly
+                kept = [items.pop()] if len(items) % 2 else []
+                promoted = items[self._random.randint(0, 1)::2]
+                self.compactors[level + 1].extend(promoted)
+                self.size += len(promoted) - len(items)
+                items[:] = kept
+                break
+
+    def add(self, value):
+        """@brief Add one value to the sketch."""
+        self.compactors[0].append(value)
+        self.count += 1
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        """@brief Fold another sketch with the same k into this one.
+        @throws ValueError if the sketches have different capacities.
+        """
+        if other.k != self.k:
+            raise ValueError("Cannot merge quantile sketches with different k.")
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.count += other.count
+        self.size += other.size
+        self._compress()
+        return self
+
+    def value_at(self, rank):
+        """@brief Approximate value of the given rank (0 for the smallest value), None if empty."""
+        if not self.count:
+            return None
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self.compactors) for value in items)
+        seen = 0
+        for value, weight in weighted:
+            seen += weight
+            if seen > rank:
+                return value
+        return weighted[-1][0]
+
+    def quantile(self, q):
+        """@brief Approximate q-quantile (0 <= q <= 1), None if empty."""
+        return self.value_at(int(q * (self.count - 1)))
+
+    def to_dict(self):
+        """@brief JSON-friendly form of the sketch, to send it to another process."""
+        return {"k": self.k, "count": self.count, "compactors": [list(items) for items in self.compactors]}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        """@brief Rebuild a sketch from to_dict."""
+        sketch = cls(data["k"], seed)
+        for _ in data["compactors"][1:]:
+            sketch._grow()
+        sketch.compactors = [list(items) for items in data["compactors"]]
+        sketch.count = data["count"]
+        sketch.size = sum(len(items) for items in sketch.compactors)
+        return sketch
+
+
+class HeavyHitters:
+    """
+    @class HeavyHitters
+    @brief Misra-Gries summary: at most `capacity` counters, each a lower bound of the true count.
+    """
+
+    def __init__(self, capacity=64):
+        """@brief Constructor for the HeavyHitters class.
+        @param capacity The maximum number of counters kept.
+        @throws ValueError if the capacity is not positive.
+        """
+        if capacity < 1:
+            raise ValueError("The heavy hitters capacity must be at least 1.")
+        self.capacity = capacity
+        self.counters = {}
+        self.count = 0  # Number of values added
+        self.error = 0  # Largest possible undercount of any counter, at most count / (capacity + 1)
+
+    def _reduce(self):
+        """@brief Subtract the (capacity + 1)-th largest counter from all of them and drop the empty ones."""
+        if len(self.counters) <= self.capacity:
+            return
+        cut = sorted(self.counters.values(), reverse=True)[self.capacity]
+        self.counters = {value: count - cut for value, count in self.counters.items() if count > cut}
+        self.error += cut
+
+    def add(self, value, count=1):
+        """@brief Count a value (count times)."""
+        self.counters[value] = self.counters.get(value, 0) + count
+        self.count += count
+        self._reduce()
+
+    def merge(self, other):
+        """@brief Fold another summary into this one; the error bound stays count / (capacity + 1)."""
+        for value, count in other.counters.items():
+            self.counters[value] = self.counters.get(value, 0) + count
+        self.count += other.count
+        self.error += other.error
+        self._reduce()
+        return self
+
+    def estimate(self, value):
+        """@brief Lower bound of the number of times a value was counted."""
+        return self.counters.get(value, 0)
+
+    def most_common(self):
+        """@brief The value with the highest counter (ties go to the lowest value) and its counter, None if empty."""
+        if not self.counters:
+            return None
+        return min(self.counters.items(), key=lambda item: (-item[1], item[0]))
+
+    def to_dict(self):
+        """@brief JSON-friendly form of the summary, to send it to another process."""
+        return {"capacity": self.capacity, "count": self.count, "error": self.error,
+                "counters": [[value, count] for value, count in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """@brief Rebuild a summary from to_dict."""
+        summary = cls(data["capacity"])
+        summary.counters = {value: count for value, count in data["counters"]}
+        summary.count = data["count"]
+        summary.error = data["error"]
+        return summary
+
+
+class VoteSketch:
+    """
+    @class VoteSketch
+    @brief Bounded-size, mergeable summary of the integer-coded votes of one round.
+    """
+
+    def __init__(self, k=200, capacity=64, seed=None):
+        """@brief Constructor for the VoteSketch class.
+        @param k Capacity of the quantile sketch (median rule).
+        @param capacity Number of counters of the heavy hitters (majority rules).
+        @param seed Optional seed of the quantile sketch.
+        """
+        self.quantiles = QuantileSketch(k, seed)
+        self.heavy_hitters = HeavyHitters(capacity)
+        self.total = 0  # Players counted, masked votes included
+        self.numeric = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, code):
+        """@brief Count one integer-coded vote (see aggregation.encode_vote)."""
+        self.total += 1
+        if code in (JOKER, MISSING):
+            return
+        self.numeric += 1
+        self.sum += code
+        self.min = code if self.min is None else min(self.min, code)
+        self.max = code if self.max is None else max(self.max, code)
+        self.quantiles.add(code)
+        self.heavy_hitters.add(code)
+
+    def add_row(self, row):
+        """@brief Count a row of integer-coded votes."""
+        for code in row:
+            self.add(code)
+        return self
+
+    def merge(self, other):
+        """@brief Fold the sketch of another shard of the same round into this one."""
+        self.total += other.total
+        self.numeric += other.numeric
+        self.sum += other.sum
+        for bound in (other.min, other.max):
+            if bound is not None:
+                self.min = bound if self.min is None else min(self.min, bound)
+                self.max = bound if self.max is None else max(self.max, bound)
+        self.quantiles.merge(other.quantiles)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        return self
+
+    def verdict(self, rules):
+        """@brief Apply a rule to the sketched round, with the semantics of aggregation.verdict.
+        @details strict and average are exact. The median is read from the quantile sketch.
+        The majorities use the heavy hitters counters, which never overcount: an absolute
+        majority is only granted when it is certain.
+        @param rules The voting rule ("strict", "average", "median", ...).
+        @return A (difficulty, validated) tuple; difficulty is None if the feature is not validated.
+        """
+        if not self.numeric:
+            return None, False
+
+        if rules == "strict":
+            if self.min == self.max and self.numeric == self.total:
+                return self.min, True
+            return None, False
+
+        if rules == "average":
+            return self.sum / self.numeric, True
+
+        if rules == "median":
+            lower = self.quantiles.value_at((self.numeric - 1) // 2)
+            upper = self.quantiles.value_at(self.numeric // 2)
+            if self.numeric % 2 == 0:
+                return (lower + upper) / 2, True
+            return upper, True
+
+        if rules in ("absolute_majority", "relative_majority"):
+            best_value, best_count = self.heavy_hitters.most_common()
+            if rules == "relative_majority" or best_count > self.total / 2:
+                return best_value, True
+            return None, False
+
+        return None, False
+
+    def to_dict(self):
+        """@brief JSON-friendly form of the sketch, to send it to another process."""
+        return {"total": self.total, "numeric": self.numeric, "sum": self.sum, "min": self.min, "max": self.max,
+                "quantiles": self.quantiles.to_dict(), "heavy_hitters": self.heavy_hitters.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        """@brief Rebuild a sketch from to_dict."""
+        sketch = cls()
+        sketch.quantiles = QuantileSketch.from_dict(data["quantiles"], seed)
+        sketch.heavy_hitters = HeavyHitters.from_dict(data["heavy_hitters"])
+        for key in ("total", "numeric", "sum", "min", "max"):
+            setattr(sketch, key, data[key])
+        return sketch
+
+
+def merge_sketches(sketches):
+    """@brief Merge the partial sketches of one round into a new sketch.
+    @param sketches A non-empty iterable of VoteSketch, e.g. one per shard.
+    @return The merged VoteSketch; the partial sketches are left untouched.
+    @throws ValueError if there is no sketch to merge.
+    """
+    merged = None
+    for sketch in sketches:
+        if merged is None:
+            merged = VoteSketch.from_dict(sketch.to_dict())
+        else:
+            merged.merge(sketch)
+    if merged is None:
+        raise ValueError("No sketch to merge.")
+    return merged
@@ -0,0 +1,265 @@
+from array import array
+import json
+import math
+import mmap
+import struct
+import sys
+from models.storage import atomic_write
+
+
+## @file snapshot.py
+#  @brief Compact binary snapshot format for game states and final reports.
+#
+#  Layout (little-endian, every section aligned on 8 bytes):
+#  - header: magic, version, kind, task count, player count, string count;
+#  - string table: offsets (uint32, string count + 1) then the UTF-8 blob,
+#    holding descriptions, pseudonyms, cards and extra task fields;
+#  - task columns: description string, id, difficulty (float64), extra
+#    fields string (JSON, -1 if none) and flags;
+#  - player columns: pseudo string and vote string (-1 if no vote).
+#
+#  SnapshotView memory-maps a file and decodes single fields on demand.
+
+MAGIC = b"PPSNAP\x00\x01"
+VERSION = 1
+KIND_GAME_STATE = 0
+KIND_REPORT = 1
+
+_HEADER = struct.Struct("<8sHHIII4x")
+
+# Task flags
+_HAS_DIFFICULTY = 1
+_DIFFICULTY_IS_INT = 2
+_HAS_VALIDATED = 4
+_VALIDATED = 8
+_HAS_ID = 16
+
+_KNOWN_KEYS = ("description", "id", "difficulty", "validated")
+
+
+def _pad(data):
+    return data + b"\x00" * (-len(data) % 8)
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if sys.byteorder != "little":
+        column.byteswap()
+    return _pad(column.tobytes())
+
+
+def is_snapshot(filepath):
+    """@brief True if the file starts with the binary snapshot magic number."""
+    try:
+        with open(filepath, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def encode_snapshot(state):
+    """@brief Encode a game state or a final report as a binary snapshot.
+    @param state Dict in the game_state.json layout ({"backlog", "players"}) or final_report.json layout ({"tasks"}).
+    @return The bytes of the snapshot.
+    """
+    kind = KIND_REPORT if "tasks" in state else KIND_GAME_STATE
+    tasks = state["tasks"] if kind == KIND_REPORT else state.get("backlog", [])
+    players = state.get("players", [])
+    strings = {}
+
+    def intern(text):
+        if text not in strings:
+            strings[text] = len(strings)
+        return strings[text]
+
+    descriptions, ids, difficulties, extras, flags = [], [], [], [], []
+    for task in tasks:
+        descriptions.append(intern(task.get("description", "")))
+        flag = 0
+        if isinstance(task.get("id"), int):
+            flag |= _HAS_ID
+        ids.append(task["id"] if flag & _HAS_ID else 0)
+        difficulty = task.get("difficulty")
+        if difficulty is not None:
+            flag |= _HAS_DIFFICULTY | (_DIFFICULTY_IS_INT if isinstance(difficulty, int) else 0)
+        difficulties.append(math.nan if difficulty is None else float(difficulty))
+        if "validated" in task:
+            flag |= _HAS_VALIDATED | (_VALIDATED if task["validated"] else 0)
+        extra = {key: value for key, value in task.items() if key not in _KNOWN_KEYS}
+        if "difficulty" in task and difficulty is None:
+            extra["difficulty"] = None  # Keep an explicit null apart from a missing key
+        if "id" in task and not flag & _HAS_ID:
+            extra["id"] = task["id"]
+        extras.append(intern(json.dumps(extra, ensure_ascii=False)) if extra else -1)
+        flags.append(flag)
+
+    pseudos = [intern(player["pseudo"]) for player in players]
+    votes = [-1 if player.get("vote") in (None, "") else intern(player["vote"]) for player in players]
+
+    blob = bytearray()
+    offsets = [0]
+    for text in strings:
+        blob += text.encode("utf-8")
+        offsets.append(len(blob))
+
+    return b"".join([
+        _HEADER.pack(MAGIC, VERSION, kind, len(tasks), len(players), len(strings)),
+        _column("I", offsets),
+        _pad(bytes(blob)),
+        _column("I", descriptions),
+        _column("q", ids),
+        _column("d", difficulties),
+        _column("i", extras),
+        _column("B", flags),
+        _column("I", pseudos),
+        _column("i", votes),
+    ])
+
+
+def write_snapshot(filepath, state):
+    """@brief Write a game state or a final report as a binary snapshot file (atomically).
+    @param filepath The path of the snapshot.
+    @param state Dict in the game_state.json or final_report.json layout.
+    """
+    atomic_write(filepath, encode_snapshot(state), mode="wb")
+
+
+class SnapshotView:
+    """
+    @class SnapshotView
+    @brief Read-only, memory-mapped access to a binary snapshot.
+
+    Opening a snapshot only reads its header; tasks and players are decoded
+    one field at a time from the mapped columns.
+    """
+
+    def __init__(self, filepath):
+        """@brief Constructor for the SnapshotView class.
+        @param filepath The path of the snapshot.
+        @throws ValueError if the file is not a valid snapshot.
+        """
+        with open(filepath, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < _HEADER.size:
+            self.map.close()
+            raise ValueError("Le fichier de sauvegarde est corrompu ou invalide.")
+        magic, version, self.kind, self.task_count, self.player_count, string_count = _HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError("Le fichier de sauvegarde est corrompu ou invalide.")
+        self._views = []
+        try:
+            position = _HEADER.size
+            self.string_offsets, position = self._cast(position, "I", string_count + 1)
+            self.blob_start = position
+            position += -(-self.string_offsets[string_count] // 8) * 8
+            self.descriptions, position = self._cast(position, "I", self.task_count)
+            self.ids, position = self._cast(position, "q", self.task_count)
+            self.difficulties, position = self._cast(position, "d", self.task_count)
+            self.extras, position = self._cast(position, "i", self.task_count)
+            self.flags, position = self._cast(position, "B", self.task_count)
+            self.pseudos, position = self._cast(position, "I", self.player_count)
+            self.votes, position = self._cast(position, "i", self.player_count)
+        except ValueError:
+            self.close()
+            raise
+
+    def _cast(self, position, typecode, count):
+        size = array(typecode).itemsize * count
+        if position + size > len(self.map):
+            raise ValueError("Le fichier de sauvegarde est corrompu ou invalide.")
+        view = memoryview(self.map)[position:position + size].cast(typecode)
+        self._views.append(view)
+        if sys.byteorder != "little":
+            view = array(typecode, view)
+            view.byteswap()
+        return view, position + -(-size // 8) * 8
+
+    def close(self):
+        """@brief Release the memory map."""
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def string(self, index):
+        """@brief Decode one entry of the string table."""
+        start = self.blob_start + self.string_offsets[index]
+        end = self.blob_start + self.string_offsets[index + 1]
+        return self.map[start:end].decode("utf-8")
+
+    def description(self, index):
+        """@brief Description of the task at a given position."""
+        return self.string(self.descriptions[index])
+
+    def task(self, index):
+        """@brief Decode the task at a given position.
+        @return The task dict, as it was in the JSON layout.
+        """
+        flag = self.flags[index]
+        task = {"description": self.description(index)}
+        if flag & _HAS_DIFFICULTY:
+            difficulty = self.difficulties[index]
+            task["difficulty"] = int(difficulty) if flag & _DIFFICULTY_IS_INT else difficulty
+        if flag & _HAS_VALIDATED:
+            task["validated"] = bool(flag & _VALIDATED)
+        if flag & _HAS_ID:
+            task["id"] = self.ids[index]
+        if self.extras[index] >= 0:
+            task.update(json.loads(self.string(self.extras[index])))
+        return task
+
+    def tasks(self):
+        """@brief Iterate over the tasks."""
+        return (self.task(index) for index in range(self.task_count))
+
+    def player(self, index):
+        """@brief Decode the player at a given position in the game_state.json layout."""
+        vote = self.votes[index]
+        return {"pseudo": self.string(self.pseudos[index]), "vote": None if vote < 0 else self.string(vote)}
+
+    def players(self):
+        """@brief Iterate over the players."""
+        return (self.player(index) for index in range(self.player_count))
+
+    def to_dict(self):
+        """@brief Decode the whole snapshot in its JSON layout."""
+        if self.kind == KIND_REPORT:
+            return {"tasks": list(self.tasks())}
+        return {"backlog": list(self.tasks()), "players": list(self.players())}
+
+
+def read_snapshot(filepath):
+    """@brief Read a whole binary snapshot.
+    @return A dict in the game_state.json or final_report.json layout.
+    """
+    with SnapshotView(filepath) as view:
+        return view.to_dict()
+
+
+def json_to_snapshot(json_path, snapshot_path):
+    """@brief Convert a game_state.json or final_report.json file to a binary snapshot."""
+    with open(json_path, "r", encoding="utf-8") as file:
+        write_snapshot(snapshot_path, json.load(file))
+
+
+def snapshot_to_json(snapshot_path, json_path):
+    """@brief Convert a binary snapshot back to its JSON file."""
+    atomic_write(json_path, json.dumps(read_snapshot(snapshot_path), ensure_ascii=False, indent=4))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m models.snapshot <source> <destination>")
+        sys.exit(1)
+    if is_snapshot(sys.argv[1]):
+        snapshot_to_json(sys.argv[1], sys.argv[2])
+    else:
+        json_to_snapshot(sys.argv[1], sys.argv[2])
+    print(f"{sys.argv[1]} converted to {sys.argv[2]}.")
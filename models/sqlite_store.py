@@ -0,0 +1,323 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from models.storage import Storage
+
+
+## @file sqlite_store.py
+#  @brief SQLite database holding the games, reports and votes of many sessions.
+#
+#  Every game is a session identified by a string ID (e.g. "team-a/sprint-12").
+#  The backlog of a session is stored in the features table, the table in the
+#  players table and every vote of every round in the votes table, so past
+#  sessions can be queried (average difficulty per team over a quarter, votes
+#  of a player...) through the indexes instead of loading JSON files.
+#
+#  The database runs in WAL mode: readers never block the writer. A state is
+#  saved in one transaction and votes are buffered and inserted in batches.
+#  SQLiteStore implements the models.storage.Storage interface.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    team TEXT,
+    rules TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS features (
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    feature_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    description TEXT,
+    difficulty REAL,
+    validated INTEGER NOT NULL DEFAULT 0,
+    rounds INTEGER,
+    estimated REAL,
+    extra TEXT,
+    saved REAL NOT NULL,
+    PRIMARY KEY (session_id, feature_id)
+);
+CREATE TABLE IF NOT EXISTS players (
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    seat INTEGER NOT NULL,
+    pseudo TEXT,
+    vote TEXT,
+    PRIMARY KEY (session_id, seat)
+);
+CREATE TABLE IF NOT EXISTS backlog (
+    position INTEGER PRIMARY KEY,
+    task TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS votes (
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    feature_id INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    seat INTEGER NOT NULL,
+    pseudo TEXT,
+    card TEXT,
+    value REAL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_team ON sessions (team, created);
+CREATE INDEX IF NOT EXISTS sessions_by_date ON sessions (created);
+CREATE INDEX IF NOT EXISTS features_by_date ON features (estimated) WHERE validated;
+CREATE INDEX IF NOT EXISTS votes_by_feature ON votes (session_id, feature_id, round);
+CREATE INDEX IF NOT EXISTS votes_by_player ON votes (pseudo, timestamp);
+CREATE INDEX IF NOT EXISTS votes_by_date ON votes (timestamp);
+"""
+
+## Task fields stored in their own columns; the others go to features.extra as JSON
+_FEATURE_FIELDS = ("id", "description", "difficulty", "validated")
+
+
+def quarter_start(timestamp=None):
+    """@brief Start of the calendar quarter (local time) containing a timestamp.
+    @param timestamp Seconds since the epoch, now by default.
+    @return The timestamp of the first day of the quarter at midnight.
+    """
+    date = datetime.datetime.fromtimestamp(time.time() if timestamp is None else timestamp)
+    return datetime.datetime(date.year, 3 * ((date.month - 1) // 3) + 1, 1).timestamp()
+
+
+class SQLiteStore(Storage):
+    """
+    @class SQLiteStore
+    @brief Multi-session storage of games on top of sqlite3, with indexed history queries.
+    """
+
+    records_votes = True
+
+    def __init__(self, path="data/planning_poker.db", batch_size=500):
+        """@brief Constructor for the SQLiteStore class; creates the database if needed.
+        @param path The database file (":memory:" for a private in-memory database).
+        @param batch_size Number of buffered votes that triggers an insert.
+        """
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.batch_size = batch_size
+        self.pending_votes = []
+        self.lock = threading.RLock()  # The connection is shared with the autosave and server threads
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def data_dir(self, name):
+        """@brief Directory next to the database file, None for an in-memory database."""
+        if self.path == ":memory:":
+            return None
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), name)
+
+    def close(self):
+        """@brief Write the buffered votes and close the database."""
+        with self.lock:
+            self.flush()
+            self.connection.close()
+
+    def _transaction(self, statements):
+        """@brief Run (sql, parameters) pairs in one transaction; a list of parameters runs executemany."""
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parameters in statements:
+                    if isinstance(parameters, list):
+                        cursor.executemany(sql, parameters)
+                    else:
+                        cursor.execute(sql, parameters)
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def _query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def _session_statement(self, session_id, rules, team, now):
+        return ("INSERT INTO sessions (id, team, rules, created, updated) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET team = coalesce(excluded.team, team), "
+                "rules = coalesce(excluded.rules, rules), updated = excluded.updated",
+                (session_id, team, rules, now, now))
+
+    def create_session(self, session_id, rules=None, team=None):
+        """@brief Register a session, or update its rules and team if it exists.
+        @param session_id The identifier of the session.
+        @param rules The voting rules of the game.
+        @param team Optional name of the team, used to group the queries.
+        """
+        self._transaction([self._session_statement(session_id, rules, team, time.time())])
+
+    def session(self, session_id):
+        """@brief Description of a session.
+        @return A dict with the "id", "team", "rules", "created", "updated" and "finished" fields.
+        @throws FileNotFoundError if the session does not exist, like a missing save file.
+        """
+        rows = self._query("SELECT id, team, rules, created, updated, finished FROM sessions WHERE id = ?",
+                           (session_id,))
+        if not rows:
+            raise FileNotFoundError(f"Session introuvable : {session_id}")
+        return dict(zip(("id", "team", "rules", "created", "updated", "finished"), rows[0]))
+
+    def has_state(self, session_id):
+        return bool(self._query("SELECT 1 FROM sessions WHERE id = ?", (session_id,)))
+
+    def load_backlog(self):
+        rows = self._query("SELECT task FROM backlog ORDER BY position")
+        if not rows:
+            raise FileNotFoundError("Backlog introuvable.")
+        return [json.loads(task) for task, in rows]
+
+    def save_backlog(self, tasks):
+        self._transaction([("DELETE FROM backlog", ()),
+                           ("INSERT INTO backlog (position, task) VALUES (?, ?)",
+                            [(position, json.dumps(task, ensure_ascii=False)) for position, task in enumerate(tasks)])])
+
+    def sessions(self, team=None):
+        """@brief IDs of the sessions, oldest first, optionally of one team only."""
+        if team is None:
+            return [row[0] for row in self._query("SELECT id FROM sessions ORDER BY created")]
+        return [row[0] for row in self._query("SELECT id FROM sessions WHERE team = ? ORDER BY created", (team,))]
+
+    def save_state(self, session_id, state, rules=None, team=None):
+        """@brief Save a game state in one transaction.
+        @param session_id The identifier of the session.
+        @param state The state in the game_state.json layout ({"backlog": [...], "players": [...]});
+        every task needs an "id".
+        @param rules The voting rules of the game.
+        @param team Optional name of the team.
+        """
+        now = time.time()
+        features = []
+        for position, task in enumerate(state.get("backlog", [])):
+            extra = {key: value for key, value in task.items() if key not in _FEATURE_FIELDS}
+            validated = bool(task.get("validated", False))
+            features.append((session_id, task["id"], position, task.get("description"), task.get("difficulty"),
+                             validated, now if validated else None, json.dumps(extra, ensure_ascii=False) if extra else None,
+                             now))
+        players = [(session_id, seat, player.get("pseudo"), player.get("vote", ""))
+                   for seat, player in enumerate(state.get("players", []))]
+        with self.lock:
+            self.flush()
+            self._transaction([
+                self._session_statement(session_id, rules, team, now),
+                ("INSERT INTO features (session_id, feature_id, position, description, difficulty, validated, "
+                 "estimated, extra, saved) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                 "ON CONFLICT (session_id, feature_id) DO UPDATE SET position = excluded.position, "
+                 "description = excluded.description, difficulty = excluded.difficulty, "
+                 "validated = excluded.validated, extra = excluded.extra, saved = excluded.saved, "
+                 # Keep the date of the first validation
+                 "estimated = CASE WHEN excluded.validated THEN coalesce(estimated, excluded.estimated) END", features),
+                ("DELETE FROM features WHERE session_id = ? AND saved <> ?", (session_id, now)),
+                ("DELETE FROM players WHERE session_id = ?", (session_id,)),
+                ("INSERT INTO players (session_id, seat, pseudo, vote) VALUES (?, ?, ?, ?)", players),
+            ])
+
+    def load_state(self, session_id):
+        """@brief Load the state of a session.
+        @return The state in the game_state.json layout.
+        @throws FileNotFoundError if the session does not exist, like a missing save file.
+        """
+        self.session(session_id)
+        backlog = []
+        for feature_id, description, difficulty, validated, extra in self._query(
+                "SELECT feature_id, description, difficulty, validated, extra FROM features "
+                "WHERE session_id = ? ORDER BY position", (session_id,)):
+            task = {"id": feature_id, "description": description, "difficulty": _number(difficulty)}
+            if validated:
+                task["validated"] = True
+            if extra:
+                task.update(json.loads(extra))
+            backlog.append(task)
+        players = [{"pseudo": pseudo, "vote": vote} for pseudo, vote in self._query(
+            "SELECT pseudo, vote FROM players WHERE session_id = ? ORDER BY seat", (session_id,))]
+        return {"backlog": backlog, "players": players}
+
+    def add_votes(self, session_id, feature_id, round_number, votes, timestamp=None):
+        """@brief Buffer the votes of one round; they are inserted in batches.
+        @param session_id The identifier of the session.
+        @param feature_id The stable ID of the feature.
+        @param round_number The round number for this feature.
+        @param votes (pseudo, card, value) of every player in seating order; value is None for cards such as 'joker'.
+        @param timestamp The time of the round, time.time() by default.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            self.pending_votes.extend((session_id, feature_id, round_number, seat, pseudo, card, value, timestamp)
+                                      for seat, (pseudo, card, value) in enumerate(votes))
+            if len(self.pending_votes) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """@brief Insert the buffered votes in one transaction."""
+        with self.lock:
+            if not self.pending_votes:
+                return
+            votes, self.pending_votes = self.pending_votes, []
+            self._transaction([("INSERT INTO votes (session_id, feature_id, round, seat, pseudo, card, value, timestamp) "
+                                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", votes)])
+
+    def save_report(self, session_id, tasks, rounds=None):
+        """@brief Save the final report of a session and mark it finished.
+        @param session_id The identifier of the session.
+        @param tasks The tasks of the report; every task needs an "id".
+        @param rounds Optional dict mapping feature IDs to the number of rounds they needed.
+        """
+        rounds = rounds or {}
+        now = time.time()
+        with self.lock:
+            self.flush()
+            self._transaction([
+                ("UPDATE features SET difficulty = ?, validated = ?, rounds = ?, "
+                 "estimated = CASE WHEN ? THEN coalesce(estimated, ?) END WHERE session_id = ? AND feature_id = ?",
+                 [(task.get("difficulty"), bool(task.get("validated", False)), rounds.get(task["id"]),
+                   bool(task.get("validated", False)), now, session_id, task["id"]) for task in tasks]),
+                ("UPDATE sessions SET finished = ?, updated = ? WHERE id = ?", (now, now, session_id)),
+            ])
+
+    def load_report(self, session_id):
+        """@brief The tasks of the final report of a session with the rounds they needed, in backlog order.
+        @throws FileNotFoundError if the session has no final report.
+        """
+        if self.session(session_id)["finished"] is None:
+            raise FileNotFoundError(f"Rapport introuvable : {session_id}")
+        return [{"id": feature_id, "description": description, "difficulty": _number(difficulty),
+                 "validated": bool(validated), "rounds": rounds}
+                for feature_id, description, difficulty, validated, rounds in self._query(
+                    "SELECT feature_id, description, difficulty, validated, rounds FROM features "
+                    "WHERE session_id = ? ORDER BY position", (session_id,))]
+
+    def difficulty_by_team(self, since=None, until=None):
+        """@brief Number and mean difficulty of the features estimated in a period, per team.
+        @param since Start of the period (seconds since the epoch), e.g. quarter_start().
+        @param until End of the period (excluded), now by default.
+        @return A dict mapping each team (None for sessions without a team) to (features, mean difficulty).
+        """
+        rows = self._query(
+            "SELECT sessions.team, count(*), avg(features.difficulty) FROM features "
+            "JOIN sessions ON sessions.id = features.session_id "
+            "WHERE features.validated AND features.estimated >= ? AND features.estimated < ? "
+            "AND features.difficulty IS NOT NULL GROUP BY sessions.team",
+            (since or 0, until or time.time() + 1))
+        return {team: (count, mean) for team, count, mean in rows}
+
+    def player_votes(self, pseudo, since=None, until=None):
+        """@brief Votes of a player across every session in a period.
+        @return A list of (session ID, feature ID, round, card, timestamp) tuples, oldest first.
+        """
+        self.flush()
+        return self._query(
+            "SELECT session_id, feature_id, round, card, timestamp FROM votes "
+            "WHERE pseudo = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+            (pseudo, since or 0, until or time.time() + 1))
+
+
+def _number(value):
+    """@brief Difficulties are stored as REAL; give back integers as int."""
+    return int(value) if isinstance(value, float) and value.is_integer() else value
@@ -0,0 +1,258 @@
+import json
+import os
+
+
+## @file storage.py
+#  @brief Storage backends of the games and low-level file helpers shared by the persistence code.
+#
+#  Game, main.py and app.py read the backlog and save states and reports
+#  through a Storage, by session ID:
+#  - JsonFileStorage: the usual JSON files under a base directory (data/ by default);
+#  - MemoryStorage: dicts in memory, for tests and benchmarks that must not touch the disk;
+#  - models.sqlite_store.SQLiteStore: many sessions in one SQLite database.
+#  File-backed storages also give the path of each file, so that the journal,
+#  binary snapshots, the autosaver and streamed reports keep working on them,
+#  and the directories of the vote history and of the similarity index.
+
+DEFAULT_SESSION = "default"
+
+
+def atomic_write(filepath, data, mode="w", encoding="utf-8"):
+    """@brief Write a file atomically: write a temporary file next to it, then os.replace it.
+    @details A crash during the write leaves the previous version of the file intact.
+    @param filepath The path of the file to write.
+    @param data The text (or bytes with mode "wb") to write.
+    @param mode "w" for text, "wb" for bytes.
+    @param encoding The encoding used in text mode.
+    """
+    import tempfile
+    directory = os.path.dirname(os.path.abspath(filepath))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(filepath))
+    try:
+        with os.fdopen(fd, mode, **({} if "b" in mode else {"encoding": encoding})) as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class Storage:
+    """
+    @class Storage
+    @brief Interface of the storage backends: backlog, game states and final reports by session.
+    """
+
+    records_votes = False  # True if add_votes() keeps the votes of every round
+
+    def backlog_path(self):
+        """@brief Path of the backlog file, None if the backlog is not stored in a file."""
+        return None
+
+    def state_path(self, session_id):
+        """@brief Path of the game state file of a session, None if states are not stored in files."""
+        return None
+
+    def report_path(self, session_id):
+        """@brief Path of the final report file of a session, None if reports are not stored in files."""
+        return None
+
+    def data_dir(self, name):
+        """@brief Directory of other data kept next to the games (e.g. "history", "similarity"),
+        None if the storage has no directory.
+        """
+        return None
+
+    def load_backlog(self):
+        """@brief The shared backlog, a list of tasks.
+        @throws FileNotFoundError if there is no backlog.
+        """
+        raise NotImplementedError
+
+    def save_backlog(self, tasks):
+        """@brief Replace the shared backlog."""
+        raise NotImplementedError
+
+    def has_state(self, session_id):
+        """@brief True if a game state is saved for the session."""
+        raise NotImplementedError
+
+    def load_state(self, session_id):
+        """@brief The game state of a session in the game_state.json layout ({"backlog": [...], "players": [...]}).
+        @throws FileNotFoundError if no state is saved for the session.
+        """
+        raise NotImplementedError
+
+    def save_state(self, session_id, state, rules=None, team=None):
+        """@brief Save the game state of a session.
+        @param session_id The identifier of the session.
+        @param state The state in the game_state.json layout.
+        @param rules The voting rules of the game.
+        @param team Optional name of the team.
+        """
+        raise NotImplementedError
+
+    def save_report(self, session_id, tasks, rounds=None):
+        """@brief Save the final report of a session.
+        @param session_id The identifier of the session.
+        @param tasks The tasks of the report.
+        @param rounds Optional dict mapping feature IDs to the number of rounds they needed.
+        """
+        raise NotImplementedError
+
+    def load_report(self, session_id):
+        """@brief The tasks of the final report of a session.
+        @throws FileNotFoundError if no report is saved for the session.
+        """
+        raise NotImplementedError
+
+    def create_session(self, session_id, rules=None, team=None):
+        """@brief Register a session; storages without a session table have nothing to do."""
+
+    def session(self, session_id):
+        """@brief Description of a session ("id" and "rules", None when unknown).
+        @throws FileNotFoundError if no state is saved for the session.
+        """
+        if not self.has_state(session_id):
+            raise FileNotFoundError(f"Session introuvable : {session_id}")
+        return {"id": session_id, "rules": None}
+
+    def add_votes(self, session_id, feature_id, round_number, votes, timestamp=None):
+        """@brief Record the votes of one round (see records_votes); ignored by default."""
+
+    def flush(self):
+        """@brief Write anything buffered."""
+
+    def close(self):
+        """@brief Write anything buffered and release the storage."""
+        self.flush()
+
+
+class JsonFileStorage(Storage):
+    """
+    @class JsonFileStorage
+    @brief The JSON files of the game under a base directory.
+
+    The default session uses base_dir/game_state.json and base_dir/final_report.json;
+    other sessions get their own directory under base_dir/sessions.
+    """
+
+    def __init__(self, base_dir="data"):
+        """@brief Constructor for the JsonFileStorage class; nothing is created before the first save.
+        @param base_dir The data directory, relative paths being resolved when a file is opened.
+        """
+        self.base_dir = base_dir
+
+    def _path(self, session_id, filename):
+        if session_id == DEFAULT_SESSION:
+            return os.path.join(self.base_dir, filename)
+        from urllib.parse import quote
+        return os.path.join(self.base_dir, "sessions", quote(str(session_id), safe=""), filename)
+
+    def backlog_path(self):
+        return os.path.join(self.base_dir, "backlog.json")
+
+    def state_path(self, session_id):
+        return self._path(session_id, "game_state.json")
+
+    def report_path(self, session_id):
+        return self._path(session_id, "final_report.json")
+
+    def data_dir(self, name):
+        return os.path.join(self.base_dir, name)
+
+    def load_backlog(self):
+        with open(self.backlog_path(), "r", encoding="utf-8") as file:
+            return json.load(file).get("tasks", [])
+
+    def save_backlog(self, tasks):
+        atomic_write(self.backlog_path(), json.dumps({"tasks": tasks}, ensure_ascii=False, indent=4))
+
+    def has_state(self, session_id):
+        return os.path.exists(self.state_path(session_id))
+
+    def load_state(self, session_id):
+        with open(self.state_path(session_id), "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def save_state(self, session_id, state, rules=None, team=None):
+        atomic_write(self.state_path(session_id), json.dumps(state, ensure_ascii=False, indent=4))
+
+    def save_report(self, session_id, tasks, rounds=None):
+        from models.report import report_writer
+        rounds = rounds or {}
+        with report_writer(self.report_path(session_id)) as report:
+            for task in tasks:
+                report.write(task, rounds.get(task.get("id")))
+
+    def load_report(self, session_id):
+        with open(self.report_path(session_id), "r", encoding="utf-8") as file:
+            return json.load(file)["tasks"]
+
+
+class MemoryStorage(Storage):
+    """
+    @class MemoryStorage
+    @brief Storage kept in dicts: no file is ever opened, so games can run in parallel without sharing anything.
+
+    Values are copied through JSON on the way in and out, so a game never shares
+    its lists with the storage, as with files.
+    """
+
+    def __init__(self, backlog=None):
+        """@brief Constructor for the MemoryStorage class.
+        @param backlog Optional initial backlog, a list of tasks.
+        """
+        self.backlog = None if backlog is None else json.dumps(backlog)
+        self.states = {}  # session ID -> JSON text
+        self.reports = {}  # session ID -> JSON text
+
+    def load_backlog(self):
+        if self.backlog is None:
+            raise FileNotFoundError("Backlog introuvable.")
+        return json.loads(self.backlog)
+
+    def save_backlog(self, tasks):
+        self.backlog = json.dumps(tasks)
+
+    def has_state(self, session_id):
+        return session_id in self.states
+
+    def load_state(self, session_id):
+        if session_id not in self.states:
+            raise FileNotFoundError(f"Session introuvable : {session_id}")
+        return json.loads(self.states[session_id])
+
+    def save_state(self, session_id, state, rules=None, team=None):
+        self.states[session_id] = json.dumps(state)
+
+    def save_report(self, session_id, tasks, rounds=None):
+        self.reports[session_id] = json.dumps(list(tasks))
+
+    def load_report(self, session_id):
+        if session_id not in self.reports:
+            raise FileNotFoundError(f"Rapport introuvable : {session_id}")
+        return json.loads(self.reports[session_id])
+
+
+_default_storage = None
+
+
+def default_storage():
+    """@brief The storage used by games created without one: JsonFileStorage("data") unless use_storage() changed it."""
+    global _default_storage
+    if _default_storage is None:
+        _default_storage = JsonFileStorage()
+    return _default_storage
+
+
+def use_storage(storage):
+    """@brief Set the storage of the games created without one (e.g. MemoryStorage() in a test suite).
+    @param storage The Storage, or None to go back to JsonFileStorage("data").
+    """
+    global _default_storage
+    _default_storage = storage
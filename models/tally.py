@@ -0,0 +1,120 @@
+from collections import Counter
+from models.aggregation import JOKER, MISSING, encode_vote, verdict
+from models.deck import FIBONACCI
+
+
+## @file tally.py
+#  @brief Incremental vote tally updated by each Player.vote / Player.reset_vote.
+
+
+class VoteTally:
+    """
+    @class VoteTally
+    @brief Running statistics of the current round, updated one vote at a time.
+
+    The tally keeps a count per card, the sum and count of numeric votes,
+    the number of jokers, and a Fenwick tree over the numeric card values
+    so the median is found in O(log k) for a deck of k cards.
+    """
+
+    def __init__(self, deck=FIBONACCI):
+        """@brief Constructor for the VoteTally class.
+        @param deck The Deck used at the table.
+        """
+        self.deck = deck
+        self.values = sorted({encode_vote(card, deck) for card in deck.cards} - {JOKER, MISSING})
+        self.ranks = {value: rank for rank, value in enumerate(self.values)}
+        self.tree = [0] * (len(self.values) + 1)
+        self.counts = Counter()  # Card -> number of players currently showing it
+        self.numeric_sum = 0
+        self.numeric_count = 0
+        self.joker_count = 0
+        self.voters = 0  # Players who have a card down
+        self.seats = 0  # Players bound to this tally
+
+    def _update_tree(self, value, delta):
+        index = self.ranks[value] + 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def _kth_value(self, k):
+        """@brief Return the k-th smallest numeric vote (0-based) by descending the Fenwick tree."""
+        position = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            following = position + step
+            if following < len(self.tree) and self.tree[following] <= k:
+                position = following
+                k -= self.tree[following]
+            step >>= 1
+        return self.values[position]
+
+    def _apply(self, card, delta):
+        if card is None or card == "":
+            return
+        self.counts[card] += delta
+        if not self.counts[card]:
+            del self.counts[card]
+        self.voters += delta
+        value = encode_vote(card, self.deck)
+        if value == JOKER:
+            self.joker_count += delta
+        elif value in self.ranks:
+            self.numeric_sum += value * delta
+            self.numeric_count += delta
+            self._update_tree(value, delta)
+
+    def add(self, card):
+        """@brief Record a card put down by a player.
+        @param card The card, or None if the player has not voted.
+        """
+        self._apply(card, 1)
+
+    def remove(self, card):
+        """@brief Withdraw a card previously recorded with add().
+        @param card The card, or None if the player had not voted.
+        """
+        self._apply(card, -1)
+
+    def replace(self, previous, card):
+        """@brief Replace a player's previous card by a new one (None clears the vote)."""
+        self.remove(previous)
+        self.add(card)
+
+    def median(self):
+        """@brief Median of the numeric votes, or None if there are none."""
+        if not self.numeric_count:
+            return None
+        lower = self._kth_value((self.numeric_count - 1) // 2)
+        upper = self._kth_value(self.numeric_count // 2)
+        if self.numeric_count % 2 == 0:
+            return (lower + upper) / 2
+        return upper
+
+    def all_joker(self):
+        """@brief True if every bound player has played the 'joker' card."""
+        return self.joker_count == self.seats
+
+    def verdict(self, rules):
+        """@brief Evaluate a rule on the votes currently on the table.
+        @param rules The voting rule ("strict", "average", "median", ...).
+        @return A (difficulty, validated) tuple, identical to aggregation.verdict on the same votes.
+        """
+        if not self.numeric_count:
+            return None, False
+        if rules == "strict":
+            if self.numeric_count == self.seats and len(self.counts) == 1:
+                return encode_vote(next(iter(self.counts)), self.deck), True
+            return None, False
+        if rules == "average":
+            return self.numeric_sum / self.numeric_count, True
+        if rules == "median":
+            return self.median(), True
+        # Majority rules read the per-card counts, bounded by the deck size
+        numeric = Counter()
+        for card, count in self.counts.items():
+            value = encode_vote(card, self.deck)
+            if value in self.ranks:
+                numeric[value] += count
+        return verdict(numeric, self.seats, rules)
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+import json
+from models.aggregation import RULES
+from models.game import Game
+from models.deadlines import TimerWheel
+from models.pipeline import VotingPipeline
+
+## @file server.py
+#  @brief Asyncio Planning Poker server hosting many concurrent game sessions.
+#
+#  Clients talk to the server over TCP with one JSON object per line:
+#  - {"op": "create", "session": id, "players": [...], "rules": "strict", "backlog": [...],
+#     "timeout": 30, "timeout_policy": "joker", "window": 1}
+#  - {"op": "join", "session": id}
+#  - {"op": "vote", "session": id, "player": pseudo, "card": "5", "feature": feature_id}
+#  - {"op": "state", "session": id}
+#
+#  Votes are accepted from every player in any order; once the whole table
+#  has voted the existing rule logic (Game.process_votes) runs and the
+#  result is pushed to every client that joined the session. With a timeout,
+#  players who have not voted in time follow the timeout policy (see
+#  models.deadlines); all the deadlines of the server share one timer wheel
+#  driven by the event loop. With a window above 1, that many features are
+#  open at once (see models.pipeline) and each vote names its feature.
+
+
+class Session:
+    """
+    @class Session
+    @brief A Game hosted by the server and the clients following it.
+    """
+
+    def __init__(self, session_id, game, notify=None, window=1):
+        """@brief Constructor for the Session class.
+        @param session_id The identifier chosen by the client that created the session.
+        @param game The Game instance holding the backlog and players.
+        @param notify Optional callback(recipients, events) used to push the events caused by a deadline.
+        @param window Number of features open for voting at once (pipelined voting above 1); the
+        window loaded with the game (Game.saved_pipeline) is reopened.
+        """
+        self.session_id = session_id
+        self.game = game
+        self.players = {player.pseudo: player for player in game.players}
+        self.subscribers = set()
+        self.notify = notify
+        self.window = window
+        self.pipeline = VotingPipeline(game, window, game.saved_pipeline) if window > 1 else None
+        game.on_deadline = self.deadline_expired
+
+    def describe(self):
+        """@brief Summary of the session sent to clients."""
+        feature = self.game.current_feature
+        return {
+            "session": self.session_id,
+            "rules": self.game.rules,
+            "feature": feature["description"] if feature else None,
+            "voted": self.game.tally.voters,
+            "players": len(self.game.players),
+            "remaining": self.game.remaining_time(),
+        } if self.pipeline is None else {
+            "session": self.session_id,
+            "rules": self.game.rules,
+            "open": [{"id": feature["id"], "description": feature["description"],
+                      "voted": len(self.players) - len(self.pipeline.waiting(feature["id"]))}
+                     for feature in self.pipeline.features()],
+            "players": len(self.game.players),
+        }
+
+    def vote(self, pseudo, card, feature_id=None):
+        """@brief Apply a vote and evaluate the round once every player has voted.
+        @param pseudo The pseudonym of the voting player.
+        @param card The card played.
+        @param feature_id The feature voted on, required with pipelined voting.
+        @return The list of events to push to the subscribers.
+        @throws ValueError if the player or the card is unknown, or if the backlog is finished.
+        """
+        if pseudo not in self.players:
+            raise ValueError(f"Unknown player: {pseudo}")
+        if self.pipeline is not None:
+            return self.pipelined_vote(pseudo, card, feature_id)
+        feature = self.game.current_feature
+        if feature is None:
+            raise ValueError("All features are already validated.")
+        self.game.cast_vote(self.players[pseudo], card)
+
+        return [{"event": "vote", "player": pseudo, **self.describe()}] + self.close_round()
+
+    def pipelined_vote(self, pseudo, card, feature_id):
+        """@brief Apply a vote on one of the open features and push its result once every player has voted on it."""
+        if self.pipeline.finished():
+            raise ValueError("All features are already validated.")
+        verdict = self.pipeline.vote(self.players[pseudo], feature_id, card)
+        events = [{"event": "vote", "player": pseudo, "feature": feature_id, **self.describe()}]
+        if verdict is None:
+            return events
+        feature = verdict["feature"]
+        events.append({
+            "event": "result",
+            "session": self.session_id,
+            "feature": feature["description"],
+            "id": feature["id"],
+            "validated": verdict["validated"],
+            "difficulty": verdict["difficulty"],
+        })
+        if self.pipeline.finished():
+            events.append({"event": "finished", "session": self.session_id, "report": self.game.backlog})
+        return events
+
+    def deadline_expired(self, player, policy):
+        """@brief Push the timeout of a player, and the result if it closes the round."""
+        events = [{"event": "timeout", "session": self.session_id, "player": player.pseudo, "policy": policy}]
+        events += self.close_round()
+        if self.notify is not None:
+            self.notify(set(self.subscribers), events)
+
+    def close_round(self):
+        """@brief Evaluate the round once every player has voted or timed out.
+        @return The result events, empty while the round is still open.
+        """
+        feature = self.game.current_feature
+        if feature is None or not self.game.round_complete():
+            return []
+        validated = self.game.process_votes()
+        events = [{
+            "event": "result",
+            "session": self.session_id,
+            "feature": feature["description"],
+            "validated": validated,
+            "difficulty": feature.get("difficulty") if validated else None,
+        }]
+        if validated and self.game.next_feature() is None:
+            events.append({"event": "finished", "session": self.session_id, "report": self.game.backlog})
+            return events
+        self.game.arm_deadlines()
+        return events
+
+
+class PlanningPokerServer:
+    """
+    @class PlanningPokerServer
+    @brief Asyncio TCP server hosting many Planning Poker sessions in one process.
+    """
+
+    def __init__(self, store=None):
+        """@brief Constructor for the PlanningPokerServer class.
+        @param store The models.storage.Storage the games are saved to, one session each
+        (models.storage.default_storage() by default).
+        """
+        self.store = store
+        self.sessions = {}
+        self.server = None
+        self.deadlines = TimerWheel()  # Vote deadlines of every session
+        self.ticker = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """@brief Start listening for clients.
+        @param host The interface to bind.
+        @param port The TCP port (0 picks a free one).
+        @return The port actually bound.
+        """
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.ticker = asyncio.create_task(self.tick_deadlines())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """@brief Serve clients until cancelled."""
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        """@brief Stop the server and wait for it to close."""
+        if self.ticker is not None:
+            self.ticker.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def tick_deadlines(self):
+        """@brief Advance the timer wheel of the vote deadlines, once per tick."""
+        while True:
+            await asyncio.sleep(self.deadlines.tick)
+            self.deadlines.advance()
+
+    def create_session(self, session_id, pseudos, rules="strict", backlog=None, timeout=None, timeout_policy="joker",
+                       window=1):
+        """@brief Create a new game session.
+        @param session_id The identifier of the session.
+        @param pseudos The pseudonyms of the players.
+        @param rules The voting rules to use for the game.
+        @param backlog Optional list of tasks; the default backlog file is used otherwise.
+        @param timeout Optional number of seconds each player has to vote in a round.
+        @param timeout_policy What happens to a player who does not vote in time (see models.deadlines.POLICIES).
+        @param window Number of features open for voting at once (see models.pipeline).
+        @return The new Session.
+        @throws ValueError if the session already exists or the parameters are invalid.
+        """
+        if session_id in self.sessions:
+            raise ValueError(f"Session already exists: {session_id}")
+        if rules not in RULES:
+            raise ValueError(f"Unknown rules: {rules}")
+        if not isinstance(window, int) or window < 1:
+            raise ValueError("The window must hold at least one feature.")
+        if timeout and window > 1:
+            raise ValueError("Vote deadlines are not supported with pipelined voting.")
+        if len(set(pseudos)) != len(pseudos) or len(pseudos) < 2:
+            raise ValueError("A session needs at least two players with distinct pseudonyms.")
+        game = Game(num_players=0, rules=rules, lazy=True, store=self.store)
+        game.use_store(game.store, session_id)
+        if backlog is not None:
+            game.backlog = [dict(task) for task in backlog]
+        game.players = []
+        for pseudo in pseudos:
+            game.add_player(pseudo)
+        game.bind_players()
+        if timeout:
+            game.set_vote_deadline(timeout, timeout_policy, self.deadlines)
+        session = Session(session_id, game, self.notify, window)
+        if session.game.next_feature() is None:
+            raise ValueError("No tasks in backlog to vote on.")
+        game.arm_deadlines()
+        self.sessions[session_id] = session
+        return session
+
+    def _session(self, message):
+        session_id = message.get("session")
+        if session_id not in self.sessions:
+            raise ValueError(f"Unknown session: {session_id}")
+        return self.sessions[session_id]
+
+    def dispatch(self, message, writer):
+        """@brief Handle one client message.
+        @param message The decoded JSON message.
+        @param writer The stream writer of the client, subscribed on create/join.
+        @return A list of (recipients, event) pairs to send.
+        """
+        op = message.get("op")
+        if op == "create":
+            session = self.create_session(message.get("session"), message.get("players", []),
+                                          message.get("rules", "strict"), message.get("backlog"),
+                                          message.get("timeout"), message.get("timeout_policy", "joker"),
+                                          message.get("window", 1))
+            session.subscribers.add(writer)
+            return [({writer}, {"event": "created", **session.describe()})]
+        if op == "join":
+            session = self._session(message)
+            session.subscribers.add(writer)
+            return [({writer}, {"event": "joined", **session.describe()})]
+        if op == "state":
+            return [({writer}, {"event": "state", **self._session(message).describe()})]
+        if op == "vote":
+            session = self._session(message)
+            events = session.vote(message.get("player"), message.get("card"), message.get("feature"))
+            return [(set(session.subscribers) | {writer}, event) for event in events]
+        raise ValueError(f"Unknown operation: {op}")
+
+    async def handle_message(self, message, writer):
+        """@brief Handle one client message (see dispatch); the cluster front end overrides it.
+        @return A list of (recipients, event) pairs to send.
+        """
+        return self.dispatch(message, writer)
+
+    def send(self, outgoing):
+        """@brief Write events to their recipients.
+        @param outgoing A list of (recipients, event) pairs.
+        @return The set of writers that received something.
+        """
+        notified = set()
+        for recipients, event in outgoing:
+            data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            for recipient in recipients:
+                if not recipient.is_closing():
+                    recipient.write(data)
+                    notified.add(recipient)
+        return notified
+
+    def notify(self, recipients, events):
+        """@brief Push events that no client message caused (expired deadlines)."""
+        self.send([(recipients, event) for event in events])
+
+    def unsubscribe(self, writer):
+        """@brief Stop sending events to a client that disconnected."""
+        for session in self.sessions.values():
+            session.subscribers.discard(writer)
+
+    def save(self):
+        """@brief Save the game of every session to the store."""
+        for session in self.sessions.values():
+            session.game.save_game_state()
+
+    async def handle_client(self, reader, writer):
+        """@brief Read newline-delimited JSON messages from one client until it disconnects."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError("A message must be a JSON object.")
+                    outgoing = await self.handle_message(message, writer)
+                except (ValueError, TypeError) as e:
+                    outgoing = [({writer}, {"event": "error", "message": str(e)})]
+                notified = self.send(outgoing)
+                await asyncio.gather(*(recipient.drain() for recipient in notified), return_exceptions=True)
+        finally:
+            self.unsubscribe(writer)
+            writer.close()
+
+
+async def main(host, port):
+    server = PlanningPokerServer()
+    port = await server.start(host, port)
+    print(f"Planning Poker server listening on {host}:{port}")
+    await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Planning Poker session server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
@@ -1,7 +1,36 @@
 import pytest
 from models.game import Game
 from models.players import Player
+from models.aggregation import RULES, aggregate_votes, encode_votes
+from models.tally import VoteTally
+from server import PlanningPokerServer
+from cluster import ClusterCoordinator
+import asyncio
+from models.journal import journal_path_for
+from models.backlog import BacklogIndex, import_backlog, iter_tasks
+from models.deck import FIBONACCI, TSHIRT, Deck, VoteBoard
+from models.history import VoteHistory
+from models.pipeline import VotingPipeline
+from models.snapshot import SnapshotView, json_to_snapshot, read_snapshot, snapshot_to_json
+from models.simulation import simulate_game
+from benchmarks import run_benchmarks
+from models.montecarlo import Histogram, comparison_table, run_monte_carlo
+from models.autosave import AutoSaver
+from models.deadlines import TimerWheel
+from models.report import load_summary, report_writer
+from models.similarity import SimilarityIndex
+from models.ingest import ingest_events
+from models.sketches import HeavyHitters, QuantileSketch, VoteSketch, merge_sketches
+from models.sqlite_store import SQLiteStore, quarter_start
+from models.storage import JsonFileStorage, MemoryStorage, use_storage
+import csv
+import io
+from models.instrumentation import NULL_METRICS, Metrics, PrometheusSink, JsonSink, use_logging
+import logging
 import os
+import queue
+import subprocess
+import sys
 import json
 from unittest.mock import patch
 
@@ -11,6 +40,15 @@ from unittest.mock import patch
 #  @version 1.0
 
 
+## @brief Runs every test on an in-memory storage: no test writes to data/, so the tests can run in parallel.
+@pytest.fixture(autouse=True)
+def memory_storage():
+    storage = MemoryStorage()
+    use_storage(storage)
+    yield storage
+    use_storage(None)
+
+
 # test for player.py
 
 
@@ -92,4 +130,1167 @@ def test_process_votes_no_unanimity():
         game.players[0].vote("5")
         game.players[1].vote("8")
         game.players[2].vote("5")
-        assert game.process_votes() is False
\ No newline at end of file
+        assert game.process_votes() is False
+
+# tests for aggregation.py
+
+
+## @brief Tests the batch engine on several features at once.
+def test_aggregate_votes_batch():
+    matrix = [
+        encode_votes(["5", "5", "5"]),
+        encode_votes(["5", "8", "joker"]),
+        encode_votes(["3", "8", "8", "13"]),
+    ]
+    assert aggregate_votes(matrix, "strict") == [(5, True), (None, False), (None, False)]
+    assert aggregate_votes(matrix, "average") == [(5.0, True), (6.5, True), (8.0, True)]
+    assert aggregate_votes(matrix, "median") == [(5, True), (6.5, True), (8.0, True)]
+    assert aggregate_votes(matrix, "absolute_majority") == [(5, True), (None, False), (None, False)]
+    assert aggregate_votes(matrix, "relative_majority") == [(5, True), (5, True), (8, True)]
+
+## @brief Tests that jokers and missing votes are masked out of every rule.
+def test_aggregate_votes_masks_jokers():
+    row = encode_votes(["joker", "joker", None])
+    for rules in RULES:
+        assert aggregate_votes([row], rules) == [(None, False)]
+
+## @brief Tests that process_votes gives the same result as the batch engine.
+def test_process_votes_matches_batch():
+    votes = ["2", "8", "8", "joker", "13"]
+    for rules in RULES:
+        game = Game(num_players=len(votes), rules=rules)
+        game.current_feature = {"description": "Test feature"}
+        for player, card in zip(game.players, votes):
+            player.vote(card)
+        expected = aggregate_votes([encode_votes(votes)], rules)[0]
+        assert game.process_votes() is expected[1]
+        assert game.current_feature.get("difficulty") == expected[0]
+
+
+# tests for tally.py
+
+
+## @brief Tests that the tally follows votes and revotes one at a time.
+def test_tally_incremental_updates():
+    tally = VoteTally()
+    tally.seats = 3
+    for card in ["8", "3", "joker"]:
+        tally.add(card)
+    assert (tally.numeric_sum, tally.numeric_count, tally.joker_count) == (11, 2, 1)
+    assert tally.median() == 5.5
+    tally.replace("joker", "13")
+    assert tally.joker_count == 0
+    assert tally.median() == 8
+    assert tally.verdict("average") == (8.0, True)
+
+## @brief Tests that the tally verdict matches the batch engine for every rule.
+def test_tally_matches_batch():
+    import random
+    rng = random.Random(4)
+    cards = list(Player("").cards) + [None]
+    for _ in range(200):
+        votes = [rng.choice(cards) for _ in range(rng.randint(1, 9))]
+        tally = VoteTally()
+        tally.seats = len(votes)
+        for card in votes:
+            tally.add(card)
+        for rules in RULES:
+            assert tally.verdict(rules) == aggregate_votes([encode_votes(votes)], rules)[0]
+
+## @brief Tests the live consensus and the joker check of a game bound to its tally.
+def test_game_live_tally():
+    game = Game(num_players=3, rules="strict")
+    for player in game.players:
+        player.vote("joker")
+    assert game.tally.all_joker()
+    game.players[0].vote("5")
+    assert game.tally.joker_count == 2
+    game.players[1].vote("5")
+    game.players[2].vote("5")
+    assert game.live_consensus() == (5, True)
+
+
+## @brief Tests the cafe break: every player plays the 'joker' card, the game stops and saves the votes.
+def test_game_cafe_card(memory_storage):
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": "A", "difficulty": None}, {"description": "B", "difficulty": None}]
+    with patch("builtins.input", side_effect=["5", "5", "joker", "joker"]):
+        game.start_game()
+    assert [task.get("validated", False) for task in game.backlog] == [True, False]
+    state = memory_storage.load_state("default")
+    assert [player["vote"] for player in state["players"]] == ["joker", "joker"]
+    assert not game.all_validated() and game.report_summary is None
+
+
+# tests for server.py
+
+
+## @brief Tests a session driven by two loopback clients voting concurrently.
+def test_server_concurrent_votes():
+    async def scenario():
+        server = PlanningPokerServer()
+        port = await server.start("127.0.0.1", 0)
+        clients = [await asyncio.open_connection("127.0.0.1", port) for _ in range(2)]
+
+        async def send(client, message):
+            client[1].write((json.dumps(message) + "\n").encode())
+            await client[1].drain()
+            return json.loads(await client[0].readline())
+
+        created = await send(clients[0], {"op": "create", "session": "t1", "players": ["alice", "bob"],
+                                          "rules": "strict", "backlog": [{"description": "Test feature"}]})
+        assert created["feature"] == "Test feature"
+        await send(clients[1], {"op": "join", "session": "t1"})
+        await asyncio.gather(send(clients[0], {"op": "vote", "session": "t1", "player": "alice", "card": "5"}),
+                             send(clients[1], {"op": "vote", "session": "t1", "player": "bob", "card": "5"}))
+        events = []
+        while not any(event["event"] == "finished" for event in events):
+            events.append(json.loads(await asyncio.wait_for(clients[1][0].readline(), 5)))
+        result = next(event for event in events if event["event"] == "result")
+        assert result["validated"] is True and result["difficulty"] == 5
+        for _, writer in clients:
+            writer.close()
+        await server.close()
+
+    asyncio.run(scenario())
+
+## @brief Tests that invalid votes are reported as errors to the sender.
+def test_server_rejects_invalid_vote():
+    server = PlanningPokerServer()
+    server.create_session("t2", ["alice", "bob"], backlog=[{"description": "Test feature"}])
+    with pytest.raises(ValueError, match="Invalid card"):
+        server.dispatch({"op": "vote", "session": "t2", "player": "alice", "card": "50"}, None)
+    with pytest.raises(ValueError, match="Unknown session"):
+        server.dispatch({"op": "vote", "session": "nope", "player": "alice", "card": "5"}, None)
+    with pytest.raises(ValueError, match="Unknown rules"):
+        server.create_session("t3", ["alice", "bob"], "unanimity", [{"description": "Test feature"}])
+    assert "t3" not in server.sessions
+
+
+## @brief Tests that a message that is not a JSON object gets an error reply and keeps the connection open.
+def test_server_rejects_non_object_message():
+    async def scenario():
+        server = PlanningPokerServer()
+        port = await server.start("127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        replies = []
+        for line in (b"[1]\n", b'"x"\n', b'{"op": "create", "session": "t4", "players": ["a", "b"], "rules": "nope"}\n',
+                     b'{"op": "state", "session": "t4"}\n'):
+            writer.write(line)
+            await writer.drain()
+            replies.append(json.loads(await asyncio.wait_for(reader.readline(), 5)))
+        assert [reply["event"] for reply in replies] == ["error"] * 4
+        assert "JSON object" in replies[0]["message"] and "Unknown rules" in replies[2]["message"]
+        writer.close()
+        await server.close()
+
+    asyncio.run(scenario())
+
+
+# tests for journal.py
+
+
+## @brief Tests that a game is rebuilt from its snapshot plus the journal tail.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_journal_recovery(tmpdir):
+    save_file = str(tmpdir.join("game_state.json"))
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": "Test feature", "difficulty": None}]
+    game.enable_journal(save_file, snapshot_every=100)
+    snapshot_size = os.path.getsize(save_file)
+
+    game.current_feature = game.backlog[0]
+    game.cast_vote(game.players[0], "8")
+    game.cast_vote(game.players[1], "8")
+    game.process_votes()
+    game.add_feature({"description": "Second feature", "difficulty": None})
+    assert game.import_tasks([["Third feature", "second FEATURE"]]) == {"kept": 2, "imported": 1, "duplicates": 1}
+    game.cast_vote(game.players[0], "3")
+    game.save_game_state(save_file)
+    assert os.path.getsize(save_file) == snapshot_size  # Only the journal grew
+
+    # Simulate a crash in the middle of an append
+    with open(journal_path_for(save_file), "a") as file:
+        file.write('{"seq": 99, "op": "vo')
+
+    loaded = Game(num_players=0)
+    loaded.load_game_state(save_file)
+    assert loaded.backlog[0]["validated"] is True and loaded.backlog[0]["difficulty"] == 8
+    assert [task["description"] for task in loaded.backlog[1:]] == ["Second feature", "Third feature"]
+    assert [player.current_vote for player in loaded.players] == ["3", None]
+
+## @brief Tests that a state saved without the journal is not overwritten by the old journal records.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_journal_ignored_after_plain_save(tmpdir):
+    save_file = str(tmpdir.join("game_state.json"))
+    game = Game(num_players=3)
+    game.backlog = [{"description": "A", "difficulty": None}]
+    game.enable_journal(save_file)
+    game.current_feature = game.backlog[0]
+    for player in game.players:
+        game.cast_vote(player, "5")
+    game.process_votes()
+    game.journal.close()
+
+    plain = Game(num_players=2, lazy=True)
+    plain.backlog = [{"description": "B", "difficulty": None}]
+    plain.save_game_state(save_file)
+    assert not os.path.exists(journal_path_for(save_file))
+    loaded = Game.from_state(save_file)
+    assert [task["description"] for task in loaded.backlog] == ["B"] and len(loaded.players) == 2
+
+    # A journal left next to a plain state (e.g. by an older version) is not replayed either
+    with open(journal_path_for(save_file), "w") as file:
+        file.write('{"seq": 1, "op": "vote", "player": 2, "card": "8"}\n')
+    assert [player.current_vote for player in Game.from_state(save_file).players] == [None, None]
+
+## @brief Tests that a checkpoint compacts the journal into a new snapshot.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_journal_snapshot_compaction(tmpdir):
+    save_file = str(tmpdir.join("game_state.json"))
+    game = Game(num_players=2)
+    game.backlog = []
+    game.enable_journal(save_file, snapshot_every=2)
+    game.add_feature({"description": "A"})
+    game.add_feature({"description": "B"})
+    game.save_game_state(save_file)
+    assert os.path.getsize(journal_path_for(save_file)) == 0
+    with open(save_file) as file:
+        assert [task["description"] for task in json.load(file)["backlog"]] == ["A", "B"]
+
+
+# tests for backlog.py
+
+
+## @brief Tests the incremental parser of the {"tasks": [...]} layout with tiny chunks.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_iter_tasks_json(tmpdir):
+    backlog_file = tmpdir.join("backlog.json")
+    tasks = [{"description": f"Feature {i} [\"x\"]", "difficulty": None, "tags": {"n": i * 10}} for i in range(20)]
+    backlog_file.write(json.dumps({"name": "program", "tasks": tasks, "version": 2}, indent=4))
+    assert list(iter_tasks(str(backlog_file), chunk_size=7)) == tasks
+    assert list(iter_tasks("data/backlog.json")) == json.load(open("data/backlog.json"))["tasks"]
+
+## @brief Tests reading a JSON Lines backlog.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_iter_tasks_jsonl(tmpdir):
+    backlog_file = tmpdir.join("backlog.jsonl")
+    backlog_file.write('{"description": "A"}\n\n{"description": "B"}\n')
+    assert [task["description"] for task in iter_tasks(str(backlog_file))] == ["A", "B"]
+
+## @brief Tests a game played over a lazy task source with a streamed report.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_start_game_streaming(tmpdir):
+    report_file = str(tmpdir.join("final_report.json"))
+    tasks = iter([{"description": "A", "difficulty": None}, {"description": "B", "difficulty": None}])
+    game = Game(num_players=2, rules="strict")
+    with patch("builtins.input", side_effect=["5", "8", "5", "5", "13", "13"]):
+        game.start_game(tasks=tasks, report_path=report_file)
+    with open(report_file) as file:
+        report = json.load(file)["tasks"]
+    assert [(task["description"], task["difficulty"]) for task in report] == [("A", 5), ("B", 13)]
+    assert len(game.backlog) == 1
+
+## @brief Tests that a streamed game writes its report to the store, and needs a path with an in-memory store.
+#  @param tmpdir Temporary directory provided by pytest.
+#  @param monkeypatch Fixture used to run the test from the temporary directory.
+def test_start_game_streaming_store_report(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    with pytest.raises(ValueError):
+        Game(num_players=2, lazy=True).start_game(tasks=iter([{"description": "A"}]))
+    game = Game(num_players=2, lazy=True, store=JsonFileStorage("custom"))
+    with patch("builtins.input", side_effect=["5", "5"]):
+        game.start_game(tasks=iter([{"description": "A", "difficulty": None}]))
+    assert game.store.load_report("default")[0]["difficulty"] == 5
+    assert sorted(os.listdir(str(tmpdir))) == ["custom"]
+
+## @brief Tests that streamed features get distinct IDs and their own round counts.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_start_game_streaming_ids(tmpdir):
+    report_file = str(tmpdir.join("final_report.jsonl"))
+    tasks = ({"description": name, "difficulty": None} for name in ("A", "B", "C"))
+    game = Game(num_players=2, rules="strict")
+    with patch("builtins.input", side_effect=["5", "5", "8", "8", "3", "3"]):
+        game.start_game(tasks=tasks, report_path=report_file)
+    with open(report_file) as file:
+        assert [json.loads(line)["id"] for line in file] == [1, 2, 3]
+    assert game.history.rounds_to_consensus() == {1: 1, 2: 1, 3: 1}
+    assert game.report_summary.mean_rounds == 1.0
+
+## @brief Tests that a cafe break in a streamed game saves the rest of the stream and keeps the previous report.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_start_game_streaming_cafe_break(tmpdir, memory_storage):
+    report_file = tmpdir.join("final_report.json")
+    report_file.write('{"tasks": []}')
+    tasks = ({"description": name, "difficulty": None} for name in ("A", "B", "C", "D"))
+    game = Game(num_players=2, rules="strict")
+    with patch("builtins.input", side_effect=["5", "5", "joker", "joker"]):
+        game.start_game(tasks=tasks, report_path=str(report_file))
+    saved = memory_storage.load_state("default")["backlog"]
+    assert [(task["description"], task["id"]) for task in saved] == [("B", 2), ("C", 3), ("D", 4)]
+    assert report_file.read() == '{"tasks": []}'
+    with open(str(tmpdir.join("final_report.partial.json"))) as file:
+        assert [task["description"] for task in json.load(file)["tasks"]] == ["A"]
+
+## @brief Tests the stable IDs and the pending queue of the backlog index.
+def test_backlog_index():
+    tasks = [{"description": "A", "id": 7}, {"description": "B", "validated": True}, {"description": "C"}]
+    index = BacklogIndex(tasks)
+    assert [task["id"] for task in tasks] == [7, 8, 9]
+    assert index.next_pending()["description"] == "A"
+    index.set_validated(tasks[0], True)
+    assert index.next_pending()["description"] == "C"
+    assert index.validated_count() == 2
+    index.set_validated(tasks[1], False)
+    assert index.next_pending()["description"] == "B"
+    tasks.append({"description": "D"})
+    assert index.get(10)["description"] == "D"
+    for task in tasks:
+        index.set_validated(task, True)
+    assert index.all_validated()
+
+## @brief Tests that a game resumes on the first feature that is not validated.
+def test_game_next_feature():
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": "A", "validated": True}, {"description": "B"}]
+    assert game.next_feature()["description"] == "B"
+    game.players[0].vote("3")
+    game.players[1].vote("3")
+    assert game.process_votes() is True
+    assert game.progress() == (2, 2)
+    assert game.all_validated() and game.next_feature() is None
+
+## @brief Tests the bulk import: CSV, JSON Lines and stdin merged into an existing backlog with deduplication.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_import_backlog(tmpdir):
+    backlog_file = str(tmpdir.join("backlog.json"))
+    tmpdir.join("tasks.csv").write('description,difficulty\nLogin page,\n"Export, PDF",8\nlogin  PAGE,\n')
+    tmpdir.join("tasks.jsonl").write('{"description": "Search"}\n{"description": "Export, PDF"}\n')
+    assert import_backlog([str(tmpdir.join("tasks.csv"))], backlog_file) == {"kept": 0, "imported": 2, "duplicates": 1}
+    with patch("sys.stdin", io.StringIO("Dark mode\nSearch\n")):
+        counts = import_backlog([str(tmpdir.join("tasks.jsonl")), "-"], backlog_file)
+    assert counts == {"kept": 2, "imported": 2, "duplicates": 2}
+    with open(backlog_file) as file:
+        tasks = json.load(file)["tasks"]
+    assert [(task["description"], task["difficulty"]) for task in tasks] == [
+        ("Login page", None), ("Export, PDF", 8), ("Search", None), ("Dark mode", None)]
+
+## @brief Tests that a CSV report imported as a backlog keeps the types of its fields.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_import_csv_report(tmpdir):
+    game = Game(num_players=2, lazy=True)
+    game.backlog = [{"description": "A", "difficulty": 5, "validated": True}, {"description": "B", "difficulty": None}]
+    game.backlog[1]["validated"] = False
+    game.save_final_report(str(tmpdir.join("report.csv")))
+    imported = Game(num_players=2, lazy=True)
+    imported.backlog = []
+    imported.import_tasks([str(tmpdir.join("report.csv"))])
+    assert imported.backlog == [{"id": 1, "description": "A", "difficulty": 5, "validated": True},
+                                {"id": 2, "description": "B", "difficulty": None, "validated": False}]
+    assert imported.backlog_index.pending_count() == 1
+
+
+# tests for deck.py
+
+
+## @brief Tests that players share one immutable deck and store integer codes.
+def test_shared_deck_and_codes():
+    first, second = Player("A"), Player("B")
+    assert first.cards is second.cards is FIBONACCI.cards
+    first.vote("13")
+    assert first.vote_code == FIBONACCI.code("13")
+    with pytest.raises(AttributeError):
+        FIBONACCI.name = "other"
+    with pytest.raises(AttributeError):
+        first.nickname = "no __dict__"
+
+## @brief Tests a compact game storing the votes of the table in one shared board.
+def test_compact_game_board():
+    game = Game(num_players=3, rules="median", compact=True)
+    assert isinstance(game.board, VoteBoard) and len(game.board) == 3
+    game.current_feature = {"description": "Test feature"}
+    for player, card in zip(game.players, ["1", "8", "joker"]):
+        player.vote(card)
+    assert list(game.board.codes) == [FIBONACCI.code("1"), FIBONACCI.code("8"), FIBONACCI.code("joker")]
+    assert game.process_votes() is True
+    assert game.current_feature["difficulty"] == 4.5
+    assert [player.current_vote for player in game.players] == [None, None, None]
+
+## @brief Tests a custom T-shirt deck with the rules.
+def test_tshirt_deck():
+    game = Game(num_players=3, rules="relative_majority", deck=TSHIRT)
+    game.current_feature = {"description": "Test feature"}
+    for player, card in zip(game.players, ["M", "XL", "M"]):
+        player.vote(card)
+    assert game.live_consensus() == (3, True)
+    assert game.process_votes() is True
+    assert game.current_feature["difficulty"] == 3
+    with pytest.raises(ValueError, match="Invalid deck"):
+        Deck("broken", ["S", "S"])
+
+
+# tests for history.py
+
+
+## @brief Tests the query helpers over memory-mapped and in-memory rows.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_vote_history_queries(tmpdir):
+    code = FIBONACCI.code
+    history = VoteHistory(str(tmpdir.join("history")))
+    history.record_round(1, 1, [code("3"), code("13"), code("joker")], timestamp=1.0)
+    history.record_round(1, 2, [code("5"), code("8"), code("5")], timestamp=2.0)
+    history.flush()
+    history.record_round(2, 1, [code("2"), code("2"), -1], timestamp=3.0)
+    assert len(history) == 9
+    assert history.rounds_to_consensus() == {1: 2, 2: 1}
+    assert history.vote_spread(FIBONACCI) == {(1, 1): 10, (1, 2): 3, (2, 1): 0}
+    assert history.player_deviation({1: 5, 2: 2}, FIBONACCI) == {0: 2 / 3, 1: 11 / 3, 2: 0}
+    history.flush()
+    history.close()
+
+    reopened = VoteHistory(str(tmpdir.join("history")))
+    assert len(reopened) == 9 and reopened.rounds_to_consensus() == {1: 2, 2: 1}
+    reopened.close()
+
+## @brief Tests that the report of a game only counts its own rounds in a history shared with earlier games.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_report_rounds_of_current_game(tmpdir):
+    directory = str(tmpdir.join("history"))
+    for rounds, expected in (((("3", "8"), ("5", "5")), {"2": 1}), ((("5", "5"),), {"1": 1})):
+        game = Game(num_players=2, lazy=True)
+        game.history = VoteHistory(directory)
+        game.backlog = [{"description": "A", "difficulty": None}]
+        game.current_feature = game.backlog[0]
+        for cards in rounds:
+            for player, card in zip(game.players, cards):
+                game.cast_vote(player, card)
+            game.process_votes()
+        game.save_final_report(str(tmpdir.join("report.json")))
+        game.history.close()
+        assert load_summary(str(tmpdir.join("report.json")))["rounds_to_consensus"] == expected
+
+## @brief Tests that a game records every round, revotes included.
+def test_game_records_rounds():
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": "A"}]
+    game.next_feature()
+    for cards in (["3", "5"], ["5", "5"]):
+        for player, card in zip(game.players, cards):
+            player.vote(card)
+        game.process_votes()
+    assert game.history.rounds_to_consensus() == {game.backlog[0]["id"]: 2}
+
+
+# tests for snapshot.py
+
+
+## @brief Tests saving and loading a game state in the binary snapshot format.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_binary_snapshot_round_trip(tmpdir):
+    save_file = str(tmpdir.join("game_state.snap"))
+    game = Game(num_players=2, rules="average")
+    game.backlog = [{"description": "Créer le menu", "difficulty": 2.5, "validated": True},
+                    {"description": "Tests", "difficulty": None, "labels": ["qa"]}]
+    game.players[0].pseudo = "alice"
+    game.players[0].vote("8")
+    game.save_game_state(save_file)
+
+    with SnapshotView(save_file) as view:
+        assert view.task_count == 2 and view.description(0) == "Créer le menu"
+        assert view.player(0) == {"pseudo": "alice", "vote": "8"}
+
+    loaded = Game(num_players=0)
+    loaded.load_game_state(save_file)
+    assert loaded.backlog == game.backlog
+    assert [player.current_vote for player in loaded.players] == ["8", None]
+
+## @brief Tests the converters between the JSON files and binary snapshots.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_snapshot_converters(tmpdir):
+    snapshot_file = str(tmpdir.join("final_report.snap"))
+    json_file = str(tmpdir.join("final_report.json"))
+    json_to_snapshot("data/final_report.json", snapshot_file)
+    snapshot_to_json(snapshot_file, json_file)
+    with open("data/final_report.json") as original, open(json_file) as converted:
+        assert json.load(original) == json.load(converted)
+    with open(snapshot_file, "r+b") as file:
+        file.truncate(40)
+    with pytest.raises(ValueError):
+        read_snapshot(snapshot_file)
+
+
+# tests for simulation.py and benchmarks.py
+
+
+## @brief Tests that a simulated game is deterministic for a given seed.
+def test_simulation_is_deterministic():
+    first = simulate_game(6, 30, rules="median", strategy="converging", seed=3)
+    second = simulate_game(6, 30, rules="median", strategy="converging", seed=3)
+    assert first.rounds == second.rounds and first.errors == second.errors
+    assert first.features == first.validated == 30
+    assert first.votes == 6 * sum(first.rounds)
+
+## @brief Tests that an all-joker table never validates a feature.
+def test_simulation_all_joker():
+    result = simulate_game(4, 5, rules="relative_majority", strategy="all_joker", max_rounds=3)
+    assert result.validated == 0 and result.rounds == [3] * 5
+    assert result.game.history.rounds_to_consensus()[result.game.backlog[0]["id"]] == 3
+
+## @brief Tests that the benchmark suite reports every measurement.
+def test_benchmarks_small_scale():
+    rows = run_benchmarks([3], [10], ["strict", "average"])
+    assert len(rows) == 2
+    assert all(row["features_per_s"] > 0 and row["load_snap_ms"] >= 0 for row in rows)
+
+
+# tests for montecarlo.py
+
+
+## @brief Tests merging histograms.
+def test_histogram_merge():
+    first, second = Histogram(1), Histogram(1)
+    for value in (1, 1, 2):
+        first.add(value)
+    for value in (3, 5):
+        second.add(value)
+    merged = first.merge(second)
+    assert merged.count == 5 and merged.mean() == 12 / 5
+    assert merged.quantile(0.5) == 2 and merged.quantile(1) == 5
+    with pytest.raises(ValueError):
+        merged.merge(Histogram(0.5))
+
+## @brief Tests that the results do not depend on the sharding of the sessions.
+def test_monte_carlo_deterministic_sharding():
+    partial = []
+    first = run_monte_carlo(12, ["strict", "median"], num_players=4, num_features=3, shard_size=5, workers=2,
+                            on_partial=lambda stats, done: partial.append(done))
+    second = run_monte_carlo(12, ["strict", "median"], num_players=4, num_features=3, shard_size=12, workers=1)
+    assert sorted(partial)[-1] == 12 and len(partial) == 3
+    for rule in ("strict", "median"):
+        assert first[rule].sessions == 12
+        assert first[rule].rounds.bins == second[rule].rounds.bins
+        assert first[rule].errors.bins == second[rule].errors.bins
+    assert "median" in comparison_table(first)
+
+
+# tests for lazy construction
+
+
+## @brief Tests that a lazy game touches the disk only when needed.
+#  @param tmpdir Temporary directory provided by pytest.
+#  @param monkeypatch Fixture used to run the test from the temporary directory.
+def test_lazy_game_construction(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    game = Game(num_players=2, lazy=True, store=JsonFileStorage())
+    assert not os.path.exists("data")
+    assert game.backlog == [] and game.next_feature() is None
+    game.save_game_state()
+    assert os.path.exists("data/game_state.json")
+
+    tmpdir.join("data", "backlog.json").write(json.dumps({"tasks": [{"description": "Lazy feature"}]}))
+    lazy = Game(num_players=2, lazy=True, store=JsonFileStorage())
+    assert lazy.next_feature()["description"] == "Lazy feature"
+
+## @brief Tests that importing the game core does not load the modules of the optional code paths.
+def test_game_import_is_lean():
+    code = "import sys, models.game; print(' '.join(sorted(set(sys.modules) & {MODULES})))"
+    modules = {"logging", "tempfile", "sqlite3", "csv", "mmap", "urllib.parse", "threading", "contextlib"}
+    output = subprocess.run([sys.executable, "-c", code.replace("{MODULES}", repr(modules))],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    assert output.stdout.split() == []
+
+## @brief Tests creating a game directly from a saved state.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_game_from_state(tmpdir):
+    save_file = str(tmpdir.join("game_state.json"))
+    game = Game(num_players=3, rules="median", lazy=True)
+    game.backlog = [{"description": "Saved feature"}]
+    game.save_game_state(save_file)
+    loaded = Game.from_state(save_file, rules="median")
+    assert loaded.rules == "median" and len(loaded.players) == 3
+    assert loaded.backlog[0]["description"] == "Saved feature"
+    with pytest.raises(FileNotFoundError):
+        Game.from_state(str(tmpdir.join("missing.json")))
+
+
+# tests for autosave.py
+
+
+## @brief Tests that a burst of saves is coalesced into one atomic write per file.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_autosave_coalesces_bursts(tmpdir):
+    save_file = str(tmpdir.join("state.json"))
+    saver = AutoSaver(interval=60)
+    for index in range(50):
+        saver.request(save_file, f"version {index}")
+    assert saver.flush(timeout=5)
+    assert open(save_file).read() == "version 49"
+    assert saver.metrics() == {"queued": 50, "coalesced": 49, "written": 1, "failed": 0}
+    assert [name for name in os.listdir(str(tmpdir))] == ["state.json"]  # No temporary file left
+    saver.close()
+    with pytest.raises(RuntimeError):
+        saver.request(save_file, "closed")
+
+## @brief Tests that a game hands its saves to the autosaver.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_game_autosave(tmpdir):
+    game = Game(num_players=2, lazy=True)
+    game.backlog = [{"description": "Feature 1", "difficulty": None}]
+    game.autosaver = AutoSaver(interval=60)
+    game.save_game_state(str(tmpdir.join("game_state.json")))
+    game.save_final_report(str(tmpdir.join("final_report.snap")))
+    game.autosaver.close()
+    assert game.autosaver.written == 2
+    assert Game.from_state(str(tmpdir.join("game_state.json"))).backlog == game.backlog
+    assert read_snapshot(str(tmpdir.join("final_report.snap"))) == {"tasks": game.backlog}
+
+## @brief Tests that the autosaver writes the state of the game at the time of the save.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_game_autosave_snapshot(tmpdir):
+    game = Game(num_players=2, lazy=True)
+    game.backlog = [{"description": "Feature 1", "difficulty": None}]
+    game.autosaver = AutoSaver(interval=60)
+    game.save_game_state(str(tmpdir.join("game_state.json")))
+    game.backlog[0]["difficulty"] = 5
+    game.backlog.append({"description": "Feature 2", "difficulty": None})
+    game.autosaver.close()
+    saved = Game.from_state(str(tmpdir.join("game_state.json"))).backlog
+    assert [(task["description"], task["difficulty"]) for task in saved] == [("Feature 1", None)]
+
+## @brief Tests that a final report is written by the autosaver, from the tasks as they were when saved.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_game_autosave_report(tmpdir):
+    game = Game(num_players=2, lazy=True)
+    game.backlog = [{"description": "A", "difficulty": 5, "validated": True}]
+    game.autosaver = AutoSaver(interval=60)
+    for name in ("report.json", "report.csv"):
+        game.save_final_report(str(tmpdir.join(name)))
+    assert not tmpdir.join("report.json").check()  # Nothing written on the caller's thread
+    game.backlog[0]["difficulty"] = 8
+    game.autosaver.close()
+    assert json.loads(tmpdir.join("report.json").read())["tasks"][0]["difficulty"] == 5
+    assert load_summary(str(tmpdir.join("report.csv"))) == game.report_summary.to_dict()
+    assert tmpdir.join("report.csv").read().splitlines()[1] == "1,A,5,True,"
+
+
+# tests for instrumentation.py
+
+
+## @brief Tests that an instrumented game records its hot-path metrics and exports them.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_game_metrics(tmpdir):
+    game = Game(num_players=2, rules="median", lazy=True)
+    assert game.metrics is NULL_METRICS and game.metrics.timer("noop") is game.metrics.timer("other")
+    game.metrics = Metrics(PrometheusSink(str(tmpdir.join("metrics.prom"))))
+    game.backlog = [{"description": "Feature 1", "difficulty": None}]
+    game.current_feature = game.backlog[0]
+    game.cast_vote(game.players[0], "3")
+    game.cast_vote(game.players[0], "5")
+    game.cast_vote(game.players[1], "5")
+    assert game.process_votes()
+    game.save_game_state(str(tmpdir.join("game_state.json")))
+    game.metrics.export()
+    values = game.metrics.to_dict()
+    assert {"name": "votes", "labels": {"player": ""}, "value": 3} in values["counters"]
+    assert {"name": "backlog_size", "labels": {}, "value": 1} in values["gauges"]
+    timers = {entry["name"]: entry for entry in values["timers"]}
+    assert timers["process_votes_seconds"]["labels"] == {"rule": "median"}
+    assert timers["rounds_per_feature"]["sum"] == 1 and timers["save_seconds"]["count"] == 1
+    prom = tmpdir.join("metrics.prom").read()
+    assert "# TYPE planning_poker_votes_total counter" in prom
+    assert 'planning_poker_bytes_written_total{file="game_state.json"}' in prom
+    JsonSink(str(tmpdir.join("metrics.json"))).write(game.metrics)
+    assert json.loads(tmpdir.join("metrics.json").read()) == values
+
+## @brief Tests that the game messages can be routed to logging and silenced.
+#  @param capsys Fixture capturing the console output.
+#  @param caplog Fixture capturing the log records.
+def test_game_messages_logging(capsys, caplog):
+    player = Player("Alice")
+    player.vote("5")
+    assert "Alice has voted with card 5" in capsys.readouterr().out
+    use_logging()
+    try:
+        with caplog.at_level(logging.INFO, logger="planning_poker"):
+            player.vote("8")
+            Game(num_players=2, lazy=True).load_backlog("missing.json")
+    finally:
+        use_logging(False)
+    assert capsys.readouterr().out == ""
+    assert [record.levelno for record in caplog.records] == [logging.WARNING]
+
+
+# tests for cluster.py
+
+
+## @brief Tests session routing, migration and draining across worker processes.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_cluster_routing_and_migration(tmpdir):
+    backlog = [{"description": "Feature 1", "difficulty": None}, {"description": "Feature 2", "difficulty": None}]
+    coordinator = ClusterCoordinator(2, str(tmpdir))
+    try:
+        for session in ("s1", "s2", "s3"):
+            created = coordinator.submit({"op": "create", "session": session, "players": ["Alice", "Bob"],
+                                          "backlog": backlog}).result(10)
+            assert created[0]["event"] == "created"
+        assert sorted(len(worker.sessions) for worker in coordinator.workers.values()) == [1, 2]
+        with pytest.raises(ValueError):
+            coordinator.submit({"op": "create", "session": "s1", "players": ["Alice", "Bob"]}).result(10)
+
+        # A vote cast before the migration and one sent during it both reach the game
+        coordinator.submit({"op": "vote", "session": "s1", "player": "Alice", "card": "5"}).result(10)
+        source = coordinator.routes["s1"]
+        migration = coordinator.migrate("s1")
+        events = coordinator.submit({"op": "vote", "session": "s1", "player": "Bob", "card": "5"}).result(10)
+        assert migration.result(10) != source.worker_id
+        assert events[-1] == {"event": "result", "session": "s1", "feature": "Feature 1",
+                              "validated": True, "difficulty": 5}
+
+        coordinator.add_worker()
+        coordinator.drain(0, timeout=10)
+        assert 0 not in coordinator.workers and len(coordinator.routes) == 3
+        state = coordinator.submit({"op": "state", "session": "s1"}).result(10)
+        assert state[0]["feature"] == "Feature 2"
+    finally:
+        coordinator.close()
+
+## @brief Tests that a migrated session keeps its voting window, its votes and its vote deadlines.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_cluster_migration_keeps_pipeline(tmpdir):
+    backlog = [{"description": name, "difficulty": None} for name in ("A", "B", "C")]
+    coordinator = ClusterCoordinator(2, str(tmpdir))
+    try:
+        coordinator.submit({"op": "create", "session": "p", "players": ["Alice", "Bob"], "backlog": backlog,
+                            "window": 2}).result(10)
+        coordinator.submit({"op": "vote", "session": "p", "player": "Alice", "card": "5", "feature": 1}).result(10)
+        coordinator.migrate("p").result(10)
+        events = coordinator.submit({"op": "vote", "session": "p", "player": "Bob", "card": "5",
+                                     "feature": 1}).result(10)
+        assert events[-1]["event"] == "result" and events[-1]["difficulty"] == 5
+        state = coordinator.submit({"op": "state", "session": "p"}).result(10)[0]
+        assert [feature["id"] for feature in state["open"]] == [2, 3]
+
+        coordinator.submit({"op": "create", "session": "t", "players": ["Alice", "Bob"], "backlog": backlog,
+                            "timeout": 30}).result(10)
+        coordinator.migrate("t").result(10)
+        state = coordinator.submit({"op": "state", "session": "t"}).result(10)[0]
+        assert 0 < state["remaining"] <= 30
+    finally:
+        coordinator.close()
+
+## @brief Tests that the vote deadlines of a cluster session expire on its worker and reach the coordinator.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_cluster_vote_deadline(tmpdir):
+    pushed = queue.Queue()
+    coordinator = ClusterCoordinator(1, str(tmpdir))
+    coordinator.on_events = pushed.put
+    try:
+        coordinator.submit({"op": "create", "session": "d", "players": ["Alice", "Bob"], "timeout": 1,
+                            "timeout_policy": "skip", "backlog": [{"description": "A", "difficulty": None}]}).result(10)
+        coordinator.submit({"op": "vote", "session": "d", "player": "Alice", "card": "5"}).result(10)
+        events = pushed.get(timeout=10)
+        assert events[0] == {"event": "timeout", "session": "d", "player": "Bob", "policy": "skip"}
+        assert events[1]["validated"] is True and events[1]["difficulty"] == 5
+        assert events[2]["event"] == "finished"
+    finally:
+        coordinator.close()
+
+## @brief Tests that every worker saves its games in its own directory.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_cluster_worker_storage(tmpdir):
+    backlog = [{"description": "Feature 1", "difficulty": None}]
+    coordinator = ClusterCoordinator(2, str(tmpdir))
+    try:
+        for session, card in (("s1", "3"), ("s2", "8")):
+            coordinator.submit({"op": "create", "session": session, "players": ["Alice", "Bob"],
+                                "backlog": backlog}).result(10)
+            coordinator.submit({"op": "vote", "session": session, "player": "Alice", "card": card}).result(10)
+        hosts = {session: worker.worker_id for session, worker in coordinator.routes.items()}
+    finally:
+        coordinator.close()
+    assert sorted(hosts.values()) == [0, 1]
+    for session, card in (("s1", "3"), ("s2", "8")):
+        store = JsonFileStorage(str(tmpdir.join(f"worker-{hosts[session]}")))
+        other = JsonFileStorage(str(tmpdir.join(f"worker-{1 - hosts[session]}")))
+        assert store.load_state(session)["players"][0] == {"pseudo": "Alice", "vote": card}
+        assert not other.has_state(session) and not store.has_state("default")
+    assert sorted(os.listdir(str(tmpdir))) == ["worker-0", "worker-1"]
+
+
+# tests for deadlines.py
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+## @brief Tests arming, cancelling and firing deadlines on the timer wheel.
+def test_timer_wheel():
+    clock = FakeClock()
+    wheel = TimerWheel(tick=0.1, slots=8, clock=clock)
+    fired = []
+    for key, delay in (("a", 0.25), ("b", 0.5), ("c", 5.0), ("d", 0.3)):
+        wheel.arm(key, delay, lambda key=key: fired.append(key))
+    assert wheel.cancel("d") and not wheel.cancel("d") and len(wheel) == 3
+    wheel.arm("b", 0.2, lambda: fired.append("b"))  # Re-arming replaces the deadline
+    assert wheel.remaining("c") == pytest.approx(5.0) and wheel.remaining("d") is None
+    clock.now += 0.35
+    assert wheel.advance() == 2 and fired == ["b", "a"]
+    clock.now += 2.0  # More than one turn of the wheel, "c" is not due yet
+    assert wheel.advance() == 0 and len(wheel) == 1
+    clock.now += 3.0
+    assert wheel.advance() == 1 and fired == ["b", "a", "c"] and len(wheel) == 0
+
+## @brief Tests the joker, abstain and skip timeout policies of a game.
+def test_vote_deadline_policies():
+    clock = FakeClock()
+    for policy, validated in (("joker", False), ("abstain", False), ("skip", True)):
+        game = Game(num_players=3, lazy=True)
+        game.backlog = [{"description": "Feature 1", "difficulty": None}]
+        game.next_feature()
+        game.set_vote_deadline(10, policy, TimerWheel(clock=clock))
+        game.arm_deadlines()
+        game.cast_vote(game.players[0], "5")
+        game.cast_vote(game.players[1], "5")
+        assert not game.round_complete() and game.remaining_time() == pytest.approx(10)
+        clock.now += 11
+        game.deadlines.advance()
+        assert game.timed_out == {game.players[2]: policy} and game.round_complete()
+        assert game.players[2].current_vote == ("joker" if policy == "joker" else None)
+        assert game.process_votes() == validated
+        assert game.timed_out == {} and len(game.deadlines) == 0
+
+## @brief Tests that an expired deadline closes the round of a server session.
+def test_server_session_deadline():
+    clock = FakeClock()
+    server = PlanningPokerServer()
+    server.deadlines = TimerWheel(clock=clock)
+    pushed = []
+    server.notify = lambda recipients, events: pushed.extend(events)
+    session = server.create_session("s1", ["Alice", "Bob"], "strict", [{"description": "Feature 1"}],
+                                    timeout=30, timeout_policy="skip")
+    assert session.vote("Alice", "3")[0]["remaining"] == pytest.approx(30)
+    clock.now += 31
+    server.deadlines.advance()
+    assert [event["event"] for event in pushed] == ["timeout", "result", "finished"]
+    assert pushed[1]["difficulty"] == 3
+
+
+# tests for report.py
+
+
+## @brief Tests the streamed report formats and the summary computed while writing them.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_final_report_formats_and_summary(tmpdir):
+    game = Game(num_players=2, lazy=True)
+    game.backlog = [{"description": "A", "difficulty": None}, {"description": "B", "difficulty": None},
+                    {"description": "C", "difficulty": None}]
+    for feature, rounds in ((game.backlog[0], (("3", "5"), ("5", "5"))), (game.backlog[1], (("8", "8"),))):
+        game.current_feature = feature
+        for cards in rounds:
+            for player, card in zip(game.players, cards):
+                game.cast_vote(player, card)
+            game.process_votes()
+
+    for name in ("report.json", "report.jsonl", "report.csv"):
+        game.save_final_report(str(tmpdir.join(name)))
+        summary = load_summary(str(tmpdir.join(name)))
+        assert summary == game.report_summary.to_dict()
+        assert summary["validated"] == 2 and summary["unvalidated"] == 1
+        assert summary["total_difficulty"] == 13 and summary["mean_difficulty"] == 6.5
+        assert summary["by_card"] == {"5": 1, "8": 1}
+        assert summary["rounds_to_consensus"] == {"1": 1, "2": 1}
+    assert json.loads(tmpdir.join("report.json").read())["tasks"] == game.backlog
+    assert [json.loads(line) for line in tmpdir.join("report.jsonl").read().splitlines()] == game.backlog
+    with open(str(tmpdir.join("report.csv")), newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [(row["description"], row["difficulty"], row["rounds"]) for row in rows] == [
+        ("A", "5", "2"), ("B", "8", "1"), ("C", "", "")]
+
+## @brief Tests that a report interrupted by an error leaves the previous report in place.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_report_writer_keeps_previous_report_on_error(tmpdir):
+    report_file = str(tmpdir.join("report.json"))
+    with report_writer(report_file) as report:
+        report.write({"description": "Old", "difficulty": 3, "validated": True})
+    previous = tmpdir.join("report.json").read()
+    with pytest.raises(RuntimeError):
+        with report_writer(report_file) as report:
+            report.write({"description": "New", "difficulty": 5, "validated": True})
+            raise RuntimeError("interrupted")
+    assert tmpdir.join("report.json").read() == previous
+    assert sorted(os.listdir(str(tmpdir))) == ["report.json", "report.summary.json"]
+
+
+# tests for similarity.py
+
+
+## @brief Tests the suggestions of the similarity index, its incremental adds and its persistence.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_similarity_index(tmpdir):
+    directory = str(tmpdir.join("similarity"))
+    index = SimilarityIndex(directory, max_small_segments=2)
+    assert index.suggest("Login page") == []
+    index.add_tasks([{"description": "Login page with password reset", "difficulty": 5, "validated": True},
+                     {"description": "Export the monthly invoices to PDF", "difficulty": 13, "validated": True},
+                     {"description": "Never estimated", "difficulty": None, "validated": False}])
+    assert index.suggest("Login page with password reset", k=1)[0]["difficulty"] == 5
+    index.add_tasks([{"description": "Export the weekly invoices to PDF", "difficulty": 8}])
+    index.add_tasks([{"description": "Dark mode for the settings page", "difficulty": 3}])
+    assert len(index) == 4
+    reopened = SimilarityIndex(directory)
+    suggestions = reopened.suggest("Export the yearly invoices to PDF", k=2)
+    assert sorted(suggestion["difficulty"] for suggestion in suggestions) == [8, 13]
+    assert all(0 < suggestion["similarity"] <= 1 for suggestion in suggestions)
+
+
+## @brief Tests that the game suggests past estimates and indexes the tasks of its final report.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_game_similarity_suggestions(tmpdir):
+    game = Game(num_players=2, lazy=True)
+    game.similar_tasks = SimilarityIndex(str(tmpdir.join("similarity")))
+    game.backlog = [{"description": "Login page with password reset", "difficulty": None}]
+    assert game.suggestions(game.backlog[0]) == []
+    game.current_feature = game.backlog[0]
+    for player in game.players:
+        game.cast_vote(player, "5")
+    game.process_votes()
+    game.save_final_report(str(tmpdir.join("final_report.json")))
+    assert game.suggestions({"description": "Login page with password reset"})[0]["difficulty"] == 5
+
+
+# tests for sqlite_store.py
+
+
+## @brief Tests that games saved to sessions of a SQLite store are resumed and queried independently.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_sqlite_store_sessions(tmpdir):
+    store = SQLiteStore(str(tmpdir.join("poker.db")), batch_size=3)
+    for session_id, team, cards in (("a-1", "A", ("5", "5")), ("a-2", "A", ("13", "13")), ("b-1", "B", ("3", "3"))):
+        game = Game(num_players=2, rules="median", lazy=True)
+        game.players[0].pseudo, game.players[1].pseudo = "Alice", f"Bob-{team}"
+        game.backlog = [{"description": f"{session_id} login", "difficulty": None, "tags": ["ui"]},
+                        {"description": f"{session_id} export", "difficulty": None}]
+        game.use_store(store, session_id, team)
+        game.current_feature = game.next_feature()
+        for player, card in zip(game.players, cards):
+            game.cast_vote(player, card)
+        game.process_votes()
+        game.save_game_state()
+        if session_id != "b-1":
+            game.save_final_report()
+    assert store.sessions() == ["a-1", "a-2", "b-1"] and store.sessions("B") == ["b-1"]
+
+    resumed = Game.from_store(store, "b-1")
+    assert resumed.rules == "median"
+    assert [(task["description"], task["difficulty"]) for task in resumed.backlog] == [
+        ("b-1 login", 3), ("b-1 export", None)]
+    assert resumed.backlog[0]["tags"] == ["ui"] and resumed.next_feature()["description"] == "b-1 export"
+    assert store.load_report("a-2")[0] == {"id": 1, "description": "a-2 login", "difficulty": 13,
+                                           "validated": True, "rounds": 1}
+    assert store.difficulty_by_team(since=quarter_start()) == {"A": (2, 9), "B": (1, 3)}
+    assert [vote[3] for vote in store.player_votes("Alice")] == ["5", "13", "3"]
+    store.close()
+    with pytest.raises(FileNotFoundError):
+        Game.from_store(SQLiteStore(str(tmpdir.join("poker.db"))), "missing")
+
+
+# tests for storage.py
+
+
+## @brief Tests that the JSON file and in-memory storages behave the same, by session.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_storage_backends(tmpdir):
+    for store in (JsonFileStorage(str(tmpdir.join("data"))), MemoryStorage()):
+        with pytest.raises(FileNotFoundError):
+            store.load_backlog()
+        store.save_backlog([{"description": "A", "difficulty": None}])
+        for session_id in ("default", "team-a/sprint-1"):
+            assert not store.has_state(session_id)
+            game = Game(num_players=2, store=store)
+            game.use_store(store, session_id)
+            game.backlog[0]["difficulty"] = 3
+            game.save_game_state()
+            game.save_final_report()
+            assert Game.from_store(store, session_id).backlog == game.backlog
+            assert store.load_report(session_id) == game.backlog
+        assert store.load_backlog() == [{"description": "A", "difficulty": None}]
+    assert tmpdir.join("data", "sessions", "team-a%2Fsprint-1", "game_state.json").check()
+
+## @brief Tests that the vote history and the similarity index are kept in the directory of the storage.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_storage_data_dirs(tmpdir):
+    from main import use_data_dirs
+    store = JsonFileStorage(str(tmpdir.join("custom")))
+    game = Game(num_players=2, lazy=True, store=store)
+    use_data_dirs(game, store)
+    game.backlog = [{"description": "A", "difficulty": None}]
+    game.current_feature = game.backlog[0]
+    for player in game.players:
+        game.cast_vote(player, "5")
+    game.process_votes()
+    game.save_final_report()
+    assert tmpdir.join("custom", "history", "feature.bin").check()
+    assert tmpdir.join("custom", "similarity", "index.json").check()
+    for path, expected in ((str(tmpdir.join("db", "poker.db")), str(tmpdir.join("db", "history"))), (":memory:", None)):
+        database = SQLiteStore(path)
+        assert database.data_dir("history") == expected
+        database.close()
+    assert MemoryStorage().data_dir("history") is None
+
+
+## @brief Tests that a whole game played on the in-memory storage never touches the disk.
+#  @param tmpdir Temporary directory provided by pytest.
+#  @param monkeypatch Fixture used to run the test from the temporary directory.
+def test_memory_storage_game(tmpdir, monkeypatch, memory_storage):
+    monkeypatch.chdir(tmpdir)
+    memory_storage.save_backlog([{"description": "A", "difficulty": None}])
+    game = Game(num_players=2)
+    with patch("builtins.input", side_effect=["5", "5"]):
+        game.start_game()
+    assert memory_storage.load_report("default")[0]["difficulty"] == 5
+    assert memory_storage.load_state("default")["backlog"][0]["validated"] is True
+    assert tmpdir.listdir() == []
+
+
+# tests for pipeline.py
+
+
+## @brief Tests pipelined voting: a contested feature is requeued while the next ones are estimated.
+def test_pipelined_game():
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": name, "difficulty": None} for name in ("A", "B", "C")]
+    # Window [A, B]: A is contested and requeued behind C; then [C, A]
+    with patch("builtins.input", side_effect=["50", "3", "8", "5", "5", "8", "8", "5", "5"]):
+        game.start_game(window=2)
+    assert [(task["description"], task["difficulty"]) for task in game.backlog] == [("A", 5), ("B", 5), ("C", 8)]
+    assert game.history.rounds_to_consensus() == {1: 2, 2: 1, 3: 1}
+    assert game.all_validated() and game.report_summary.validated == 3
+
+
+## @brief Tests that an all-joker round stops a pipelined game and that loading it resumes its window.
+#  @param memory_storage The in-memory storage of the games.
+def test_pipelined_game_cafe_break(memory_storage):
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": name, "difficulty": None} for name in ("A", "B", "C")]
+    with patch("builtins.input", side_effect=["joker", "joker"]):
+        game.start_game(window=2)
+    assert not game.backlog_index.validated_count()
+
+    loaded = Game.from_store(memory_storage)
+    assert loaded.saved_pipeline["window"] == 2
+    # The window [B, C] is reopened, A waits behind them
+    with patch("builtins.input", side_effect=["5", "5", "8", "8", "3", "3"]):
+        loaded.start_game()
+    assert [(task["description"], task["difficulty"]) for task in loaded.backlog] == [("A", 3), ("B", 5), ("C", 8)]
+
+## @brief Tests a server session voting on a window of features in any order.
+def test_server_pipelined_session():
+    server = PlanningPokerServer()
+    backlog = [{"description": "A"}, {"description": "B"}, {"description": "C"}]
+    session = server.create_session("s1", ["alice", "bob"], "strict", backlog, window=2)
+    assert [feature["description"] for feature in session.describe()["open"]] == ["A", "B"]
+    session.vote("alice", "3", 1)
+    session.vote("bob", "8", 2)
+    result = session.vote("bob", "5", 1)[-1]
+    assert result["event"] == "result" and result["validated"] is False
+    assert [feature["id"] for feature in session.describe()["open"]] == [2, 3]
+    assert session.vote("alice", "8", 2)[-1]["difficulty"] == 8
+    with pytest.raises(ValueError):
+        session.vote("alice", "5", 2)  # B is closed
+    for feature_id, card in ((3, "2"), (1, "5")):
+        events = session.vote("alice", card, feature_id) + session.vote("bob", card, feature_id)
+    assert events[-1]["event"] == "finished"
+    assert [task["difficulty"] for task in events[-1]["report"]] == [5, 8, 2]
+
+## @brief Tests that the votes of an open window are journaled and reopened with the game.
+#  @param tmpdir Temporary directory provided by pytest.
+def test_pipeline_journal_recovery(tmpdir):
+    save_file = str(tmpdir.join("game_state.json"))
+    game = Game(num_players=2, rules="strict")
+    game.backlog = [{"description": name, "difficulty": None} for name in ("A", "B", "C")]
+    game.enable_journal(save_file, snapshot_every=100)
+    pipeline = VotingPipeline(game, 2)
+    pipeline.vote(game.players[0], 1, "5")
+    pipeline.vote(game.players[1], 1, "5")  # A is validated, C is opened
+    pipeline.vote(game.players[0], 2, "8")
+
+    # Crash without saving: the journal alone brings back the window
+    loaded = Game.from_state(save_file)
+    restored = VotingPipeline(loaded, 2, loaded.saved_pipeline)
+    assert [feature["description"] for feature in restored.features()] == ["B", "C"]
+    assert restored.waiting(2) == [loaded.players[1]] and restored.waiting(3) == loaded.players
+    assert restored.vote(loaded.players[1], 2, "8")["difficulty"] == 8
+    assert loaded.backlog[0]["difficulty"] == 5
+
+
+# tests for sketches.py
+
+
+## @brief Tests that merged shard sketches give the verdict of the exact rules.
+def test_vote_sketches_merge():
+    row = encode_votes(["5"] * 600 + ["8"] * 300 + ["3"] * 100 + ["joker"] * 50)
+    shards = [VoteSketch(k=50, seed=shard).add_row(row[shard::4]) for shard in range(4)]
+    merged = merge_sketches(VoteSketch.from_dict(json.loads(json.dumps(shard.to_dict()))) for shard in shards)
+    assert merged.total == len(row) and merged.quantiles.size < merged.quantiles.count
+    for rule in RULES:
+        assert merged.verdict(rule) == aggregate_votes([row], rule)[0]
+
+    # Free estimates: bounded rank error and conservative heavy hitters
+    sketch = QuantileSketch(k=100, seed=1)
+    for value in range(10000):
+        sketch.add((value * 7919) % 10000)
+    assert abs(sketch.quantile(0.5) - 5000) < 200
+    heavy = HeavyHitters(capacity=4)
+    for value in [1] * 60 + list(range(2, 42)):
+        heavy.add(value)
+    assert heavy.most_common()[0] == 1 and 60 - heavy.error <= heavy.estimate(1) <= 60
+
+
+## @brief Tests a game deciding rounds from sketches, locally and from shards.
+def test_game_approximate_aggregation():
+    game = Game(num_players=0, rules="median", lazy=True)
+    game.use_sketches(k=20)
+    feature = {"description": "A", "difficulty": None}
+    assert game.decide(feature, ["3", "5", "8", None], 1) == (5, True)
+    game.rules = "absolute_majority"
+    feature = {"description": "B", "difficulty": None}
+    shards = [game.sketch(["8"] * 30), game.sketch(["5"] * 20 + ["8"] * 10)]
+    assert game.decide_sketches(feature, shards, 1) == (8, True) and feature["difficulty"] == 8
+
+
+# tests for ingest.py
+
+
+## @brief Tests bulk ingestion of vote events: rounds decided by the rules, rejected events reported.
+def test_ingest_events(memory_storage, tmpdir):
+    memory_storage.save_backlog([{"description": "A", "difficulty": None}, {"description": "B", "difficulty": None}])
+    events = [
+        {"feature": 2, "player": "bob", "card": 8},
+        {"feature": 1, "player": "alice", "card": "3"},
+        {"feature": 1, "player": "alice", "card": "5", "ts": 10.0},  # Changes her card
+        {"feature": 1, "player": "bob", "card": "5"},
+        {"feature": 1, "player": "bob", "card": "5"},  # Feature 1 is validated
+        {"feature": 2, "player": "carol", "card": "8"},
+        {"feature": 2, "player": "alice", "card": "7"},
+        {"player": "alice", "card": "8"},
+    ]
+    lines = [json.dumps(event).encode() + b"\n" for event in events] + [b"\n", b"not json\n"]
+    rejected = str(tmpdir.join("rejected.jsonl"))
+    report = ingest_events([lines], memory_storage, "strict", players=["alice", "bob"], rejected_path=rejected)
+    assert (report.accepted, report.rounds, report.validated) == (4, 1, 1)
+    assert report.reasons == {"feature not open": 1, "unknown player": 1, "invalid card": 1,
+                              "missing feature": 1, "invalid JSON": 1}
+    with open(rejected) as file:
+        assert [json.loads(line)["line"] for line in file] == [5, 6, 7, 8, 10]
+
+    # The session is saved: a second stream resumes it; without players no session is created
+    events = [{"feature": "2", "player": name, "card": "8"} for name in ("alice", "bob")]
+    events.append({"session": "unknown", "feature": 2, "player": "alice", "card": "8"})
+    report = ingest_events([[json.dumps(event) for event in events]], memory_storage, "strict")
+    assert report.validated == 1 and report.reasons == {"unknown session": 1}
+    assert [task["difficulty"] for task in memory_storage.load_report("default")] == [5, 8]